@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from metrics import ADMISSION_WAIT_SECONDS, ADMISSION_SHED
+
+logger = logging.getLogger(__name__)
+
+# Classi di priorità delle richieste di scraping, in ordine di precedenza
+INTERACTIVE, BACKGROUND = "interactive", "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+
+class Overloaded(Exception):
+    """La coda della classe di priorità è piena: la richiesta va ripetuta dopo `retry_after` secondi."""
+
+    # Esito registrato da metrics.track_scrape
+    metrics_outcome = "shed"
+
+    def __init__(self, priority, retry_after):
+        super().__init__(f"coda {priority} piena, riprovare tra {retry_after} s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+def parse_priority(value, default):
+    return value if value in PRIORITIES else default
+
+
+class PriorityTicket:
+    """Priorità di uno scraping che più richieste possono condividere (vedi TTLCache).
+
+    Se una richiesta interattiva si unisce a uno scraping background, promote()
+    lo sposta nella coda interattiva finché attende uno slot di
+    PriorityAdmission; `started` diventa vero quando lo slot è ottenuto.
+    """
+
+    def __init__(self, priority):
+        self.priority = priority
+        self.started = False
+        self.promoted = asyncio.Event()
+        # (admission, waiter) mentre la richiesta è in coda
+        self._queued = None
+
+    def promote(self):
+        if self.priority == INTERACTIVE:
+            return
+        self.priority = INTERACTIVE
+        self.promoted.set()
+        if self._queued is not None:
+            admission, waiter = self._queued
+            admission._promote(waiter)
+
+
+def priority_class(priority):
+    """Classe di priorità di una stringa o di un PriorityTicket."""
+    return priority.priority if isinstance(priority, PriorityTicket) else priority
+
+
+class _ClassStats:
+    def __init__(self, history=500):
+        self.admitted = 0
+        self.shed = 0
+        self.max_wait = 0.0
+        self.waits = deque(maxlen=history)
+        # Media mobile della durata di uno scraping, per stimare Retry-After
+        self.service_seconds = 5.0
+
+    def record_wait(self, seconds):
+        self.admitted += 1
+        self.max_wait = max(self.max_wait, seconds)
+        self.waits.append(seconds)
+
+    def record_service(self, seconds):
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * seconds
+
+    def percentile(self, p):
+        if not self.waits:
+            return None
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class PriorityAdmission:
+    """Ammissione degli scraping con browser, con precedenza al traffico interattivo.
+
+    Al massimo `capacity` scraping contemporanei, di cui `reserved_interactive`
+    riservati alle richieste interattive: quelle in background ne usano al più
+    capacity - reserved_interactive. Quando uno slot si libera viene servita
+    prima la coda interattiva. Se la coda di una classe supera il proprio
+    limite la richiesta viene rifiutata subito con Overloaded.
+    """
+
+    def __init__(self, capacity, reserved_interactive, max_queue):
+        self.capacity = capacity
+        self.reserved_interactive = min(reserved_interactive, capacity - 1)
+        self.max_queue = max_queue
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+        self._stats = {priority: _ClassStats() for priority in PRIORITIES}
+
+    def _limit(self, priority):
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.reserved_interactive
+
+    def _can_start(self, priority):
+        return sum(self._running.values()) < self.capacity and self._running[priority] < self._limit(priority)
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                waiter = queue.popleft()
+                self._running[priority] += 1
+                # Classe dello slot assegnato, da restituire al rilascio
+                waiter.set_result(priority)
+
+    def _release(self, priority):
+        self._running[priority] -= 1
+        self._dispatch()
+
+    def _promote(self, waiter):
+        if waiter.done():
+            return
+        self._queues[BACKGROUND].remove(waiter)
+        self._queues[INTERACTIVE].append(waiter)
+        self._dispatch()
+
+    def retry_after(self, priority):
+        """Stima (in secondi) del tempo necessario a smaltire la coda della classe."""
+        stats = self._stats[priority]
+        waiting = len(self._queues[priority]) + 1
+        return min(60, max(1, math.ceil(waiting * stats.service_seconds / self._limit(priority))))
+
+    def check(self, priority):
+        """Solleva Overloaded se una nuova richiesta della classe verrebbe rifiutata."""
+        if len(self._queues[priority]) >= self.max_queue[priority]:
+            self._stats[priority].shed += 1
+            ADMISSION_SHED.labels(priority).inc()
+            raise Overloaded(priority, self.retry_after(priority))
+
+    @asynccontextmanager
+    async def slot(self, priority):
+        """Slot per la classe `priority`, una stringa o un PriorityTicket promuovibile in coda."""
+        ticket = priority if isinstance(priority, PriorityTicket) else PriorityTicket(priority)
+        priority = ticket.priority
+        start = time.monotonic()
+        # Si parte subito solo se nessuna richiesta di pari o maggiore priorità è in attesa
+        ahead = PRIORITIES[:PRIORITIES.index(priority) + 1]
+        if not any(self._queues[p] for p in ahead) and self._can_start(priority):
+            self._running[priority] += 1
+        else:
+            self.check(priority)
+            waiter = asyncio.get_running_loop().create_future()
+            self._queues[priority].append(waiter)
+            ticket._queued = (self, waiter)
+            try:
+                priority = await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Lo slot era già stato assegnato: va restituito
+                    self._release(waiter.result())
+                else:
+                    for queue in self._queues.values():
+                        if waiter in queue:
+                            queue.remove(waiter)
+                raise
+            finally:
+                ticket._queued = None
+        ticket.started = True
+
+        waited = time.monotonic() - start
+        self._stats[priority].record_wait(waited)
+        ADMISSION_WAIT_SECONDS.labels(priority).observe(waited)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._stats[priority].record_service(time.monotonic() - started)
+            self._release(priority)
+
+    def stats(self):
+        result = {"capacity": self.capacity, "reserved_interactive": self.reserved_interactive}
+        for priority in PRIORITIES:
+            stats = self._stats[priority]
+            p50, p95 = stats.percentile(50), stats.percentile(95)
+            result[priority] = {
+                "running": self._running[priority],
+                "queued": len(self._queues[priority]),
+                "max_queue": self.max_queue[priority],
+                "admitted": stats.admitted,
+                "shed": stats.shed,
+                "wait_p50_ms": round(p50 * 1000) if p50 is not None else None,
+                "wait_p95_ms": round(p95 * 1000) if p95 is not None else None,
+                "wait_max_ms": round(stats.max_wait * 1000),
+            }
+        return result
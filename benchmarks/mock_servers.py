@@ -0,0 +1,250 @@
+import json
+import multiprocessing
+import re
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+# Server locali usati dai benchmark: pagine fanSALE/ticketone salvate, Bot API
+# di Telegram e microservizio di scraping simulati. Ognuno gira in un processo
+# separato, per non pesare sulle misure del processo del benchmark.
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+# Data dei biglietti restituiti dal mock del microservizio (e dei tracker del benchmark)
+MOCK_TICKET_DAY = "12 giu 2026"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Header e corpo sono scritti separatamente: senza TCP_NODELAY ogni risposta attende l'ACK ritardato
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload, status=200):
+        self._send(status, json.dumps(payload), "application/json")
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+
+class FixtureHandler(_Handler):
+    """Pagine salvate di fanSALE e ticketone, con risorse statiche fittizie."""
+
+    ROUTES = (
+        ("/fansale/event", "fansale_search.html"),
+        ("/fansale/tickets/", "fansale_event.html"),
+        ("/ticketone/artist/", "ticketone_listing.html"),
+        ("/ticketone/", "ticketone_home.html"),
+    )
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path
+        query = next(iter(parse_qs(url.query).values()), [""])[0]
+        slug = re.sub(r"[^a-z0-9]+", "-", query.lower())
+        # Risposte dell'autocomplete, scaricate via XHR dalle pagine di ricerca
+        if path == "/fansale/suggest":
+            self._send_json({"suggestions": [
+                {"name": query, "type": "Evento", "url": f"/fansale/tickets/{slug}"},
+                {"name": f"{query} - Tour 2026", "type": "Evento", "url": f"/fansale/tickets/{slug}-tour"},
+                {"name": query, "type": "Artista", "url": f"/fansale/artist/{slug}"},
+                {"name": "Stadio Olimpico", "type": "Luogo", "url": "/fansale/venue/stadio-olimpico"},
+            ]})
+            return
+        if path == "/ticketone/api/suggest":
+            self._send_json({"results": [
+                {"title": query, "link": f"/ticketone/artist/{slug}/"},
+                {"title": f"{query} Tribute", "link": f"/ticketone/artist/{slug}-tribute/"},
+            ]})
+            return
+        if path.startswith("/static/"):
+            # Immagini e fogli di stile: contenuto vuoto, servono solo le richieste
+            self._send(200, b"", "application/octet-stream")
+            return
+        for prefix, fixture in self.ROUTES:
+            if path.startswith(prefix):
+                self._send(200, (FIXTURES_DIR / fixture).read_bytes(), "text/html; charset=utf-8")
+                return
+        self._send(404, "not found", "text/plain")
+
+
+class TelegramHandler(_Handler):
+    """Bot API di Telegram simulata: risponde a getMe e sendMessage e conta i messaggi.
+
+    Per la modalità webhook registra l'URL di setWebhook e inoltra al bot gli
+    update inviati in POST a /updates, con il secret token come Telegram;
+    GET /messages restituisce gli ultimi messaggi inviati dal bot.
+    """
+
+    latency = 0.0
+    sent = 0
+    chats = set()
+    webhook = {}
+    messages = deque(maxlen=1000)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/stats":
+            self._send_json({
+                "sent": TelegramHandler.sent,
+                "chats": len(TelegramHandler.chats),
+                "webhook_url": TelegramHandler.webhook.get("url", ""),
+            })
+        elif url.path == "/messages":
+            chat_id = parse_qs(url.query).get("chat_id", [None])[0]
+            self._send_json([
+                message for message in TelegramHandler.messages
+                if chat_id is None or str(message["chat_id"]) == chat_id
+            ])
+        else:
+            self._send(404, "not found", "text/plain")
+
+    def _forward_update(self, body):
+        url = TelegramHandler.webhook.get("url")
+        if not url:
+            self._send_json({"ok": False, "description": "Webhook non impostato"}, status=409)
+            return
+        request = urllib.request.Request(url, data=body, method="POST", headers={"Content-Type": "application/json"})
+        if TelegramHandler.webhook.get("secret_token"):
+            request.add_header("X-Telegram-Bot-Api-Secret-Token", TelegramHandler.webhook["secret_token"])
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except OSError as e:
+            self._send_json({"ok": False, "description": str(e)}, status=502)
+            return
+        self._send_json({"ok": 200 <= status < 300, "status": status})
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/updates":
+            self._forward_update(self._read_body())
+            return
+        # Percorso: /bot<token>/<metodo>
+        method = urlparse(self.path).path.rsplit("/", 1)[-1]
+        params = self._parse_params(self._read_body())
+        if self.latency:
+            time.sleep(self.latency)
+
+        if method == "getMe":
+            self._send_json({"ok": True, "result": {
+                "id": 1, "is_bot": True, "first_name": "Benchmark", "username": "benchmark_bot",
+            }})
+        elif method == "sendMessage":
+            chat_id = int(params.get("chat_id", 0))
+            TelegramHandler.sent += 1
+            TelegramHandler.chats.add(chat_id)
+            TelegramHandler.messages.append({"chat_id": chat_id, "text": params.get("text", "")})
+            self._send_json({"ok": True, "result": {
+                "message_id": TelegramHandler.sent,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }})
+        elif method == "setWebhook":
+            TelegramHandler.webhook = {"url": params.get("url", ""), "secret_token": params.get("secret_token")}
+            self._send_json({"ok": True, "result": True})
+        elif method == "deleteWebhook":
+            TelegramHandler.webhook = {}
+            self._send_json({"ok": True, "result": True})
+        elif method == "getWebhookInfo":
+            self._send_json({"ok": True, "result": {
+                "url": TelegramHandler.webhook.get("url", ""), "has_custom_certificate": False, "pending_update_count": 0,
+            }})
+        else:
+            self._send_json({"ok": True, "result": True})
+
+    def _parse_params(self, body):
+        content_type = self.headers.get("Content-Type", "")
+        if "application/json" in content_type:
+            return json.loads(body or b"{}")
+        return {key: values[0] for key, values in parse_qs(body.decode("utf-8")).items()}
+
+
+class ScraperHandler(_Handler):
+    """Microservizio di scraping simulato per il ciclo check_tickets del bot.
+
+    Ogni URL restituisce alcuni biglietti per MOCK_TICKET_DAY; i prezzi
+    cambiano a ogni richiesta, così ogni ciclo produce notifiche.
+    """
+
+    latency = 0.0
+    requests = {}
+
+    def _tickets(self, url):
+        count = ScraperHandler.requests.get(url, 0) + 1
+        ScraperHandler.requests[url] = count
+        return [
+            {"day": MOCK_TICKET_DAY, "location": "Stadio Olimpico, Roma", "price": f"€ {60 + count + i},00"}
+            for i in range(3)
+        ] + [{"day": "13 giu 2026", "location": "Stadio Olimpico, Roma", "price": "€ 58,00"}]
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        payload = json.loads(self._read_body() or b"{}")
+        if path == "/search_tickets_batch":
+            lines = []
+            for url in dict.fromkeys(payload.get("urls", [])):
+                if self.latency:
+                    time.sleep(self.latency)
+                lines.append(json.dumps({"url": url, "ticket_data": self._tickets(url), "engine": "mock", "elapsed_ms": 0}))
+            self._send(200, "".join(line + "\n" for line in lines), "application/x-ndjson")
+        elif path == "/search_tickets":
+            if self.latency:
+                time.sleep(self.latency)
+            self._send_json({"ticket_data": self._tickets(payload.get("url")), "engine": "mock", "elapsed_ms": 0})
+        else:
+            self._send(404, "not found", "text/plain")
+
+
+def _serve(handler, latency, ready):
+    handler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+class MockServer:
+    """Avvia un handler in un processo separato su una porta libera."""
+
+    def __init__(self, handler, latency=0.0):
+        self.handler = handler
+        self.latency = latency
+        self.process = None
+        self.port = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        ready = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=_serve, args=(self.handler, self.latency, ready), daemon=True)
+        self.process.start()
+        self.port = ready.get(timeout=10)
+        return self
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.join(timeout=5)
+            self.process = None
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import psutil
+
+from benchmarks.mock_servers import MockServer, FixtureHandler, TelegramHandler, ScraperHandler
+
+# python -m benchmarks.run --scenario all --trackers 10,1000,100000
+# Benchmark offline: nessuna richiesta verso fanSALE, ticketone o Telegram.
+
+SCRAPER_SCENARIOS = ("search_tickets", "search_artist", "write_to_searchbar_and_click_first_result")
+SCENARIOS = SCRAPER_SCENARIOS + ("check_tickets",)
+
+# Data salvata nei tracker del benchmark, come la salva il bot dai risultati di ticketone
+TRACKER_CONCERT_DATE = "ven 12 giugno 2026"
+
+
+class RssSampler:
+    """Campiona in background l'RSS del processo e dei suoi figli (es. Firefox), esclusi i mock."""
+
+    def __init__(self, exclude_pids, interval=0.05):
+        self.exclude_pids = set(exclude_pids)
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _measure(self):
+        process = psutil.Process()
+        total = 0
+        for p in [process] + process.children(recursive=True):
+            if p.pid in self.exclude_pids:
+                continue
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / (1024 * 1024)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_mb = max(self.peak_mb, self._measure())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak_mb = self._measure()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(scenario, size, operations, elapsed, latencies, rss, errors=0, **extra):
+    return {
+        "scenario": scenario,
+        "size": size,
+        "operations": operations,
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(operations / elapsed, 2) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        "peak_rss_mb": round(rss.peak_mb, 1),
+        **extra,
+    }
+
+
+async def run_concurrently(calls, concurrency):
+    """Esegue le coroutine con al massimo `concurrency` in parallelo; restituisce latenze ed errori."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def run(call):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call()
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(run(call) for call in calls))
+    return latencies, errors
+
+
+async def bench_scraper(scenario, args, rss_exclude):
+    import scraper_service
+
+    if scenario == "search_tickets":
+        calls = [
+            lambda i=i: scraper_service.scrape_tickets(f"{args.fixtures_url}/fansale/tickets/event-{i}")
+            for i in range(args.requests)
+        ]
+    elif scenario == "search_artist":
+        # Le funzioni di scraping vengono chiamate direttamente, senza la cache degli endpoint
+        calls = [lambda i=i: scraper_service.scrape_artist(f"Artista {i}") for i in range(args.requests)]
+    else:
+        calls = [lambda i=i: scraper_service.scrape_concert_list(f"Artista {i}") for i in range(args.requests)]
+
+    # Il browser serve sempre, tranne per search_tickets con engine http
+    needs_browser = scenario != "search_tickets" or args.engine != "http"
+    with RssSampler(rss_exclude) as rss:
+        await scraper_service.http_scraper.start()
+        if needs_browser:
+            await scraper_service.browser_pool.start()
+        try:
+            start = time.perf_counter()
+            latencies, errors = await run_concurrently(calls, args.concurrency)
+            elapsed = time.perf_counter() - start
+        finally:
+            if needs_browser:
+                await scraper_service.browser_pool.stop()
+            await scraper_service.http_scraper.stop()
+    return summarize(scenario, args.requests, len(latencies), elapsed, latencies, rss, errors)
+
+
+def _clear_tables(conn):
+    conn.execute('DELETE FROM listing_snapshots')
+    conn.execute('DELETE FROM subscriptions')
+    conn.execute('DELETE FROM events')
+
+
+async def bench_check_tickets(tracker_count, args, telegram, rss_exclude):
+    from telegram import Bot
+
+    import bot
+    import database
+    from polling_scheduler import AdaptiveScheduler
+
+    database.setup_database()
+    await database.db.run(_clear_tables)
+    rows = [
+        (user_id, f"Artista {(user_id - 1) // args.trackers_per_event}",
+         f"https://www.fansale.it/tickets/all/benchmark/{(user_id - 1) // args.trackers_per_event}", TRACKER_CONCERT_DATE)
+        for user_id in range(1, tracker_count + 1)
+    ]
+    await database.update_user_data_many(rows)
+    links = len({link for _, _, link, _ in rows})
+
+    # Latenza per link: confronto con lo snapshot e salvataggio di snapshot e notifiche
+    latencies = []
+    notify_trackers = bot.notify_trackers
+
+    async def timed_notify_trackers(*notify_args):
+        start = time.perf_counter()
+        try:
+            return await notify_trackers(*notify_args)
+        finally:
+            latencies.append(time.perf_counter() - start)
+
+    bot.notify_trackers = timed_notify_trackers
+    sent_before = httpx.get(f"{telegram.url}/stats").json()["sent"]
+    cycle_durations = []
+    delivery_durations = []
+    telegram_bot = Bot(token="123456:benchmark", base_url=f"{telegram.url}/bot")
+    try:
+        with RssSampler(rss_exclude) as rss:
+            async with telegram_bot:
+                context = SimpleNamespace(bot=telegram_bot)
+                await bot.scraper_client.start()
+                await bot.notification_dispatcher.start(telegram_bot)
+                for _ in range(args.cycles):
+                    # Scheduler nuovo a ogni ciclo: tutti gli eventi risultano da controllare
+                    bot.polling_scheduler = AdaptiveScheduler(
+                        float("inf"), bot.polling_scheduler.min_interval, bot.polling_scheduler.max_interval
+                    )
+                    start = time.perf_counter()
+                    await bot.check_tickets(context)
+                    cycle_durations.append(time.perf_counter() - start)
+                    # Consegna delle notifiche accodate dal ciclo, misurata a parte
+                    while (await bot.notification_dispatcher.stats())["pending"]:
+                        await asyncio.sleep(0.05)
+                    delivery_durations.append(time.perf_counter() - start - cycle_durations[-1])
+                await bot.notification_dispatcher.stop()
+                await bot.scraper_client.stop()
+    finally:
+        bot.notify_trackers = notify_trackers
+
+    elapsed = sum(cycle_durations)
+    return summarize(
+        "check_tickets", tracker_count, tracker_count * args.cycles, elapsed, latencies, rss,
+        errors=links * args.cycles - len(latencies),
+        links=links,
+        notifications_sent=httpx.get(f"{telegram.url}/stats").json()["sent"] - sent_before,
+        cycle_p50_seconds=round(percentile(cycle_durations, 50), 3),
+        cycle_max_seconds=round(max(cycle_durations), 3),
+        delivery_p50_seconds=round(percentile(delivery_durations, 50), 3),
+    )
+
+
+def print_result(result):
+    line = (
+        f"{result['scenario']:<45} size={result['size']:<7} ops={result['operations']:<7} "
+        f"err={result['errors']:<4} {result['throughput_per_second']}/s "
+        f"p50={result['p50_ms']} ms p99={result['p99_ms']} ms peak_rss={result['peak_rss_mb']} MB"
+    )
+    if "cycle_p50_seconds" in result:
+        line += f" cycle_p50={result['cycle_p50_seconds']} s delivery_p50={result['delivery_p50_seconds']} s notifications={result['notifications_sent']}"
+    print(line, flush=True)
+
+
+async def run_benchmarks(args, telegram, rss_exclude):
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+    for scenario in scenarios:
+        if scenario == "check_tickets":
+            for tracker_count in args.trackers:
+                results.append(await bench_check_tickets(tracker_count, args, telegram, rss_exclude))
+                print_result(results[-1])
+        else:
+            results.append(await bench_scraper(scenario, args, rss_exclude))
+            print_result(results[-1])
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark offline dello scraping e delle notifiche")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--trackers", default="10,1000,10000",
+                        help="numero di tracker per check_tickets, separati da virgola (es. 10,1000,100000)")
+    parser.add_argument("--trackers-per-event", type=int, default=10)
+    parser.add_argument("--cycles", type=int, default=3, help="cicli di check_tickets per numero di tracker")
+    parser.add_argument("--requests", type=int, default=50, help="richieste per gli scenari di scraping")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--engine", choices=("auto", "http", "browser"), default="auto")
+    parser.add_argument("--telegram-latency-ms", type=float, default=0)
+    parser.add_argument("--notify-rate", type=float, default=1000,
+                        help="messaggi al secondo del dispatcher (il limite reale di Telegram è ~30)")
+    parser.add_argument("--scraper-latency-ms", type=float, default=0)
+    parser.add_argument("--output", help="file JSON in cui salvare i risultati, per confrontare le versioni")
+    args = parser.parse_args()
+    args.trackers = [int(value) for value in args.trackers.split(",") if value]
+    return args
+
+
+def main():
+    args = parse_args()
+    fixtures = MockServer(FixtureHandler).start()
+    telegram = MockServer(TelegramHandler, args.telegram_latency_ms / 1000).start()
+    scraper = MockServer(ScraperHandler, args.scraper_latency_ms / 1000).start()
+    servers = (fixtures, telegram, scraper)
+    args.fixtures_url = fixtures.url
+    db_dir = tempfile.TemporaryDirectory()
+    try:
+        # La configurazione va impostata prima di importare bot e scraper_service
+        os.environ.update({
+            "FANSALE_SEARCH_URL": f"{fixtures.url}/fansale/event",
+            "TICKETONE_URL": f"{fixtures.url}/ticketone/",
+            "SCRAPE_ENGINE": args.engine,
+            "SCRAPER_API_URL": scraper.url,
+            "SCRAPER_API_KEY": "benchmark",
+            "SCRAPE_MODE": "http",
+            "DB_PATH": os.path.join(db_dir.name, "benchmark.db"),
+            "BOT_METRICS_PORT": "0",
+            "NOTIFY_GLOBAL_RATE": str(args.notify_rate),
+        })
+        results = asyncio.run(run_benchmarks(args, telegram, [s.process.pid for s in servers]))
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        for server in servers:
+            server.stop()
+        if "database" in sys.modules:
+            sys.modules["database"].close_database()
+        db_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
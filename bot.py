@@ -1,6 +1,9 @@
 import logging
 import asyncio
+import functools
+import json
 import httpx 
+import uvicorn
 from telegram import (
     Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 )
@@ -8,9 +11,38 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes, ConversationHandler
 )
 from database import (
-    setup_database, update_user_data, get_all_users, get_user_trackers, remove_tracker
+    setup_database, update_user_data, get_tracked_events, get_user_trackers, remove_tracker,
+    get_listing_snapshot, save_listing_snapshots, mark_events_checked, close_database, get_most_tracked_artists,
+    get_stream_offset, save_stream_offset, get_listing_subscribers
 )
-from config import TOKEN, API_KEY, SCRAPER_API_URL
+from change_detection import ListingDiff, diff_listings, apply_diff
+from ticket_matching import TicketIndex
+from config import (
+    TOKEN, API_KEY, SCRAPER_API_URL, CHECK_CONCURRENCY, CHECK_BATCH_SIZE, CHECK_BATCH_TIMEOUT,
+    SCHEDULER_TICK, SCRAPE_BUDGET_PER_MINUTE, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL,
+    SCRAPE_MODE, SCRAPE_QUEUE_BACKEND, SCRAPE_QUEUE_PATH, SCRAPE_QUEUE_VISIBILITY_TIMEOUT,
+    SCRAPE_QUEUE_MAX_ATTEMPTS, SCRAPE_QUEUE_RESULT_TIMEOUT, BOT_METRICS_PORT,
+    NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_CONCURRENCY, NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BACKOFF,
+    CONCERT_LIST_CACHE_TTL, CONCERT_LIST_CACHE_SIZE, PREFETCH_TOP_RESULTS, PREFETCH_CONCURRENCY,
+    WARM_TOP_ARTISTS, WARM_INTERVAL, SCRAPER_CONNECT_TIMEOUT, SCRAPER_TIMEOUT_SEARCH_ARTIST,
+    SCRAPER_TIMEOUT_CONCERT_LIST, SCRAPER_TIMEOUT_SEARCH_TICKETS, SCRAPER_TIMEOUT_BATCH, SCRAPER_RETRIES,
+    SCRAPER_RETRY_BACKOFF, SCRAPER_BREAKER_THRESHOLD, SCRAPER_BREAKER_RESET, SCRAPER_HTTP2,
+    CHECK_MODE, STREAM_SUBSCRIBER, STREAM_HEARTBEAT, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_LISTEN,
+    WEBHOOK_PORT, WEBHOOK_SECRET_TOKEN, WEBHOOK_MAX_CONNECTIONS, BOT_INSTANCE_ID, LEADER_LEASE_TTL,
+    LEADER_RENEW_INTERVAL, TELEGRAM_API_URL
+)
+from polling_scheduler import AdaptiveScheduler
+from scrape_queue import SEARCH_TICKETS, SEARCH_ARTIST, CONCERT_LIST, JobWaiter, create_queue
+from prometheus_client import start_http_server
+from metrics import CHECK_CYCLE_SECONDS, CHECK_TRACKERS_PROCESSED, CHECK_LINKS_PROCESSED
+from notifications import NotificationDispatcher
+from prefetch import ConcertListPrefetcher
+from scraper_client import ScraperClient, CircuitBreaker, CircuitOpen
+from admission import INTERACTIVE, BACKGROUND
+from listing_stream import ListingStreamConsumer
+from shared_state import SQLitePersistence, SharedStateApplication
+from leader_election import LeaderLease
+from webhook_server import create_webhook_app
 
 # Configurazione del logging
 logging.basicConfig(
@@ -25,12 +57,73 @@ MAIN_MENU, SEARCH_EVENT, ACTIVE_TRACKERS, REMOVE_TRACKER = range(4)
 
 MAX_TRACKERS = 1
 
+SCRAPER_UNAVAILABLE_MESSAGE = "Il servizio di ricerca non è al momento disponibile. Riprova tra qualche minuto."
+SCRAPER_BUSY_MESSAGE = "Il servizio di ricerca è molto occupato in questo momento. Riprova tra qualche secondo."
+
+# Un solo ciclo di controllo alla volta
+check_cycle_lock = asyncio.Lock()
+polling_scheduler = AdaptiveScheduler(SCRAPE_BUDGET_PER_MINUTE, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL)
+# Le notifiche vengono accodate dal ciclo di controllo e consegnate in background
+notification_dispatcher = NotificationDispatcher(
+    NOTIFY_GLOBAL_RATE, NOTIFY_CHAT_RATE, NOTIFY_CONCURRENCY, NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BACKOFF
+)
+
 def get_main_menu_keyboard():
     return ReplyKeyboardMarkup([['Cerca evento'], ['Tracker attivi'], ['Info']], resize_keyboard=True)
 
 def get_back_to_menu_button():
     return InlineKeyboardButton("Torna al Menu Principale \U0001F519", callback_data="back_to_menu")
 
+# In modalità "queue" le richieste diventano job eseguiti dai worker di scraping
+SCRAPE_JOB_KINDS = {
+    "search_artist": SEARCH_ARTIST,
+    "write_to_searchbar_and_click_first_result": CONCERT_LIST,
+    "search_tickets": SEARCH_TICKETS,
+}
+if SCRAPE_MODE == "queue" and SCRAPE_QUEUE_BACKEND == "memory":
+    # La coda in memoria non è condivisa con i processi scrape_worker: nessuno eseguirebbe i job
+    raise ValueError("SCRAPE_QUEUE_BACKEND=memory non è utilizzabile dal bot, usare sqlite")
+scrape_queue = (
+    create_queue(
+        SCRAPE_QUEUE_BACKEND,
+        SCRAPE_QUEUE_PATH,
+        visibility_timeout=SCRAPE_QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts=SCRAPE_QUEUE_MAX_ATTEMPTS,
+    )
+    if SCRAPE_MODE == "queue" else None
+)
+job_waiter = JobWaiter(scrape_queue) if scrape_queue is not None else None
+
+# Client HTTP condiviso, aperto e chiuso con l'Application
+scraper_client = ScraperClient(
+    SCRAPER_API_URL,
+    API_KEY,
+    connect_timeout=SCRAPER_CONNECT_TIMEOUT,
+    read_timeouts={
+        "search_artist": SCRAPER_TIMEOUT_SEARCH_ARTIST,
+        "write_to_searchbar_and_click_first_result": SCRAPER_TIMEOUT_CONCERT_LIST,
+        "search_tickets": SCRAPER_TIMEOUT_SEARCH_TICKETS,
+        "search_tickets_batch": SCRAPER_TIMEOUT_BATCH,
+    },
+    retries=SCRAPER_RETRIES,
+    retry_backoff=SCRAPER_RETRY_BACKOFF,
+    breaker=CircuitBreaker(SCRAPER_BREAKER_THRESHOLD, SCRAPER_BREAKER_RESET),
+    http2=SCRAPER_HTTP2,
+)
+
+async def call_scraper(endpoint, payload, priority=INTERACTIVE):
+    if scrape_queue is not None:
+        return await job_waiter.run(SCRAPE_JOB_KINDS[endpoint], {**payload, "priority": priority}, SCRAPE_QUEUE_RESULT_TIMEOUT)
+    return await scraper_client.post(endpoint, payload, priority)
+
+async def fetch_concert_list(search_text, priority):
+    return await call_scraper("write_to_searchbar_and_click_first_result", {"search_text": search_text}, priority)
+
+# Elenchi dei concerti caricati in anticipo per i primi risultati di ogni ricerca
+concert_prefetcher = ConcertListPrefetcher(
+    fetch_concert_list, CONCERT_LIST_CACHE_TTL, CONCERT_LIST_CACHE_SIZE, PREFETCH_CONCURRENCY
+)
+
 # Handler
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     await update.message.reply_text("Benvenuto! Scegli un'opzione:", reply_markup=get_main_menu_keyboard())
@@ -67,24 +160,18 @@ async def handle_selected_artist(update: Update, context: ContextTypes.DEFAULT_T
 
     link_fanSALE, full_name = chosen_result[2], chosen_result[0]
 
-    # Invia un messaggio di attesa all'utente
-    waiting_message = await update.callback_query.message.reply_text("Sto cercando i concerti, questo potrebbe richiedere alcuni secondi...")
+    # Invia un messaggio di attesa all'utente, se l'elenco non è già stato caricato in anticipo
+    waiting_message = None
+    if not concert_prefetcher.is_ready(full_name):
+        waiting_message = await update.callback_query.message.reply_text("Sto cercando i concerti, questo potrebbe richiedere alcuni secondi...")
 
     try:
-        timeout = httpx.Timeout(15.0, read=30.0)
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            headers = {"x-api-key": API_KEY}
-            response = await client.post(
-                f"{SCRAPER_API_URL}/write_to_searchbar_and_click_first_result",
-                json={"search_text": full_name},
-                headers=headers,
-            )
-            response.raise_for_status()
-            data = response.json()
-            concert_list = data.get("concert_list", [])
+        data = await concert_prefetcher.get(full_name)
+        concert_list = data.get("concert_list", [])
 
         # Rimuovi il messaggio di attesa
-        await waiting_message.delete()
+        if waiting_message:
+            await waiting_message.delete()
 
         if not concert_list:
             await update.callback_query.edit_message_text("Non sono stati trovati concerti per l'artista selezionato.")
@@ -100,14 +187,24 @@ async def handle_selected_artist(update: Update, context: ContextTypes.DEFAULT_T
 
         await update.callback_query.edit_message_text("Seleziona un concerto disponibile:", reply_markup=reply_markup)
 
+    except CircuitOpen:
+        if waiting_message:
+            await waiting_message.delete()
+        await update.callback_query.edit_message_text(SCRAPER_UNAVAILABLE_MESSAGE)
+        return MAIN_MENU
     except httpx.HTTPStatusError as http_err:
         logger.error(f"HTTP error occurred: {http_err}")
-        await waiting_message.delete()
-        await update.callback_query.edit_message_text("Si è verificato un errore durante la ricerca dei concerti. Riprova")
+        if waiting_message:
+            await waiting_message.delete()
+        if http_err.response.status_code == 503:
+            await update.callback_query.edit_message_text(SCRAPER_BUSY_MESSAGE)
+        else:
+            await update.callback_query.edit_message_text("Si è verificato un errore durante la ricerca dei concerti. Riprova")
         return MAIN_MENU
     except Exception as e:
         logger.error(f"Errore durante la gestione dell'artista selezionato: {e}")
-        await waiting_message.delete()
+        if waiting_message:
+            await waiting_message.delete()
         await update.callback_query.edit_message_text("Si è verificato un errore durante la ricerca dei concerti. Riprova")
         return MAIN_MENU
 
@@ -143,7 +240,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         user_id = update.effective_user.id
 
         # Verifica il numero di tracker attivi per l'utente
-        trackers = get_user_trackers(user_id)
+        trackers = await get_user_trackers(user_id)
         if len(trackers) >= MAX_TRACKERS:
             await query.edit_message_text(
                 f"Hai già {MAX_TRACKERS} tracker {'attivo' if MAX_TRACKERS == 1 else 'attivi'}. Per favore, rimuovi {'il tracker' if MAX_TRACKERS == 1 else 'un tracker'} prima di aggiungerne uno nuovo."
@@ -153,7 +250,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             return MAIN_MENU
 
         # Aggiungi il nuovo tracker
-        update_user_data(user_id, artist_name, link_fanSALE, selected_concert_date)
+        await update_user_data(user_id, artist_name, link_fanSALE, selected_concert_date)
 
         await query.edit_message_text(
             "La tua ricerca è stata salvata. Ti avviseremo quando ci saranno nuovi biglietti disponibili."
@@ -173,18 +270,11 @@ async def search_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
     waiting_message = await update.message.reply_text("Sto cercando gli eventi, l'operazione potrebbe richiedere alcuni secondi...")
 
     try:
-        timeout = httpx.Timeout(15.0, read=30.0)  # Timeout di 10 secondi per la connessione, 20 secondi per la lettura
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            headers = {"x-api-key": API_KEY}
-            response = await client.post(
-                f"{SCRAPER_API_URL}/search_artist",
-                json={"artist_name": artist_name},
-                headers=headers
-            )
-            response.raise_for_status()
-            data = response.json()
-            results_list = data.get("results_list", [])
-            context.user_data['results_list'] = results_list
+        data = await call_scraper("search_artist", {"artist_name": artist_name})
+        results_list = data.get("results_list", [])
+        context.user_data['results_list'] = results_list
+        # Gli elenchi dei concerti dei primi risultati si caricano mentre l'utente sceglie
+        concert_prefetcher.prefetch([result_name for result_name, _, _ in results_list[:PREFETCH_TOP_RESULTS]])
 
         # Rimuovi il messaggio di attesa
         await waiting_message.delete()
@@ -203,10 +293,17 @@ async def search_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
         return MAIN_MENU
 
+    except CircuitOpen:
+        await waiting_message.delete()
+        await update.message.reply_text(SCRAPER_UNAVAILABLE_MESSAGE)
+        return MAIN_MENU
     except httpx.HTTPStatusError as http_err:
         logger.error(f"HTTP error occurred: {http_err}")
         await waiting_message.delete()
-        await update.message.reply_text("Si è verificato un errore durante la ricerca dell'artista. Riprova")
+        if http_err.response.status_code == 503:
+            await update.message.reply_text(SCRAPER_BUSY_MESSAGE)
+        else:
+            await update.message.reply_text("Si è verificato un errore durante la ricerca dell'artista. Riprova")
         return MAIN_MENU
     except Exception as e:
         logger.error(f"Errore durante la ricerca dell'artista: {e}")
@@ -216,7 +313,7 @@ async def search_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> in
 
 async def show_active_trackers(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
-    trackers = get_user_trackers(user_id)
+    trackers = await get_user_trackers(user_id)
 
     if not trackers:
         await update.message.reply_text("Non hai tracker attivi.", reply_markup=get_main_menu_keyboard())
@@ -245,11 +342,11 @@ async def remove_tracker_handler(update: Update, context: ContextTypes.DEFAULT_T
             artist_name = artist_part.strip()
             concert_date = date_part.strip()
             user_id = update.effective_user.id
-            trackers = get_user_trackers(user_id)
+            trackers = await get_user_trackers(user_id)
 
             for db_artist_name, link_fansale, db_concert_date in trackers:
                 if db_artist_name == artist_name and db_concert_date == concert_date:
-                    remove_tracker(user_id, link_fansale, concert_date)
+                    await remove_tracker(user_id, link_fansale, concert_date)
                     await update.message.reply_text(f"Tracker per {artist_name} - concerto del {concert_date} rimosso.")
                     return await show_active_trackers(update, context)
 
@@ -266,57 +363,293 @@ async def remove_tracker_handler(update: Update, context: ContextTypes.DEFAULT_T
     return REMOVE_TRACKER
 
 # Job per controllare i biglietti
+def format_listing_changes(artist_name, concert_date, diff):
+    message = f"Novità sui biglietti per {artist_name} - concerto del {concert_date}:\n"
+    for ticket in diff.new:
+        message += f"Nuovo: {ticket.get('location', 'N/A')}, Prezzo: {ticket.get('price', 'N/A')}\n"
+    for old, ticket in diff.price_changed:
+        message += (
+            f"Prezzo cambiato: {ticket.get('location', 'N/A')}, "
+            f"{old.get('price', 'N/A')} \u2192 {ticket.get('price', 'N/A')}\n"
+        )
+    if diff.removed:
+        message += f"Biglietti non più disponibili: {len(diff.removed)}\n"
+    return message
+
+async def notify_trackers(context, link_fanSALE, tickets, trackers):
+    # Il match e il confronto con l'ultimo snapshot si fanno una volta per data,
+    # su un indice dei biglietti costruito una sola volta per pagina
+    ticket_index = TicketIndex(tickets)
+    trackers_by_date = {}
+    for user_id, artist_name, selected_concert_date in trackers:
+        trackers_by_date.setdefault(selected_concert_date, []).append((user_id, artist_name))
+
+    diffs = []
+    for selected_concert_date, subscribers in trackers_by_date.items():
+        try:
+            matched_tickets = ticket_index.match(selected_concert_date)
+            previous_tickets = await get_listing_snapshot(link_fanSALE, selected_concert_date)
+            diffs.append((selected_concert_date, subscribers, matched_tickets, diff_listings(previous_tickets, matched_tickets)))
+        except Exception as e:
+            logger.error(f"Errore durante il confronto dei biglietti per {link_fanSALE} ({selected_concert_date}): {str(e)}")
+
+    changed = False
+    notifications = []
+    for selected_concert_date, subscribers, _, diff in diffs:
+        changed = changed or bool(diff.has_updates or diff.removed)
+        if not diff.has_updates:
+            continue
+        for user_id, artist_name in subscribers:
+            notifications.append((user_id, format_listing_changes(artist_name, selected_concert_date, diff)))
+
+    # Snapshot e notifiche del link vengono salvati in un'unica transazione:
+    # l'invio avviene nel dispatcher, senza bloccare lo scraping
+    await save_listing_snapshots([
+        (link_fanSALE, selected_concert_date, matched_tickets)
+        for selected_concert_date, _, matched_tickets, _ in diffs
+    ], notifications)
+    if notifications:
+        notification_dispatcher.wake()
+    return changed
+
+async def check_batch(context, batch, checked):
+    # Un'unica chiamata per tutto il batch: i risultati arrivano in streaming, un URL per riga
+    async with scraper_client.stream("search_tickets_batch", {"urls": list(batch)}, BACKGROUND) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            link_fanSALE = result.get("url")
+            if link_fanSALE not in batch:
+                continue
+            if "error" in result:
+                logger.error(f"Errore durante lo scraping di {link_fanSALE}: {result['error']}")
+                continue
+
+            tickets = result.get("ticket_data", [])
+            if not isinstance(tickets, list):
+                logger.warning(f"Formato dei biglietti inatteso per {link_fanSALE}: {tickets}")
+                continue
+
+            checked[link_fanSALE] = await notify_trackers(context, link_fanSALE, tickets, batch[link_fanSALE])
+
+async def check_batch_bounded(semaphore, context, batch, checked):
+    async with semaphore:
+        try:
+            # Il timeout per batch evita che un batch bloccato fermi il ciclo
+            await asyncio.wait_for(
+                check_batch(context, batch, checked),
+                timeout=CHECK_BATCH_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout durante il controllo di un batch di {len(batch)} link")
+        except CircuitOpen:
+            logger.warning(f"Microservizio di scraping non disponibile, batch di {len(batch)} link saltato")
+        except httpx.HTTPStatusError as http_err:
+            logger.error(f"HTTP error per un batch di {len(batch)} link: {http_err}")
+        except Exception as e:
+            logger.error(f"Errore durante il controllo di un batch di {len(batch)} link: {str(e)}")
+
+async def check_links_via_batches(context, trackers_by_link, checked):
+    links = list(trackers_by_link)
+    batches = [
+        {link_fanSALE: trackers_by_link[link_fanSALE] for link_fanSALE in links[i:i + CHECK_BATCH_SIZE]}
+        for i in range(0, len(links), CHECK_BATCH_SIZE)
+    ]
+    semaphore = asyncio.Semaphore(CHECK_CONCURRENCY)
+    await asyncio.gather(*(
+        check_batch_bounded(semaphore, context, batch, checked)
+        for batch in batches
+    ))
+
+async def check_link_via_queue(semaphore, context, link_fanSALE, trackers, checked):
+    async with semaphore:
+        try:
+            result = await job_waiter.run(SEARCH_TICKETS, {"url": link_fanSALE}, CHECK_BATCH_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Errore durante lo scraping di {link_fanSALE}: {str(e)}")
+            return
+
+    tickets = result.get("ticket_data", [])
+    if not isinstance(tickets, list):
+        logger.warning(f"Formato dei biglietti inatteso per {link_fanSALE}: {tickets}")
+        return
+    checked[link_fanSALE] = await notify_trackers(context, link_fanSALE, tickets, trackers)
+
+async def check_links_via_queue(context, trackers_by_link, checked):
+    # Un job per link: i worker in ascolto sulla coda si dividono il lavoro.
+    # In coda ci sono al massimo tanti link quanti ne elaborano i batch in parallelo
+    semaphore = asyncio.Semaphore(CHECK_CONCURRENCY * CHECK_BATCH_SIZE)
+    await asyncio.gather(*(
+        check_link_via_queue(semaphore, context, link_fanSALE, trackers, checked)
+        for link_fanSALE, trackers in trackers_by_link.items()
+    ))
+
 async def check_tickets(context: ContextTypes.DEFAULT_TYPE):
-    users = get_all_users()
-    timeout = httpx.Timeout(15.0, read=30.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        headers = {"x-api-key": API_KEY}
-        for user_id, artist_name, link_fanSALE, selected_concert_date in users:
-            try:
-                # Chiamata al microservizio per cercare i biglietti
-                response = await client.post(
-                    f"{SCRAPER_API_URL}/search_tickets",
-                    json={"url": link_fanSALE},
-                    headers=headers
-                )
-                response.raise_for_status()
-                data = response.json()
-                tickets = data.get("ticket_data", [])
-
-                if not isinstance(tickets, list):
-                    logger.warning(f"Formato dei biglietti inatteso per l'utente {user_id}: {tickets}")
-                    continue
-
-                # Chiamata al microservizio per fare il match
-                match_response = await client.post(
-                    f"{SCRAPER_API_URL}/match_tickets",
-                    json={"tickets": tickets, "user_ticket": selected_concert_date},
-                    headers=headers
+    if check_cycle_lock.locked():
+        logger.warning("Il ciclo di controllo precedente è ancora in corso, salto questo ciclo")
+        return
+
+    async with check_cycle_lock:
+        with CHECK_CYCLE_SECONDS.time():
+            # Un solo link per evento; lo scheduler sceglie quali eventi sono da controllare ora
+            tracked_events = await get_tracked_events()
+            polling_scheduler.sync(tracked_events)
+            links = polling_scheduler.pop_due()
+            trackers_by_link = {link_fanSALE: tracked_events[link_fanSALE] for link_fanSALE in links}
+            tracker_count = sum(len(trackers) for trackers in trackers_by_link.values())
+            checked = {}
+            if scrape_queue is not None:
+                await check_links_via_queue(context, trackers_by_link, checked)
+            else:
+                await check_links_via_batches(context, trackers_by_link, checked)
+
+            CHECK_TRACKERS_PROCESSED.inc(tracker_count)
+            CHECK_LINKS_PROCESSED.labels("success").inc(len(checked))
+            CHECK_LINKS_PROCESSED.labels("failure").inc(len(links) - len(checked))
+
+            # Anche i link falliti vengono riprogrammati
+            for link_fanSALE in links:
+                polling_scheduler.record_result(link_fanSALE, checked.get(link_fanSALE, False))
+            await mark_events_checked(checked)
+
+            if links:
+                saved_scrapes = tracker_count - len(trackers_by_link)
+                logger.info(
+                    f"Controllo biglietti completato: {tracker_count} tracker, {len(trackers_by_link)} link distinti, "
+                    f"{saved_scrapes} scraping risparmiati"
                 )
-                match_response.raise_for_status()
-                match_data = match_response.json()
-                matched_tickets = match_data.get("matched_tickets", [])
+            logger.debug(f"Scheduler: {polling_scheduler.stats()}")
+            logger.debug(f"Notifiche: {await notification_dispatcher.stats()}")
+            logger.debug(f"Client del microservizio: {scraper_client.stats()}")
+            if job_waiter is not None:
+                logger.debug(f"Job in attesa: {job_waiter.stats()}")
+
+# Modalità stream: il microservizio monitora gli elenchi e invia solo le modifiche
+async def apply_listing_event(event):
+    link_fanSALE, concert_date = event["url"], event["concert_date"]
+    previous_tickets = await get_listing_snapshot(link_fanSALE, concert_date)
+    if event["kind"] == "initial":
+        # Elenco completo (primo controllo o resync): confronto con l'ultimo snapshot del bot
+        tickets = event["tickets"]
+        diff = diff_listings(previous_tickets, tickets)
+    else:
+        diff = ListingDiff(
+            new=event["new"],
+            removed=event["removed"],
+            price_changed=[(old, ticket) for old, ticket in event["price_changed"]],
+        )
+        tickets = apply_diff(previous_tickets, diff)
 
-                if matched_tickets:
-                    message = f"Nuovi biglietti disponibili per {artist_name} - concerto del {selected_concert_date}:\n"
+    notifications = []
+    if diff.has_updates:
+        notifications = [
+            (user_id, format_listing_changes(artist_name, concert_date, diff))
+            for user_id, artist_name in await get_listing_subscribers(link_fanSALE, concert_date)
+        ]
+    # L'offset dell'evento viene salvato con snapshot e notifiche: dopo un riavvio lo stream riprende da qui
+    await save_listing_snapshots(
+        [(link_fanSALE, concert_date, tickets)], notifications, (STREAM_SUBSCRIBER, event["offset"])
+    )
+    if notifications:
+        notification_dispatcher.wake()
+
+listing_stream = ListingStreamConsumer(
+    scraper_client,
+    STREAM_SUBSCRIBER,
+    load_offset=lambda: get_stream_offset(STREAM_SUBSCRIBER),
+    save_offset=lambda offset: save_stream_offset(STREAM_SUBSCRIBER, offset),
+    handle_event=apply_listing_event,
+    read_timeout=STREAM_HEARTBEAT * 3,
+)
 
-                    for ticket in matched_tickets:
-                        message += f"Luogo: {ticket.get('location', 'N/A')}, Prezzo: {ticket.get('price', 'N/A')}\n"
+async def sync_listing_watches(context: ContextTypes.DEFAULT_TYPE):
+    tracked_events = await get_tracked_events()
+    watches = [
+        (link_fanSALE, concert_date)
+        for link_fanSALE, trackers in tracked_events.items()
+        for _, _, concert_date in trackers
+    ]
+    try:
+        await listing_stream.sync(watches)
+    except Exception as e:
+        logger.error(f"Errore durante l'aggiornamento della sottoscrizione: {e}")
+    logger.debug(f"Stream delle modifiche: {listing_stream.stats()}")
+    logger.debug(f"Notifiche: {await notification_dispatcher.stats()}")
+
+async def warm_concert_lists(context: ContextTypes.DEFAULT_TYPE):
+    artist_names = await get_most_tracked_artists(WARM_TOP_ARTISTS)
+    await concert_prefetcher.warm(artist_names)
+    logger.info(f"Prefetch degli elenchi dei concerti: {concert_prefetcher.stats()}")
+
+# In modalità webhook i job in background girano solo sull'istanza che detiene il lease
+leader_lease = None
+
+def leader_only(callback):
+    @functools.wraps(callback)
+    async def job(context: ContextTypes.DEFAULT_TYPE):
+        if leader_lease is None or leader_lease.is_leader:
+            await callback(context)
+    return job
+
+async def start_background_tasks(application: Application):
+    await notification_dispatcher.start(application.bot)
+    if CHECK_MODE == "stream":
+        await listing_stream.start()
+
+async def stop_background_tasks():
+    await listing_stream.stop()
+    await notification_dispatcher.stop()
+
+async def on_startup(application: Application):
+    await scraper_client.start()
+    if leader_lease is None:
+        await start_background_tasks(application)
+        return
+    await application.bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET_TOKEN or None,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        allowed_updates=Update.ALL_TYPES,
+    )
+    await leader_lease.start()
 
-                    await context.bot.send_message(chat_id=user_id, text=message)
-            except httpx.HTTPStatusError as http_err:
-                logger.error(f"HTTP error per l'utente {user_id}: {http_err}")
-            except Exception as e:
-                logger.error(f"Errore durante il processamento dei biglietti per l'utente {user_id}: {str(e)}")
+async def on_shutdown(application: Application):
+    if leader_lease is not None:
+        await leader_lease.stop()
+    await stop_background_tasks()
+    await concert_prefetcher.stop()
+    await scraper_client.stop()
+    close_database()
 
 # Error handler
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE):
     logger.error(f"Update {update} caused error {context.error}")
 
 def main():
+    global leader_lease
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        # set_webhook con un URL vuoto registrerebbe un webhook inutilizzabile senza errori
+        raise ValueError("BOT_MODE=webhook richiede WEBHOOK_URL, l'URL pubblico a cui Telegram invia gli update")
     logger.info('Starting bot...')
     setup_database()
-    app = Application.builder().token(TOKEN).build()
+    if BOT_METRICS_PORT:
+        # Endpoint /metrics per Prometheus su una porta dedicata
+        start_http_server(BOT_METRICS_PORT)
+    builder = Application.builder().token(TOKEN).post_init(on_startup).post_shutdown(on_shutdown)
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+    webhook = BOT_MODE == "webhook"
+    if webhook:
+        # Più istanze: stato delle conversazioni e user_data nel database, update ricevuti dal server webhook
+        builder = builder.application_class(SharedStateApplication).persistence(SQLitePersistence()).updater(None)
+    app = builder.build()
+    if webhook:
+        leader_lease = LeaderLease(
+            "background_jobs", BOT_INSTANCE_ID, LEADER_LEASE_TTL, LEADER_RENEW_INTERVAL,
+            on_elected=lambda: start_background_tasks(app),
+            on_demoted=stop_background_tasks,
+        )
 
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('start', start)],
@@ -330,18 +663,30 @@ def main():
             REMOVE_TRACKER: [MessageHandler(filters.TEXT & ~filters.COMMAND, remove_tracker_handler)],
         },
         fallbacks=[CommandHandler('start', start)],
+        name="main_conversation",
+        persistent=webhook,
     )
 
     app.add_handler(conv_handler)
     app.add_handler(CallbackQueryHandler(button_handler))
     app.add_error_handler(error_handler)
 
-    # Job queue per controllare i biglietti ogni 30 minuti
     job_queue = app.job_queue
-    job_queue.run_repeating(check_tickets, interval=1800, first=15)
-
-    logger.info("Polling...")
-    app.run_polling()
+    if CHECK_MODE == "stream":
+        # Il microservizio controlla gli elenchi: il bot aggiorna solo l'insieme delle coppie seguite
+        job_queue.run_repeating(leader_only(sync_listing_watches), interval=SCHEDULER_TICK, first=5)
+    else:
+        # Job queue: a ogni tick lo scheduler adattivo seleziona gli eventi da controllare
+        job_queue.run_repeating(leader_only(check_tickets), interval=SCHEDULER_TICK, first=15)
+    job_queue.run_repeating(leader_only(warm_concert_lists), interval=WARM_INTERVAL, first=60)
+
+    if webhook:
+        logger.info(f"Webhook su {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH} (istanza {BOT_INSTANCE_ID})")
+        webhook_app = create_webhook_app(app, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, leader_lease.stats)
+        uvicorn.run(webhook_app, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT)
+    else:
+        logger.info("Polling...")
+        app.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+from metrics import BROWSER_LAUNCH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class _PooledBrowser:
+    def __init__(self, browser, index):
+        self.browser = browser
+        self.index = index
+        self.uses = 0
+        self.active_pages = 0
+        self.crashed = False
+        browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, _browser):
+        self.crashed = True
+
+    @property
+    def healthy(self):
+        return not self.crashed and self.browser.is_connected()
+
+
+class _LaunchingBrowser:
+    """Segnaposto di uno slot mentre il suo browser viene riavviato."""
+
+    def __init__(self, index):
+        self.index = index
+        self.ready = asyncio.get_running_loop().create_future()
+        # L'errore di avvio va letto anche se nessuno è rimasto in attesa
+        self.ready.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+class BrowserPool:
+    """Pool di browser Firefox condivisi, avviato e chiuso insieme all'app FastAPI.
+
+    Ogni richiesta riceve un browser context isolato; il numero di pagine
+    aperte contemporaneamente è limitato da `max_pages`. I browser vengono
+    riavviati dopo `max_uses` utilizzi o quando si disconnettono (crash).
+    """
+
+    def __init__(self, size=2, max_pages=4, max_uses=100, headless=True):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_uses = max_uses
+        self.headless = headless
+        self._playwright = None
+        self._browsers = []
+        self._semaphore = asyncio.Semaphore(max_pages)
+        self._launches = set()
+        self._waiting = 0
+        self._in_use = 0
+        self._recycled = 0
+        self._crashes = 0
+        self._next = 0
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        for index in range(self.size):
+            self._browsers.append(await self._launch(index))
+        logger.info(f"Browser pool avviato con {self.size} browser, max {self.max_pages} pagine")
+
+    async def stop(self):
+        await asyncio.gather(*self._launches, return_exceptions=True)
+        for pooled in self._browsers:
+            if isinstance(pooled, _PooledBrowser):
+                await self._close(pooled)
+        self._browsers = []
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Browser pool chiuso")
+
+    async def _launch(self, index):
+        with BROWSER_LAUNCH_SECONDS.time():
+            browser = await self._playwright.firefox.launch(headless=self.headless)
+        return _PooledBrowser(browser, index)
+
+    async def _close(self, pooled):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Errore durante la chiusura del browser {pooled.index}: {e}")
+
+    async def _acquire_browser(self):
+        # Round-robin tra i browser, sostituendo quelli crashati o esauriti. La scelta
+        # dello slot non contiene await: l'avvio del sostituto (secondi) avviene in un
+        # task e blocca solo chi ha scelto quello slot, non le richieste sugli altri
+        slot = self._browsers[self._next % self.size]
+        self._next += 1
+        if isinstance(slot, _PooledBrowser):
+            if not slot.healthy:
+                self._crashes += 1
+                logger.warning(f"Browser {slot.index} non disponibile, riavvio in corso")
+                slot = self._start_replacement(slot, close=False)
+            elif slot.uses >= self.max_uses and slot.active_pages == 0:
+                self._recycled += 1
+                logger.info(f"Browser {slot.index} riciclato dopo {slot.uses} utilizzi")
+                slot = self._start_replacement(slot, close=True)
+        pooled = slot if isinstance(slot, _PooledBrowser) else await asyncio.shield(slot.ready)
+        pooled.uses += 1
+        pooled.active_pages += 1
+        return pooled
+
+    def _start_replacement(self, pooled, close):
+        placeholder = _LaunchingBrowser(pooled.index)
+        self._browsers[pooled.index] = placeholder
+        task = asyncio.create_task(self._replace(pooled, placeholder, close))
+        self._launches.add(task)
+        task.add_done_callback(self._launches.discard)
+        return placeholder
+
+    async def _replace(self, pooled, placeholder, close):
+        if close:
+            await self._close(pooled)
+        try:
+            replacement = await self._launch(pooled.index)
+        except Exception as e:
+            logger.error(f"Riavvio del browser {pooled.index} non riuscito: {e}")
+            # Lo slot torna al browser precedente (non sano): il prossimo acquire ritenta
+            self._browsers[pooled.index] = pooled
+            placeholder.ready.set_exception(e)
+            return
+        self._browsers[pooled.index] = replacement
+        placeholder.ready.set_result(replacement)
+
+    @asynccontextmanager
+    async def page(self, **context_options):
+        """Restituisce una pagina in un browser context dedicato alla richiesta."""
+        self._waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_use += 1
+        pooled = None
+        context = None
+        try:
+            pooled = await self._acquire_browser()
+            context = await pooled.browser.new_context(**context_options)
+            page = await context.new_page()
+            yield page
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Errore durante la chiusura del context: {e}")
+            if pooled is not None:
+                pooled.active_pages -= 1
+            self._in_use -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "pool_size": self.size,
+            "max_pages": self.max_pages,
+            "pages_in_use": self._in_use,
+            "queue_depth": self._waiting,
+            "browsers": [
+                {"index": b.index, "uses": b.uses, "active_pages": b.active_pages, "healthy": b.healthy}
+                if isinstance(b, _PooledBrowser) else {"index": b.index, "launching": True}
+                for b in self._browsers
+            ],
+            "recycled": self._recycled,
+            "crashes": self._crashes,
+        }
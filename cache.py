@@ -0,0 +1,98 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from admission import INTERACTIVE, PriorityTicket, priority_class
+
+
+class TTLCache:
+    """Cache in memoria con scadenza (TTL), eviction LRU e richieste single-flight.
+
+    Richieste concorrenti con la stessa chiave condividono un'unica
+    esecuzione di `compute`; gli errori non vengono messi in cache. Una
+    richiesta interactive che si unisce a un calcolo avviato con un
+    PriorityTicket background lo promuove, così non resta in coda dietro
+    altri controlli e lo scraping non viene ripetuto.
+    """
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.promoted = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(self, key, compute, priority=None):
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            task, running = inflight
+            if (priority_class(priority) == INTERACTIVE and isinstance(running, PriorityTicket)
+                    and running.priority != INTERACTIVE):
+                running.promote()
+                self.promoted += 1
+        else:
+            self.misses += 1
+            task = self._start(key, compute, priority)
+        # shield: se un client si disconnette, gli altri in attesa ricevono comunque il risultato
+        return await asyncio.shield(task)
+
+    async def refresh(self, key, compute, priority=None):
+        """Ricalcola il valore anche se è in cache; si unisce a un calcolo già in corso."""
+        inflight = self._inflight.get(key)
+        task = inflight[0] if inflight is not None else self._start(key, compute, priority)
+        return await asyncio.shield(task)
+
+    def _start(self, key, compute, priority):
+        task = asyncio.ensure_future(self._compute(key, compute))
+        self._inflight[key] = (task, priority)
+        return task
+
+    async def _compute(self, key, compute):
+        try:
+            value = await compute()
+            self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "promoted": self.promoted,
+            "inflight": len(self._inflight),
+        }
+
+
+def normalize_key(text):
+    return " ".join(text.lower().split())
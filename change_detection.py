@@ -0,0 +1,80 @@
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, field
+
+
+def ticket_fingerprint(ticket):
+    """Impronta stabile di un biglietto, costruita da data, luogo e prezzo."""
+    key = "|".join(
+        " ".join(str(ticket.get(field_name, "")).split())
+        for field_name in ("day", "location", "price")
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class ListingDiff:
+    new: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    # Coppie (biglietto precedente, biglietto attuale) con lo stesso luogo e data
+    price_changed: list = field(default_factory=list)
+
+    @property
+    def has_updates(self):
+        return bool(self.new or self.price_changed)
+
+
+def _expand(tickets):
+    # Ogni impronta compare tante volte quanti sono i biglietti identici
+    by_fingerprint = {}
+    counts = Counter()
+    for ticket in tickets:
+        fingerprint = ticket_fingerprint(ticket)
+        by_fingerprint.setdefault(fingerprint, ticket)
+        counts[fingerprint] += 1
+    return by_fingerprint, counts
+
+
+def diff_listings(previous, current):
+    previous_tickets, previous_counts = _expand(previous)
+    current_tickets, current_counts = _expand(current)
+
+    added = []
+    for fingerprint, count in (current_counts - previous_counts).items():
+        added.extend([current_tickets[fingerprint]] * count)
+    removed = []
+    for fingerprint, count in (previous_counts - current_counts).items():
+        removed.extend([previous_tickets[fingerprint]] * count)
+
+    # Un biglietto rimosso e uno nuovo nello stesso luogo e data sono un cambio di prezzo
+    diff = ListingDiff()
+    unmatched_removed = list(removed)
+    for ticket in added:
+        slot = (ticket.get("day"), ticket.get("location"))
+        old = next(
+            (r for r in unmatched_removed if (r.get("day"), r.get("location")) == slot),
+            None
+        )
+        if old is not None:
+            unmatched_removed.remove(old)
+            diff.price_changed.append((old, ticket))
+        else:
+            diff.new.append(ticket)
+    diff.removed = unmatched_removed
+    return diff
+
+
+def apply_diff(previous, diff):
+    """Elenco attuale ricostruito dall'elenco precedente e dalle sole modifiche."""
+    to_remove = Counter(ticket_fingerprint(ticket) for ticket in diff.removed)
+    to_remove.update(ticket_fingerprint(old) for old, _ in diff.price_changed)
+    current = []
+    for ticket in previous:
+        fingerprint = ticket_fingerprint(ticket)
+        if to_remove[fingerprint] > 0:
+            to_remove[fingerprint] -= 1
+            continue
+        current.append(ticket)
+    current.extend(diff.new)
+    current.extend(ticket for _, ticket in diff.price_changed)
+    return current
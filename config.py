@@ -1,4 +1,5 @@
 import os
+import socket
 from dotenv import load_dotenv
 
 # Carica le variabili d'ambiente dal file .env
@@ -7,4 +8,154 @@ load_dotenv()
 # Ottieni il token dal file .env
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 SCRAPER_API_URL = os.getenv("SCRAPER_API_URL", "http://localhost:8000")
-API_KEY = os.getenv("SCRAPER_API_KEY")
\ No newline at end of file
+API_KEY = os.getenv("SCRAPER_API_KEY")
+
+# Pagine di partenza dello scraping (sovrascrivibili, ad esempio per i benchmark offline)
+FANSALE_SEARCH_URL = os.getenv("FANSALE_SEARCH_URL", "https://www.fansale.it/event")
+TICKETONE_URL = os.getenv("TICKETONE_URL", "https://www.ticketone.it/")
+
+# Client del bot verso il microservizio di scraping (timeout in secondi)
+SCRAPER_CONNECT_TIMEOUT = float(os.getenv("SCRAPER_CONNECT_TIMEOUT", "5"))
+SCRAPER_TIMEOUT_SEARCH_ARTIST = float(os.getenv("SCRAPER_TIMEOUT_SEARCH_ARTIST", "30"))
+SCRAPER_TIMEOUT_CONCERT_LIST = float(os.getenv("SCRAPER_TIMEOUT_CONCERT_LIST", "45"))
+SCRAPER_TIMEOUT_SEARCH_TICKETS = float(os.getenv("SCRAPER_TIMEOUT_SEARCH_TICKETS", "30"))
+# Per lo streaming di /search_tickets_batch: attesa massima tra una riga e la successiva
+SCRAPER_TIMEOUT_BATCH = float(os.getenv("SCRAPER_TIMEOUT_BATCH", "90"))
+SCRAPER_RETRIES = int(os.getenv("SCRAPER_RETRIES", "2"))
+SCRAPER_RETRY_BACKOFF = float(os.getenv("SCRAPER_RETRY_BACKOFF", "0.5"))
+SCRAPER_BREAKER_THRESHOLD = int(os.getenv("SCRAPER_BREAKER_THRESHOLD", "5"))
+SCRAPER_BREAKER_RESET = float(os.getenv("SCRAPER_BREAKER_RESET", "30"))
+SCRAPER_HTTP2 = os.getenv("SCRAPER_HTTP2", "false").lower() == "true"
+
+# Browser pool del microservizio di scraping
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", "2"))
+BROWSER_MAX_PAGES = int(os.getenv("BROWSER_MAX_PAGES", "4"))
+BROWSER_MAX_USES = int(os.getenv("BROWSER_MAX_USES", "100"))
+
+# Controllo periodico dei biglietti: batch di link inviati in parallelo al microservizio
+CHECK_CONCURRENCY = int(os.getenv("CHECK_CONCURRENCY", "2"))
+CHECK_BATCH_SIZE = int(os.getenv("CHECK_BATCH_SIZE", "25"))
+CHECK_BATCH_TIMEOUT = float(os.getenv("CHECK_BATCH_TIMEOUT", "600"))
+
+# Scraping in batch nel microservizio
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_URL_TIMEOUT = float(os.getenv("BATCH_URL_TIMEOUT", "60"))
+# Richieste al secondo verso lo stesso host (es. www.fansale.it), per ogni scraping dei biglietti
+HOST_RATE_LIMIT = float(os.getenv("HOST_RATE_LIMIT", "2"))
+
+# Ammissione degli scraping con browser: slot totali (default: pagine del pool),
+# slot riservati alle richieste interattive e lunghezza massima delle code prima del 503
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", str(BROWSER_MAX_PAGES)))
+ADMISSION_RESERVED_INTERACTIVE = int(os.getenv("ADMISSION_RESERVED_INTERACTIVE", "1"))
+ADMISSION_MAX_QUEUE_INTERACTIVE = int(os.getenv("ADMISSION_MAX_QUEUE_INTERACTIVE", "20"))
+ADMISSION_MAX_QUEUE_BACKGROUND = int(os.getenv("ADMISSION_MAX_QUEUE_BACKGROUND", "100"))
+
+# Cache dei risultati nel microservizio (TTL in secondi)
+ARTIST_CACHE_TTL = float(os.getenv("ARTIST_CACHE_TTL", "600"))
+ARTIST_CACHE_SIZE = int(os.getenv("ARTIST_CACHE_SIZE", "500"))
+CONCERT_LIST_CACHE_TTL = float(os.getenv("CONCERT_LIST_CACHE_TTL", "900"))
+CONCERT_LIST_CACHE_SIZE = int(os.getenv("CONCERT_LIST_CACHE_SIZE", "500"))
+
+# Percorso del database SQLite del bot
+DB_PATH = os.getenv("DB_PATH", "user_data.db")
+
+# Profilo di navigazione per endpoint: full, lean o strict (vedi navigation.py)
+NAV_PROFILE_SEARCH_ARTIST = os.getenv("NAV_PROFILE_SEARCH_ARTIST", "lean")
+NAV_PROFILE_CONCERT_LIST = os.getenv("NAV_PROFILE_CONCERT_LIST", "lean")
+NAV_PROFILE_SEARCH_TICKETS = os.getenv("NAV_PROFILE_SEARCH_TICKETS", "lean")
+
+# Engine per /search_tickets: auto (HTTP con fallback al browser), http o browser
+SCRAPE_ENGINE = os.getenv("SCRAPE_ENGINE", "auto")
+
+# Estrazione per search_artist e write_to_searchbar_and_click_first_result:
+# xhr (risposte JSON intercettate, con fallback al DOM) o dom (solo pagina renderizzata)
+SCRAPE_EXTRACTION = os.getenv("SCRAPE_EXTRACTION", "xhr")
+# Attesa massima della risposta JSON dei suggerimenti prima di passare al DOM (secondi)
+XHR_CAPTURE_TIMEOUT = float(os.getenv("XHR_CAPTURE_TIMEOUT", "5"))
+# Parte dell'URL che identifica le richieste XHR da intercettare
+XHR_FANSALE_SUGGEST_PATTERN = os.getenv("XHR_FANSALE_SUGGEST_PATTERN", "suggest")
+XHR_TICKETONE_SUGGEST_PATTERN = os.getenv("XHR_TICKETONE_SUGGEST_PATTERN", "suggest")
+XHR_TICKETONE_LISTING_PATTERN = os.getenv("XHR_TICKETONE_LISTING_PATTERN", "/api/events")
+
+# Scheduler adattivo dei controlli (secondi)
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "30"))
+SCRAPE_BUDGET_PER_MINUTE = float(os.getenv("SCRAPE_BUDGET_PER_MINUTE", "60"))
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "300"))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "10800"))
+
+# Modalità di scraping del bot: "http" (chiamate dirette al microservizio) o "queue" (coda di job per i worker)
+SCRAPE_MODE = os.getenv("SCRAPE_MODE", "http")
+SCRAPE_QUEUE_BACKEND = os.getenv("SCRAPE_QUEUE_BACKEND", "sqlite")
+SCRAPE_QUEUE_PATH = os.getenv("SCRAPE_QUEUE_PATH", "scrape_queue.db")
+SCRAPE_QUEUE_VISIBILITY_TIMEOUT = float(os.getenv("SCRAPE_QUEUE_VISIBILITY_TIMEOUT", "120"))
+SCRAPE_QUEUE_MAX_ATTEMPTS = int(os.getenv("SCRAPE_QUEUE_MAX_ATTEMPTS", "3"))
+SCRAPE_QUEUE_RESULT_TIMEOUT = float(os.getenv("SCRAPE_QUEUE_RESULT_TIMEOUT", "60"))
+# I worker eliminano i job più vecchi di così (risultati mai letti, produttore terminato)
+SCRAPE_QUEUE_JOB_TTL = float(os.getenv("SCRAPE_QUEUE_JOB_TTL", "3600"))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "0.5"))
+
+# Stream delle modifiche degli elenchi dal microservizio al bot (vedi listing_monitor.py).
+# Il microservizio monitora le pagine solo con STREAM_ENABLED=true, in un unico processo
+STREAM_ENABLED = os.getenv("STREAM_ENABLED", "false").lower() == "true"
+STREAM_DB_PATH = os.getenv("STREAM_DB_PATH", "listing_stream.db")
+STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", "15"))
+STREAM_RETENTION_EVENTS = int(os.getenv("STREAM_RETENTION_EVENTS", "100000"))
+# Bot: "poll" (ciclo check_tickets) o "stream" (sottoscrizione agli eventi del microservizio)
+CHECK_MODE = os.getenv("CHECK_MODE", "poll")
+STREAM_SUBSCRIBER = os.getenv("STREAM_SUBSCRIBER", "bot")
+
+# Storico degli elenchi letti dal microservizio (vedi listing_history.py), tempi in secondi
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "listing_history.db")
+HISTORY_FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "5"))
+HISTORY_COMPACT_INTERVAL = float(os.getenv("HISTORY_COMPACT_INTERVAL", "3600"))
+# Dopo HISTORY_DOWNSAMPLE_AFTER le variazioni vengono sommate per intervalli di HISTORY_BUCKET_SECONDS
+HISTORY_BUCKET_SECONDS = int(os.getenv("HISTORY_BUCKET_SECONDS", "3600"))
+HISTORY_DOWNSAMPLE_AFTER = float(os.getenv("HISTORY_DOWNSAMPLE_AFTER", str(7 * 86400)))
+HISTORY_RETENTION = float(os.getenv("HISTORY_RETENTION", str(180 * 86400)))
+
+# Supervisor multi-processo del microservizio (uvicorn supervisor:app)
+SUPERVISOR_MIN_WORKERS = int(os.getenv("SUPERVISOR_MIN_WORKERS", "2"))
+SUPERVISOR_MAX_WORKERS = int(os.getenv("SUPERVISOR_MAX_WORKERS", "6"))
+SUPERVISOR_WORKER_BASE_PORT = int(os.getenv("SUPERVISOR_WORKER_BASE_PORT", "8100"))
+SUPERVISOR_CHECK_INTERVAL = float(os.getenv("SUPERVISOR_CHECK_INTERVAL", "10"))
+SUPERVISOR_MAX_RSS_MB = float(os.getenv("SUPERVISOR_MAX_RSS_MB", "1500"))
+SUPERVISOR_MAX_CRASHES_PER_CHECK = int(os.getenv("SUPERVISOR_MAX_CRASHES_PER_CHECK", "3"))
+# Richieste in coda per worker (admission e browser pool) oltre cui aggiungere un worker
+SUPERVISOR_SCALE_UP_QUEUE_DEPTH = float(os.getenv("SUPERVISOR_SCALE_UP_QUEUE_DEPTH", "2"))
+# Richieste in corso per worker, senza code, sotto cui rimuovere un worker
+SUPERVISOR_SCALE_DOWN_LOAD = float(os.getenv("SUPERVISOR_SCALE_DOWN_LOAD", "0.5"))
+
+# Prefetch degli elenchi dei concerti lato bot
+PREFETCH_TOP_RESULTS = int(os.getenv("PREFETCH_TOP_RESULTS", "3"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "2"))
+WARM_TOP_ARTISTS = int(os.getenv("WARM_TOP_ARTISTS", "20"))
+# Deve essere minore di CONCERT_LIST_CACHE_TTL, così gli elenchi riscaldati non scadono
+WARM_INTERVAL = float(os.getenv("WARM_INTERVAL", "600"))
+
+# Dispatcher delle notifiche Telegram (limiti: ~30 messaggi/s in totale, ~1/s per chat)
+NOTIFY_GLOBAL_RATE = float(os.getenv("NOTIFY_GLOBAL_RATE", "25"))
+NOTIFY_CHAT_RATE = float(os.getenv("NOTIFY_CHAT_RATE", "1"))
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "8"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+NOTIFY_RETRY_BACKOFF = float(os.getenv("NOTIFY_RETRY_BACKOFF", "5"))
+
+# Porta delle metriche Prometheus del bot (0 per disattivarle)
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "9100"))
+
+# Modalità del bot: "polling" (un solo processo) o "webhook" (una o più istanze dietro un load balancer)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# URL pubblico a cui Telegram invia gli update (quello del load balancer), es. https://bot.example.com/telegram
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# Identificativo dell'istanza nel lease dei job in background (deve essere diverso per ogni istanza)
+BOT_INSTANCE_ID = os.getenv("BOT_INSTANCE_ID", f"{socket.gethostname()}-{os.getpid()}")
+LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", "30"))
+LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", "10"))
+# Bot API alternativa (es. la Bot API simulata di benchmarks/mock_servers.py); vuoto per api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
@@ -1,9 +1,65 @@
+import asyncio
+import logging
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from change_detection import ticket_fingerprint
+from config import DB_PATH
 
-def setup_database():
-    conn = sqlite3.connect('user_data.db')
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """Connessione SQLite unica e di lunga durata, in modalità WAL.
+
+    Tutte le operazioni passano da un executor con un solo thread: sono
+    serializzate sulla stessa connessione e non bloccano l'event loop.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    @property
+    def connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute('PRAGMA busy_timeout=5000')
+            self._conn.execute('PRAGMA foreign_keys=ON')
+        return self._conn
+
+    def _call(self, func, args):
+        conn = self.connection
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    async def run(self, func, *args):
+        # Esegue func(conn, *args) in una transazione, fuori dall'event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def run_sync(self, func, *args):
+        return self._executor.submit(self._call, func, args).result()
+
+    def close(self):
+        if self._conn is not None:
+            self._executor.submit(self._conn.close).result()
+            self._conn = None
+
+
+db = Database(DB_PATH)
+
+
+def _migration_1_initial_schema(conn):
     c = conn.cursor()
-    # Crea la tabella se non esiste
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
             user_id INTEGER,
@@ -13,41 +69,387 @@ def setup_database():
             PRIMARY KEY(user_id, link_fansale, concert_date)
         )
     ''')
-    conn.commit()
-    conn.close()
+    # Ultimo elenco di biglietti visto per ogni (link, data), usato per notificare solo le novità
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS listing_snapshots (
+            link_fansale TEXT,
+            concert_date TEXT,
+            fingerprint TEXT,
+            day TEXT,
+            location TEXT,
+            price TEXT,
+            count INTEGER,
+            PRIMARY KEY(link_fansale, concert_date, fingerprint)
+        )
+    ''')
 
-def update_user_data(user_id, artist_name, link_fansale, concert_date):
-    conn = sqlite3.connect('user_data.db')
+def _migration_2_events_and_subscriptions(conn):
+    # Un evento per link fanSALE (indice univoco su link_fansale) e una sottoscrizione per (utente, evento, data)
     c = conn.cursor()
     c.execute('''
-        INSERT OR IGNORE INTO users (user_id, artist_name, link_fansale, concert_date) 
-        VALUES (?, ?, ?, ?)
-    ''', (user_id, artist_name, link_fansale, concert_date))
-    conn.commit()
-    conn.close()
+        CREATE TABLE events (
+            id INTEGER PRIMARY KEY,
+            link_fansale TEXT NOT NULL UNIQUE,
+            artist_name TEXT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_checked_at TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE subscriptions (
+            user_id INTEGER NOT NULL,
+            event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+            concert_date TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY(user_id, event_id, concert_date)
+        )
+    ''')
+    c.execute('CREATE INDEX idx_subscriptions_event_date ON subscriptions(event_id, concert_date)')
 
-def get_all_users():
-    conn = sqlite3.connect('user_data.db')
+    # Migra i tracker esistenti
+    c.execute('''
+        INSERT INTO events (link_fansale, artist_name)
+        SELECT link_fansale, MIN(artist_name) FROM users GROUP BY link_fansale
+    ''')
+    c.execute('''
+        INSERT INTO subscriptions (user_id, event_id, concert_date)
+        SELECT u.user_id, e.id, u.concert_date
+        FROM users u JOIN events e ON e.link_fansale = u.link_fansale
+    ''')
+    c.execute('DROP TABLE users')
+    # Vista di compatibilità con la vecchia tabella users
+    c.execute('''
+        CREATE VIEW users AS
+        SELECT s.user_id, e.link_fansale, s.concert_date, e.artist_name, s.created_at
+        FROM subscriptions s JOIN events e ON e.id = s.event_id
+    ''')
+
+def _migration_3_pending_notifications(conn):
+    # Notifiche Telegram non ancora consegnate, lette dal dispatcher in ordine di arrivo
+    c = conn.cursor()
+    c.execute('''
+        CREATE TABLE pending_notifications (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('CREATE INDEX idx_pending_notifications_due ON pending_notifications(next_attempt_at)')
+
+def _migration_4_stream_offsets(conn):
+    # Offset dell'ultimo evento applicato dello stream delle modifiche, per sottoscrittore
+    conn.execute('''
+        CREATE TABLE stream_offsets (
+            subscriber TEXT PRIMARY KEY,
+            last_offset INTEGER NOT NULL
+        )
+    ''')
+
+def _migration_5_shared_state(conn):
+    c = conn.cursor()
+    # Stato condiviso tra le istanze del bot in modalità webhook: user_data e stato delle conversazioni
+    c.execute('''
+        CREATE TABLE user_state (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE conversation_state (
+            name TEXT NOT NULL,
+            conversation_key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY(name, conversation_key)
+        )
+    ''')
+    # Lease per l'elezione dell'istanza che esegue i job in background
+    c.execute('''
+        CREATE TABLE leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+# Migrazioni dello schema, applicate in ordine; la versione corrente è in PRAGMA user_version
+MIGRATIONS = [
+    (1, _migration_1_initial_schema),
+    (2, _migration_2_events_and_subscriptions),
+    (3, _migration_3_pending_notifications),
+    (4, _migration_4_stream_offsets),
+    (5, _migration_5_shared_state),
+]
+
+def _setup_database(conn):
     c = conn.cursor()
-    c.execute('SELECT user_id, artist_name, link_fansale, concert_date FROM users')
-    users = c.fetchall()
-    conn.close()
-    return users
+    # Più istanze del bot possono partire insieme: la prima applica le migrazioni, le altre attendono
+    c.execute('BEGIN IMMEDIATE')
+    current_version = c.execute('PRAGMA user_version').fetchone()[0]
+    for version, migration in MIGRATIONS:
+        if version > current_version:
+            logger.info(f"Applico la migrazione del database alla versione {version}")
+            migration(conn)
+            c.execute(f'PRAGMA user_version = {version}')
+
+def setup_database():
+    db.run_sync(_setup_database)
 
-def get_user_trackers(user_id):
-    conn = sqlite3.connect('user_data.db')
+def close_database():
+    db.close()
+
+def _update_user_data_many(conn, rows):
     c = conn.cursor()
-    c.execute('SELECT artist_name, link_fansale, concert_date FROM users WHERE user_id = ?', (user_id,))
-    trackers = c.fetchall()
-    conn.close()
-    return trackers
+    c.executemany('''
+        INSERT OR IGNORE INTO events (link_fansale, artist_name) VALUES (?, ?)
+    ''', [(link_fansale, artist_name) for _, artist_name, link_fansale, _ in rows])
+    c.executemany('''
+        INSERT OR IGNORE INTO subscriptions (user_id, event_id, concert_date)
+        SELECT ?, id, ? FROM events WHERE link_fansale = ?
+    ''', [(user_id, concert_date, link_fansale) for user_id, _, link_fansale, concert_date in rows])
+
+async def update_user_data(user_id, artist_name, link_fansale, concert_date):
+    await db.run(_update_user_data_many, [(user_id, artist_name, link_fansale, concert_date)])
+
+async def update_user_data_many(rows):
+    # rows: lista di tuple (user_id, artist_name, link_fansale, concert_date), scritte in un'unica transazione
+    await db.run(_update_user_data_many, rows)
 
-def remove_tracker(user_id, link_fansale, concert_date):
-    conn = sqlite3.connect('user_data.db')
+def _get_tracked_events(conn):
     c = conn.cursor()
     c.execute('''
-        DELETE FROM users 
-        WHERE user_id = ? AND link_fansale = ? AND concert_date = ?
-    ''', (user_id, link_fansale, concert_date))
-    conn.commit()
-    conn.close()
+        SELECT e.link_fansale, s.user_id, e.artist_name, s.concert_date
+        FROM events e JOIN subscriptions s ON s.event_id = e.id
+        ORDER BY e.id
+    ''')
+    trackers_by_link = {}
+    for link_fansale, user_id, artist_name, concert_date in c.fetchall():
+        trackers_by_link.setdefault(link_fansale, []).append((user_id, artist_name, concert_date))
+    return trackers_by_link
+
+async def get_tracked_events():
+    # {link_fansale: [(user_id, artist_name, concert_date), ...]} per gli eventi con almeno un tracker
+    return await db.run(_get_tracked_events)
+
+def _get_most_tracked_artists(conn, limit):
+    c = conn.cursor()
+    c.execute('''
+        SELECT e.artist_name FROM subscriptions s JOIN events e ON e.id = s.event_id
+        GROUP BY e.artist_name ORDER BY COUNT(*) DESC LIMIT ?
+    ''', (limit,))
+    return [artist_name for artist_name, in c.fetchall()]
+
+async def get_most_tracked_artists(limit):
+    return await db.run(_get_most_tracked_artists, limit)
+
+def _mark_events_checked(conn, links):
+    c = conn.cursor()
+    c.executemany('''
+        UPDATE events SET last_checked_at = CURRENT_TIMESTAMP WHERE link_fansale = ?
+    ''', [(link,) for link in links])
+
+async def mark_events_checked(links):
+    await db.run(_mark_events_checked, list(links))
+
+def _get_user_trackers(conn, user_id):
+    c = conn.cursor()
+    c.execute('''
+        SELECT e.artist_name, e.link_fansale, s.concert_date
+        FROM subscriptions s JOIN events e ON e.id = s.event_id
+        WHERE s.user_id = ?
+    ''', (user_id,))
+    return c.fetchall()
+
+async def get_user_trackers(user_id):
+    return await db.run(_get_user_trackers, user_id)
+
+def _remove_tracker(conn, user_id, link_fansale, concert_date):
+    c = conn.cursor()
+    c.execute('''
+        DELETE FROM subscriptions
+        WHERE user_id = ? AND concert_date = ?
+          AND event_id = (SELECT id FROM events WHERE link_fansale = ?)
+    ''', (user_id, concert_date, link_fansale))
+
+async def remove_tracker(user_id, link_fansale, concert_date):
+    await db.run(_remove_tracker, user_id, link_fansale, concert_date)
+
+def _get_listing_snapshot(conn, link_fansale, concert_date):
+    c = conn.cursor()
+    c.execute('''
+        SELECT day, location, price, count FROM listing_snapshots
+        WHERE link_fansale = ? AND concert_date = ?
+    ''', (link_fansale, concert_date))
+    tickets = []
+    for day, location, price, count in c.fetchall():
+        tickets.extend([{'day': day, 'location': location, 'price': price}] * count)
+    return tickets
+
+async def get_listing_snapshot(link_fansale, concert_date):
+    return await db.run(_get_listing_snapshot, link_fansale, concert_date)
+
+def _save_listing_snapshots(conn, snapshots, notifications=(), stream_offset=None):
+    c = conn.cursor()
+    for link_fansale, concert_date, tickets in snapshots:
+        counts = {}
+        for ticket in tickets:
+            fingerprint = ticket_fingerprint(ticket)
+            if fingerprint in counts:
+                counts[fingerprint][1] += 1
+            else:
+                counts[fingerprint] = [ticket, 1]
+
+        c.execute('''
+            DELETE FROM listing_snapshots WHERE link_fansale = ? AND concert_date = ?
+        ''', (link_fansale, concert_date))
+        c.executemany('''
+            INSERT INTO listing_snapshots (link_fansale, concert_date, fingerprint, day, location, price, count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', [
+            (link_fansale, concert_date, fingerprint, ticket.get('day'), ticket.get('location'), ticket.get('price'), count)
+            for fingerprint, (ticket, count) in counts.items()
+        ])
+
+    _enqueue_notifications(conn, notifications)
+    if stream_offset is not None:
+        _save_stream_offset(conn, *stream_offset)
+
+async def save_listing_snapshots(snapshots, notifications=(), stream_offset=None):
+    # snapshots: lista di tuple (link_fansale, concert_date, tickets), scritte in un'unica transazione
+    # insieme alle notifiche (chat_id, testo) generate dal confronto e, in modalità stream,
+    # all'offset (subscriber, offset) dell'evento applicato
+    await db.run(_save_listing_snapshots, snapshots, list(notifications), stream_offset)
+
+def _save_stream_offset(conn, subscriber, offset):
+    conn.execute('''
+        INSERT INTO stream_offsets (subscriber, last_offset) VALUES (?, ?)
+        ON CONFLICT(subscriber) DO UPDATE SET last_offset = excluded.last_offset
+    ''', (subscriber, offset))
+
+async def save_stream_offset(subscriber, offset):
+    await db.run(_save_stream_offset, subscriber, offset)
+
+def _get_stream_offset(conn, subscriber):
+    row = conn.execute('SELECT last_offset FROM stream_offsets WHERE subscriber = ?', (subscriber,)).fetchone()
+    return row[0] if row else 0
+
+async def get_stream_offset(subscriber):
+    return await db.run(_get_stream_offset, subscriber)
+
+def _get_listing_subscribers(conn, link_fansale, concert_date):
+    c = conn.cursor()
+    c.execute('''
+        SELECT s.user_id, e.artist_name
+        FROM subscriptions s JOIN events e ON e.id = s.event_id
+        WHERE e.link_fansale = ? AND s.concert_date = ?
+    ''', (link_fansale, concert_date))
+    return c.fetchall()
+
+async def get_listing_subscribers(link_fansale, concert_date):
+    # [(user_id, artist_name), ...] dei tracker di una data di un evento
+    return await db.run(_get_listing_subscribers, link_fansale, concert_date)
+
+def _get_user_state(conn, user_id):
+    row = conn.execute('SELECT data FROM user_state WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] if row else None
+
+async def get_user_state(user_id):
+    return await db.run(_get_user_state, user_id)
+
+def _save_user_state(conn, user_id, data):
+    if data is None:
+        conn.execute('DELETE FROM user_state WHERE user_id = ?', (user_id,))
+        return
+    conn.execute('''
+        INSERT INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+    ''', (user_id, data, time.time()))
+
+async def save_user_state(user_id, data):
+    # data: user_data serializzato in JSON, None per eliminarlo
+    await db.run(_save_user_state, user_id, data)
+
+def _get_conversation_state(conn, name, conversation_key):
+    row = conn.execute('''
+        SELECT state FROM conversation_state WHERE name = ? AND conversation_key = ?
+    ''', (name, conversation_key)).fetchone()
+    return row[0] if row else None
+
+async def get_conversation_state(name, conversation_key):
+    return await db.run(_get_conversation_state, name, conversation_key)
+
+def _save_conversation_state(conn, name, conversation_key, state):
+    if state is None:
+        conn.execute('DELETE FROM conversation_state WHERE name = ? AND conversation_key = ?', (name, conversation_key))
+        return
+    conn.execute('''
+        INSERT INTO conversation_state (name, conversation_key, state, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT(name, conversation_key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+    ''', (name, conversation_key, state, time.time()))
+
+async def save_conversation_state(name, conversation_key, state):
+    # state None: conversazione terminata
+    await db.run(_save_conversation_state, name, conversation_key, state)
+
+def _acquire_lease(conn, name, holder, ttl, now):
+    # Il lease si rinnova se è già di holder, si acquisisce se è scaduto
+    conn.execute('''
+        INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at
+        WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+    ''', (name, holder, now + ttl, now))
+    return conn.execute('SELECT holder, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+
+async def acquire_lease(name, holder, ttl):
+    # Restituisce (detentore attuale, scadenza)
+    return await db.run(_acquire_lease, name, holder, ttl, time.time())
+
+def _release_lease(conn, name, holder):
+    conn.execute('DELETE FROM leases WHERE name = ? AND holder = ?', (name, holder))
+
+async def release_lease(name, holder):
+    await db.run(_release_lease, name, holder)
+
+def _enqueue_notifications(conn, notifications):
+    now = time.time()
+    conn.executemany('''
+        INSERT INTO pending_notifications (chat_id, text, next_attempt_at) VALUES (?, ?, ?)
+    ''', [(chat_id, text, now) for chat_id, text in notifications])
+
+def _get_due_notifications(conn, now, exclude_chat_ids, limit):
+    placeholders = ', '.join('?' * len(exclude_chat_ids))
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT id, chat_id, text, attempts FROM pending_notifications
+        WHERE next_attempt_at <= ? AND chat_id NOT IN ({placeholders})
+        ORDER BY id LIMIT ?
+    ''', (now, *exclude_chat_ids, limit))
+    return c.fetchall()
+
+async def get_due_notifications(now, exclude_chat_ids, limit):
+    # Notifiche pronte per l'invio, escluse quelle delle chat con un invio già in corso
+    return await db.run(_get_due_notifications, now, exclude_chat_ids, limit)
+
+def _delete_notifications(conn, ids):
+    conn.executemany('DELETE FROM pending_notifications WHERE id = ?', [(i,) for i in ids])
+
+async def delete_notifications(ids):
+    await db.run(_delete_notifications, ids)
+
+def _reschedule_notifications(conn, ids, attempts, next_attempt_at):
+    conn.executemany('''
+        UPDATE pending_notifications SET attempts = ?, next_attempt_at = ? WHERE id = ?
+    ''', [(attempts, next_attempt_at, i) for i in ids])
+
+async def reschedule_notifications(ids, attempts, next_attempt_at):
+    await db.run(_reschedule_notifications, ids, attempts, next_attempt_at)
+
+def _count_pending_notifications(conn):
+    return conn.execute('SELECT COUNT(*) FROM pending_notifications').fetchone()[0]
+
+async def count_pending_notifications():
+    return await db.run(_count_pending_notifications)
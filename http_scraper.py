@@ -0,0 +1,143 @@
+import logging
+
+import httpx
+from lxml import html
+
+from parsers import parse_ticket_rows
+from metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+# Header simili a quelli di un browser reale, per ricevere la stessa pagina server-side
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3",
+}
+
+# Indizi di una pagina di verifica anti-bot al posto del contenuto reale
+CHALLENGE_STATUS_CODES = {403, 429, 503}
+CHALLENGE_MARKERS = (
+    "_incapsula_resource",
+    "cf-chl-",
+    "challenge-platform",
+    "px-captcha",
+    "captcha-delivery.com",
+    "<title>access denied</title>",
+)
+
+
+class FallbackRequired(Exception):
+    """La pagina non può essere letta via HTTP: serve il browser."""
+
+
+def _has_class(class_name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+# Come innerText nel browser: il testo degli elementi nascosti e di script/style
+# è escluso e gli elementi di blocco vanno a capo. Gli spazi vengono poi
+# normalizzati da parse_ticket_rows, allo stesso modo per entrambi gli engine.
+_SKIPPED_TAGS = frozenset({"script", "style", "template", "noscript"})
+_BLOCK_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "footer", "form",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "li", "main", "nav", "ol", "p", "pre",
+    "section", "table", "tr", "ul",
+})
+
+
+def _is_hidden(element):
+    # Senza i fogli di stile si riconoscono solo l'attributo hidden, la classe
+    # "hidden" usata da fanSALE e display:none inline
+    if element.get("hidden") is not None or "hidden" in element.get("class", "").split():
+        return True
+    return "display:none" in element.get("style", "").replace(" ", "").lower()
+
+
+def _visible_text(element):
+    if _is_hidden(element):
+        # innerText di un elemento non renderizzato è il suo textContent
+        return element.text_content()
+    parts = []
+
+    def walk(node):
+        if isinstance(node.tag, str) and node.tag not in _SKIPPED_TAGS and not _is_hidden(node):
+            block = node.tag in _BLOCK_TAGS
+            if node.tag == "br" or block:
+                parts.append("\n")
+            parts.append(node.text or "")
+            for child in node:
+                walk(child)
+                parts.append(child.tail or "")
+            if block:
+                parts.append("\n")
+
+    walk(element)
+    return "".join(parts)
+
+
+def _text(entry, *class_names):
+    # Primo elemento trovato tra i selettori, come il fallback del parser nel browser
+    for class_name in class_names:
+        elements = entry.xpath(f".//*[{_has_class(class_name)}]")
+        if elements:
+            return _visible_text(elements[0])
+    return None
+
+
+def extract_ticket_rows(document):
+    rows = []
+    for entry in document.xpath(f"//*[{_has_class('js-EventEntry')}]"):
+        rows.append({
+            "classes": entry.get("class", ""),
+            "href": entry.get("href"),
+            "day": _text(entry, "EvEntryRow-Day", "EvEntryRow-SubscriptionDateElement"),
+            "name": _text(entry, "EvEntryRow-smallSubtitle"),
+            "location": _text(entry, "EvEntryRow-highlightedTitle"),
+            "price": _text(entry, "EvEntryRow-moneyValueFormatSmall", "EvEntryRow-moneyValueFormat"),
+        })
+    return rows
+
+
+class HttpScraper:
+    """Scraper HTTP senza browser per le pagine evento di fanSALE."""
+
+    def __init__(self, timeout=10.0, max_connections=20):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=self.timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def scrape_tickets(self, url):
+        try:
+            with stage_timer("search_tickets", "http_fetch"):
+                response = await self._client.get(url)
+        except httpx.HTTPError as e:
+            raise FallbackRequired(f"richiesta HTTP fallita: {e}")
+
+        body = response.text
+        lowered = body.lower()
+        if response.status_code in CHALLENGE_STATUS_CODES or any(marker in lowered for marker in CHALLENGE_MARKERS):
+            raise FallbackRequired(f"verifica anti-bot rilevata (HTTP {response.status_code})")
+        if response.status_code >= 400:
+            raise FallbackRequired(f"HTTP {response.status_code}")
+
+        with stage_timer("search_tickets", "extraction"):
+            rows = extract_ticket_rows(html.fromstring(body))
+            if not rows:
+                raise FallbackRequired("nessuna riga .js-EventEntry nel markup")
+
+            logger.info(f"Found {len(rows)} event entries (http)")
+            return parse_ticket_rows(rows)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+
+from database import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """Elezione di una sola istanza del bot tramite un lease nel database condiviso.
+
+    L'istanza che detiene il lease lo rinnova ogni `renew_interval` secondi;
+    se smette di farlo (crash, database irraggiungibile) un'altra istanza lo
+    acquisisce dopo `ttl` secondi. on_elected e on_demoted avviano e fermano
+    i job in background, che così girano su una sola istanza alla volta.
+    """
+
+    def __init__(self, name, holder, ttl, renew_interval, on_elected, on_demoted):
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+        self.renew_interval = min(renew_interval, ttl / 2)
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self.leader = None
+        self.elections = 0
+        self._valid_until = 0.0
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader:
+            await self._demote()
+            try:
+                # Le altre istanze possono subentrare subito, senza attendere la scadenza
+                await release_lease(self.name, self.holder)
+            except Exception as e:
+                logger.error(f"Errore durante il rilascio del lease {self.name}: {e}")
+
+    async def _run(self):
+        while True:
+            await self._renew()
+            await asyncio.sleep(self.renew_interval)
+
+    async def _renew(self):
+        try:
+            self.leader, _ = await acquire_lease(self.name, self.holder, self.ttl)
+        except Exception as e:
+            logger.error(f"Errore durante il rinnovo del lease {self.name}: {e}")
+            # Il leader si ferma prima che il lease scada e un'altra istanza possa acquisirlo
+            if self.is_leader and time.monotonic() >= self._valid_until:
+                await self._demote()
+            return
+
+        if self.leader == self.holder:
+            self._valid_until = time.monotonic() + self.ttl - self.renew_interval
+            if not self.is_leader:
+                self.is_leader = True
+                self.elections += 1
+                logger.info(f"Istanza {self.holder} eletta leader ({self.name})")
+                try:
+                    await self.on_elected()
+                except Exception as e:
+                    logger.error(f"Errore durante l'avvio dei job del leader: {e}")
+        elif self.is_leader:
+            logger.warning(f"Lease {self.name} acquisito da {self.leader}")
+            await self._demote()
+
+    async def _demote(self):
+        self.is_leader = False
+        logger.info(f"Istanza {self.holder} non è più leader ({self.name})")
+        try:
+            await self.on_demoted()
+        except Exception as e:
+            logger.error(f"Errore durante l'arresto dei job del leader: {e}")
+
+    def stats(self):
+        return {
+            "instance": self.holder,
+            "is_leader": self.is_leader,
+            "leader": self.leader,
+            "elections": self.elections,
+        }
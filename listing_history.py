@@ -0,0 +1,427 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from database import Database
+from parsers import parse_price_cents
+from ticket_matching import normalize_date
+
+logger = logging.getLogger(__name__)
+
+# Prezzo non riconosciuto (le colonne della chiave primaria non possono essere NULL)
+UNKNOWN_PRICE = -1
+
+# Oltre questo numero di snapshot in attesa la scrittura parte subito
+MAX_PENDING = 1000
+
+
+def date_key(raw_day):
+    """Data di un biglietto come intero AAAAMMGG (anno 0 se manca), 0 se non è riconoscibile."""
+    normalized = normalize_date(raw_day)
+    if normalized is None:
+        return 0
+    day, month, year = normalized
+    return (year or 0) * 10000 + month * 100 + day
+
+
+def _migration_1_listing_history(conn):
+    c = conn.cursor()
+    c.execute('CREATE TABLE history_urls (id INTEGER PRIMARY KEY, url TEXT NOT NULL UNIQUE)')
+    c.execute('CREATE TABLE history_locations (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)')
+    # Una riga per data di ogni pagina fanSALE
+    c.execute('''
+        CREATE TABLE history_listings (
+            id INTEGER PRIMARY KEY,
+            url_id INTEGER NOT NULL,
+            date_key INTEGER NOT NULL,
+            UNIQUE(url_id, date_key)
+        )
+    ''')
+    # Variazioni del numero di biglietti per (luogo, prezzo) rispetto allo snapshot
+    # precedente: la chiave primaria è anche l'indice delle query per data e intervallo
+    c.execute('''
+        CREATE TABLE history_changes (
+            listing_id INTEGER NOT NULL,
+            observed_at INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            price_cents INTEGER NOT NULL,
+            delta INTEGER NOT NULL,
+            PRIMARY KEY(listing_id, observed_at, location_id, price_cents)
+        ) WITHOUT ROWID
+    ''')
+    # Elenco attuale, base del confronto con lo snapshot successivo
+    c.execute('''
+        CREATE TABLE history_current (
+            listing_id INTEGER NOT NULL,
+            location_id INTEGER NOT NULL,
+            price_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY(listing_id, location_id, price_cents)
+        ) WITHOUT ROWID
+    ''')
+    # Scraping di ogni pagina: quanti, quanti con modifiche e biglietti trovati, per tarare i controlli
+    c.execute('''
+        CREATE TABLE history_polls (
+            url_id INTEGER NOT NULL,
+            observed_at INTEGER NOT NULL,
+            checks INTEGER NOT NULL,
+            changes INTEGER NOT NULL,
+            tickets INTEGER NOT NULL,
+            PRIMARY KEY(url_id, observed_at)
+        ) WITHOUT ROWID
+    ''')
+
+MIGRATIONS = [
+    (1, _migration_1_listing_history),
+]
+
+def _setup(conn):
+    c = conn.cursor()
+    # Più processi del microservizio (supervisor) condividono lo stesso file
+    c.execute('BEGIN IMMEDIATE')
+    current_version = c.execute('PRAGMA user_version').fetchone()[0]
+    for version, migration in MIGRATIONS:
+        if version > current_version:
+            migration(conn)
+            c.execute(f'PRAGMA user_version = {version}')
+
+def _intern(conn, ids, table, column, value):
+    # ids: cache dei valori già registrati, valida solo nella transazione corrente
+    key = (table, value)
+    if key not in ids:
+        conn.execute(f'INSERT OR IGNORE INTO {table} ({column}) VALUES (?)', (value,))
+        ids[key] = conn.execute(f'SELECT id FROM {table} WHERE {column} = ?', (value,)).fetchone()[0]
+    return ids[key]
+
+def _listing_id(conn, ids, url_id, key):
+    cache_key = ("history_listings", url_id, key)
+    if cache_key not in ids:
+        conn.execute('INSERT OR IGNORE INTO history_listings (url_id, date_key) VALUES (?, ?)', (url_id, key))
+        ids[cache_key] = conn.execute(
+            'SELECT id FROM history_listings WHERE url_id = ? AND date_key = ?', (url_id, key)
+        ).fetchone()[0]
+    return ids[cache_key]
+
+def _record_snapshots(conn, snapshots):
+    c = conn.cursor()
+    # Gli id sono cercati nel database a ogni transazione: un altro processo del
+    # microservizio può aver eliminato pagine, date e luoghi con la compattazione.
+    # Il primo INSERT acquisisce il lock di scrittura, quindi restano validi fino al commit
+    ids = {}
+    changed_urls = 0
+    for url, observed_at, tickets in snapshots:
+        url_id = _intern(conn, ids, 'history_urls', 'url', url)
+        current = Counter({
+            (listing_id, location_id, price_cents): count
+            for listing_id, location_id, price_cents, count in c.execute('''
+                SELECT cur.listing_id, cur.location_id, cur.price_cents, cur.count
+                FROM history_current cur JOIN history_listings l ON l.id = cur.listing_id
+                WHERE l.url_id = ?
+            ''', (url_id,))
+        })
+        snapshot = Counter()
+        for ticket in tickets:
+            listing_id = _listing_id(conn, ids, url_id, date_key(ticket.get('day')))
+            location_id = _intern(conn, ids, 'history_locations', 'name', ' '.join(str(ticket.get('location', '')).split()))
+            price_cents = parse_price_cents(ticket.get('price'))
+            snapshot[(listing_id, location_id, UNKNOWN_PRICE if price_cents is None else price_cents)] += 1
+
+        changes = [
+            (key, snapshot[key] - current[key])
+            for key in snapshot.keys() | current.keys()
+            if snapshot[key] != current[key]
+        ]
+        c.executemany('''
+            INSERT INTO history_changes (listing_id, observed_at, location_id, price_cents, delta)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT DO UPDATE SET delta = delta + excluded.delta
+        ''', [(listing_id, observed_at, location_id, price_cents, delta)
+              for (listing_id, location_id, price_cents), delta in changes])
+        c.executemany('''
+            INSERT INTO history_current (listing_id, location_id, price_cents, count) VALUES (?, ?, ?, ?)
+            ON CONFLICT DO UPDATE SET count = excluded.count
+        ''', [(*key, snapshot[key]) for key, _ in changes if snapshot[key]])
+        c.executemany('''
+            DELETE FROM history_current WHERE listing_id = ? AND location_id = ? AND price_cents = ?
+        ''', [key for key, _ in changes if not snapshot[key]])
+        c.execute('''
+            INSERT INTO history_polls (url_id, observed_at, checks, changes, tickets) VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT DO UPDATE SET checks = checks + 1, changes = changes + excluded.changes, tickets = excluded.tickets
+        ''', (url_id, observed_at, 1 if changes else 0, len(tickets)))
+        changed_urls += bool(changes)
+    return changed_urls
+
+def _fold_changes(conn, before, bucket):
+    """Somma le variazioni precedenti a `before` in una riga per intervallo di `bucket` secondi.
+
+    Con bucket=None tutte le variazioni precedenti diventano un'unica riga a
+    `before`: l'elenco in quel momento, base delle variazioni successive.
+    """
+    c = conn.cursor()
+    if bucket is None:
+        target, where = '?', 'observed_at < ?'
+        params = (before, before)
+    else:
+        target, where = 'observed_at - observed_at % ?', 'observed_at < ? AND observed_at % ? != 0'
+        params = (bucket, before, bucket)
+    c.execute(f'''
+        CREATE TEMP TABLE folded AS
+        SELECT listing_id, {target} AS observed_at, location_id, price_cents, SUM(delta) AS delta
+        FROM history_changes WHERE {where}
+        GROUP BY listing_id, 2, location_id, price_cents
+    ''', params)
+    c.execute(f'DELETE FROM history_changes WHERE {where}', params[1:])
+    c.execute('''
+        INSERT INTO history_changes (listing_id, observed_at, location_id, price_cents, delta)
+        SELECT listing_id, observed_at, location_id, price_cents, delta FROM folded WHERE true
+        ON CONFLICT DO UPDATE SET delta = delta + excluded.delta
+    ''')
+    c.execute('DROP TABLE folded')
+
+def _compact(conn, now, bucket, downsample_after, retention):
+    c = conn.cursor()
+    downsample_before = int(now - downsample_after)
+    retention_before = int(now - retention)
+    retention_before -= retention_before % bucket
+
+    # Dopo downsample_after secondi resta una riga per intervallo di bucket secondi
+    _fold_changes(conn, downsample_before, bucket)
+    # Oltre la retention resta solo l'elenco di quel momento
+    _fold_changes(conn, retention_before, None)
+    # Biglietti comparsi e scomparsi nello stesso intervallo
+    c.execute('DELETE FROM history_changes WHERE delta = 0')
+
+    c.execute('''
+        CREATE TEMP TABLE folded AS
+        SELECT url_id, observed_at - observed_at % ? AS observed_at,
+               SUM(checks) AS checks, SUM(changes) AS changes, MAX(tickets) AS tickets
+        FROM history_polls WHERE observed_at < ? AND observed_at % ? != 0
+        GROUP BY url_id, 2
+    ''', (bucket, downsample_before, bucket))
+    c.execute('DELETE FROM history_polls WHERE observed_at < ? AND observed_at % ? != 0', (downsample_before, bucket))
+    c.execute('''
+        INSERT INTO history_polls (url_id, observed_at, checks, changes, tickets)
+        SELECT url_id, observed_at, checks, changes, tickets FROM folded WHERE true
+        ON CONFLICT DO UPDATE SET checks = checks + excluded.checks, changes = changes + excluded.changes,
+                                  tickets = MAX(tickets, excluded.tickets)
+    ''')
+    c.execute('DROP TABLE folded')
+    c.execute('DELETE FROM history_polls WHERE observed_at < ?', (retention_before,))
+    return _purge(conn)
+
+def _purge(conn):
+    """Elimina pagine, date e luoghi senza osservazioni entro la retention.
+
+    Una pagina non più letta nella retention non ha più righe in history_polls:
+    con lei spariscono date, elenco attuale e righe base. Una data senza
+    variazioni né biglietti attuali (tutti comparsi e scomparsi) non serve più.
+    """
+    c = conn.cursor()
+    c.execute('''
+        CREATE TEMP TABLE purged AS
+        SELECT l.id FROM history_listings l
+        WHERE NOT EXISTS (SELECT 1 FROM history_polls p WHERE p.url_id = l.url_id)
+           OR (NOT EXISTS (SELECT 1 FROM history_changes ch WHERE ch.listing_id = l.id)
+               AND NOT EXISTS (SELECT 1 FROM history_current cur WHERE cur.listing_id = l.id))
+    ''')
+    c.execute('DELETE FROM history_changes WHERE listing_id IN (SELECT id FROM purged)')
+    c.execute('DELETE FROM history_current WHERE listing_id IN (SELECT id FROM purged)')
+    listings = c.execute('DELETE FROM history_listings WHERE id IN (SELECT id FROM purged)').rowcount
+    c.execute('DROP TABLE purged')
+    urls = c.execute('''
+        DELETE FROM history_urls
+        WHERE NOT EXISTS (SELECT 1 FROM history_polls p WHERE p.url_id = history_urls.id)
+          AND NOT EXISTS (SELECT 1 FROM history_listings l WHERE l.url_id = history_urls.id)
+    ''').rowcount
+    locations = c.execute('''
+        DELETE FROM history_locations
+        WHERE NOT EXISTS (SELECT 1 FROM history_changes ch WHERE ch.location_id = history_locations.id)
+          AND NOT EXISTS (SELECT 1 FROM history_current cur WHERE cur.location_id = history_locations.id)
+    ''').rowcount
+    return {"urls": urls, "listings": listings, "locations": locations}
+
+def _listing_ids(conn, url, concert_date):
+    c = conn.cursor()
+    if concert_date is None:
+        c.execute('''
+            SELECT l.id, l.date_key FROM history_listings l JOIN history_urls u ON u.id = l.url_id
+            WHERE u.url = ? ORDER BY l.date_key
+        ''', (url,))
+        return c.fetchall()
+    key = date_key(concert_date)
+    if not key:
+        return []
+    # Come TicketIndex: se l'anno manca da una delle due parti basta giorno e mese
+    year, month_day = divmod(key, 10000)
+    c.execute('''
+        SELECT l.id, l.date_key FROM history_listings l JOIN history_urls u ON u.id = l.url_id
+        WHERE u.url = ? AND l.date_key % 10000 = ? AND (? = 0 OR l.date_key / 10000 IN (0, ?))
+        ORDER BY l.date_key
+    ''', (url, month_day, year, year))
+    return c.fetchall()
+
+def _query(conn, url, concert_date, since, until):
+    c = conn.cursor()
+    listings = []
+    for listing_id, key in _listing_ids(conn, url, concert_date):
+        # Elenco all'inizio dell'intervallo, poi le variazioni al suo interno
+        initial = c.execute('''
+            SELECT loc.name, ch.price_cents, SUM(ch.delta)
+            FROM history_changes ch JOIN history_locations loc ON loc.id = ch.location_id
+            WHERE ch.listing_id = ? AND ch.observed_at < ?
+            GROUP BY ch.location_id, ch.price_cents HAVING SUM(ch.delta) != 0
+        ''', (listing_id, since)).fetchall()
+        changes = c.execute('''
+            SELECT ch.observed_at, loc.name, ch.price_cents, ch.delta
+            FROM history_changes ch JOIN history_locations loc ON loc.id = ch.location_id
+            WHERE ch.listing_id = ? AND ch.observed_at >= ? AND ch.observed_at < ?
+            ORDER BY ch.observed_at
+        ''', (listing_id, since, until)).fetchall()
+        listings.append({
+            "date_key": key,
+            "initial": [
+                {"location": location, "price_cents": _price(price_cents), "count": count}
+                for location, price_cents, count in initial
+            ],
+            "changes": [
+                {"observed_at": observed_at, "location": location, "price_cents": _price(price_cents), "delta": delta}
+                for observed_at, location, price_cents, delta in changes
+            ],
+        })
+    polls = c.execute('''
+        SELECT p.observed_at, p.checks, p.changes, p.tickets
+        FROM history_polls p JOIN history_urls u ON u.id = p.url_id
+        WHERE u.url = ? AND p.observed_at >= ? AND p.observed_at < ?
+        ORDER BY p.observed_at
+    ''', (url, since, until)).fetchall()
+    return {
+        "url": url,
+        "since": since,
+        "until": until,
+        "listings": listings,
+        "polls": [
+            {"observed_at": observed_at, "checks": checks, "changes": changes, "tickets": tickets}
+            for observed_at, checks, changes, tickets in polls
+        ],
+    }
+
+def _price(price_cents):
+    return None if price_cents == UNKNOWN_PRICE else price_cents
+
+def _stats(conn):
+    c = conn.cursor()
+    page_count = c.execute('PRAGMA page_count').fetchone()[0]
+    page_size = c.execute('PRAGMA page_size').fetchone()[0]
+    return {
+        "urls": c.execute('SELECT COUNT(*) FROM history_urls').fetchone()[0],
+        "listings": c.execute('SELECT COUNT(*) FROM history_listings').fetchone()[0],
+        "change_rows": c.execute('SELECT COUNT(*) FROM history_changes').fetchone()[0],
+        "poll_rows": c.execute('SELECT COUNT(*) FROM history_polls').fetchone()[0],
+        "size_mb": round(page_count * page_size / (1024 * 1024), 2),
+    }
+
+
+class ListingHistory:
+    """Storico compatto degli elenchi di biglietti visti a ogni scraping.
+
+    Per ogni pagina e data si salvano solo le variazioni rispetto allo
+    snapshot precedente, come numero di biglietti in più o in meno per
+    (luogo, prezzo in centesimi). Gli snapshot vengono accumulati in memoria
+    e scritti in un'unica transazione ogni `flush_interval` secondi. La
+    compattazione periodica riduce le variazioni più vecchie di
+    `downsample_after` secondi a una riga per intervallo di `bucket` secondi
+    e oltre `retention` secondi conserva solo l'elenco di quel momento;
+    pagine e date non più lette entro `retention` vengono eliminate.
+    """
+
+    def __init__(self, path, flush_interval, compact_interval, bucket, downsample_after, retention):
+        self.db = Database(path)
+        self.flush_interval = flush_interval
+        self.compact_interval = compact_interval
+        self.bucket = int(bucket)
+        self.downsample_after = downsample_after
+        self.retention = retention
+        self._pending = []
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._last_compact = 0.0
+        self.recorded = 0
+        self.changed = 0
+        self.dropped = 0
+
+    async def start(self):
+        await self.db.run(_setup)
+        self._last_compact = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Errore durante il salvataggio dello storico: {e}")
+        self.db.close()
+
+    def record(self, url, tickets):
+        """Registra l'elenco appena letto da `url`; la scrittura avviene in background."""
+        if self._task is None:
+            return
+        if len(self._pending) >= 10 * MAX_PENDING:
+            # Database bloccato o troppo lento: meglio perdere qualche snapshot che la memoria
+            self.dropped += 1
+            return
+        self._pending.append((url, int(time.time()), tickets))
+        if len(self._pending) >= MAX_PENDING:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        snapshots, self._pending = self._pending, []
+        try:
+            self.changed += await self.db.run(_record_snapshots, snapshots)
+        except Exception:
+            self._pending[:0] = snapshots
+            raise
+        self.recorded += len(snapshots)
+
+    async def compact(self):
+        start = time.monotonic()
+        purged = await self.db.run(_compact, time.time(), self.bucket, self.downsample_after, self.retention)
+        logger.info(
+            f"Compattazione dello storico completata in {time.monotonic() - start:.2f} s "
+            f"(eliminate {purged['urls']} pagine, {purged['listings']} date, {purged['locations']} luoghi)"
+        )
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_compact >= self.compact_interval:
+                    self._last_compact = time.monotonic()
+                    await self.compact()
+            except Exception as e:
+                logger.error(f"Errore durante la scrittura dello storico: {e}")
+
+    async def query(self, url, concert_date=None, since=0, until=None):
+        """Elenco all'istante `since` e variazioni fino a `until` (secondi epoch) per pagina e data."""
+        until = until if until is not None else int(time.time()) + 1
+        return await self.db.run(_query, url, concert_date, since, until)
+
+    async def stats(self):
+        return {
+            "recorded_snapshots": self.recorded,
+            "changed_snapshots": self.changed,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            **await self.db.run(_stats),
+        }
@@ -0,0 +1,304 @@
+import asyncio
+import json
+import logging
+import time
+
+from change_detection import diff_listings
+from database import Database
+from polling_scheduler import AdaptiveScheduler
+from ticket_matching import TicketIndex
+
+logger = logging.getLogger(__name__)
+
+# Tipi di evento del log delle modifiche
+INITIAL, CHANGE = "initial", "change"
+
+STREAM_BATCH = 500
+
+
+def _migration_1_listing_stream(conn):
+    c = conn.cursor()
+    # Coppie (URL, data) seguite da ogni sottoscrittore (es. il bot)
+    c.execute('''
+        CREATE TABLE watches (
+            subscriber TEXT NOT NULL,
+            url TEXT NOT NULL,
+            concert_date TEXT NOT NULL,
+            PRIMARY KEY(subscriber, url, concert_date)
+        )
+    ''')
+    c.execute('CREATE INDEX idx_watches_listing ON watches(url, concert_date)')
+    # Ultimo elenco di biglietti visto per ogni coppia, base del confronto successivo
+    c.execute('''
+        CREATE TABLE listing_state (
+            url TEXT NOT NULL,
+            concert_date TEXT NOT NULL,
+            tickets TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY(url, concert_date)
+        )
+    ''')
+    # Log delle modifiche: l'id è l'offset da cui riprendere lo stream
+    c.execute('''
+        CREATE TABLE change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            concert_date TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    c.execute('CREATE INDEX idx_change_events_listing ON change_events(url, concert_date)')
+
+MIGRATIONS = [
+    (1, _migration_1_listing_stream),
+]
+
+def _setup(conn):
+    c = conn.cursor()
+    current_version = c.execute('PRAGMA user_version').fetchone()[0]
+    for version, migration in MIGRATIONS:
+        if version > current_version:
+            migration(conn)
+            c.execute(f'PRAGMA user_version = {version}')
+
+def _append_event(conn, url, concert_date, kind, payload, now):
+    conn.execute('''
+        INSERT INTO change_events (url, concert_date, kind, payload, created_at) VALUES (?, ?, ?, ?, ?)
+    ''', (url, concert_date, kind, json.dumps(payload), now))
+
+def _replace_watches(conn, subscriber, watches, resync):
+    c = conn.cursor()
+    current = set(c.execute(
+        'SELECT url, concert_date FROM watches WHERE subscriber = ?', (subscriber,)
+    ).fetchall())
+    watches = set(watches)
+    c.executemany('DELETE FROM watches WHERE subscriber = ? AND url = ? AND concert_date = ?',
+                  [(subscriber, url, concert_date) for url, concert_date in current - watches])
+    added = watches - current
+    c.executemany('INSERT INTO watches (subscriber, url, concert_date) VALUES (?, ?, ?)',
+                  [(subscriber, url, concert_date) for url, concert_date in added])
+
+    # Chi inizia a seguire (o chiede un resync di) un elenco già monitorato riceve
+    # l'elenco completo come evento iniziale; gli altri lo riceveranno al primo scraping
+    now = time.time()
+    for url, concert_date in (watches if resync else added):
+        row = c.execute('SELECT tickets FROM listing_state WHERE url = ? AND concert_date = ?',
+                        (url, concert_date)).fetchone()
+        if row is not None:
+            _append_event(conn, url, concert_date, INITIAL, {"tickets": json.loads(row[0])}, now)
+
+    # Elenchi non più seguiti da nessuno
+    c.execute('''
+        DELETE FROM listing_state WHERE NOT EXISTS (
+            SELECT 1 FROM watches w WHERE w.url = listing_state.url AND w.concert_date = listing_state.concert_date
+        )
+    ''')
+    return {"added": len(added), "removed": len(current - watches), "offset": _latest_offset(conn)}
+
+def _watched_listings(conn):
+    watched = {}
+    for url, concert_date in conn.execute('SELECT DISTINCT url, concert_date FROM watches ORDER BY url'):
+        watched.setdefault(url, []).append(concert_date)
+    return watched
+
+def _record_listing(conn, url, tickets_by_date):
+    c = conn.cursor()
+    now = time.time()
+    appended = 0
+    for concert_date, tickets in tickets_by_date.items():
+        row = c.execute('SELECT tickets FROM listing_state WHERE url = ? AND concert_date = ?',
+                        (url, concert_date)).fetchone()
+        if row is None:
+            _append_event(conn, url, concert_date, INITIAL, {"tickets": tickets}, now)
+            appended += 1
+        else:
+            diff = diff_listings(json.loads(row[0]), tickets)
+            if diff.has_updates or diff.removed:
+                # Solo i biglietti cambiati, non l'elenco intero
+                _append_event(conn, url, concert_date, CHANGE, {
+                    "new": diff.new,
+                    "removed": diff.removed,
+                    "price_changed": diff.price_changed,
+                }, now)
+                appended += 1
+        c.execute('''
+            INSERT INTO listing_state (url, concert_date, tickets, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(url, concert_date) DO UPDATE SET tickets = excluded.tickets, updated_at = excluded.updated_at
+        ''', (url, concert_date, json.dumps(tickets), now))
+    return appended
+
+def _events_after(conn, subscriber, offset, limit):
+    c = conn.cursor()
+    c.execute('''
+        SELECT e.id, e.url, e.concert_date, e.kind, e.payload, e.created_at
+        FROM change_events e
+        WHERE e.id > ? AND EXISTS (
+            SELECT 1 FROM watches w
+            WHERE w.subscriber = ? AND w.url = e.url AND w.concert_date = e.concert_date
+        )
+        ORDER BY e.id LIMIT ?
+    ''', (offset, subscriber, limit))
+    return [
+        {"offset": event_id, "url": url, "concert_date": concert_date, "kind": kind,
+         "created_at": created_at, **json.loads(payload)}
+        for event_id, url, concert_date, kind, payload, created_at in c.fetchall()
+    ]
+
+def _latest_offset(conn):
+    return conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_events').fetchone()[0]
+
+def _offset_range(conn):
+    return conn.execute('SELECT MIN(id), COALESCE(MAX(id), 0) FROM change_events').fetchone()
+
+def _trim_events(conn, keep):
+    conn.execute('DELETE FROM change_events WHERE id <= (SELECT MAX(id) FROM change_events) - ?', (keep,))
+
+def _stats(conn):
+    c = conn.cursor()
+    return {
+        "subscribers": c.execute('SELECT COUNT(DISTINCT subscriber) FROM watches').fetchone()[0],
+        "watches": c.execute('SELECT COUNT(*) FROM watches').fetchone()[0],
+        "listings": c.execute('SELECT COUNT(*) FROM listing_state').fetchone()[0],
+        "events": c.execute('SELECT COUNT(*) FROM change_events').fetchone()[0],
+        "latest_offset": _latest_offset(conn),
+    }
+
+
+def format_sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+class ListingMonitor:
+    """Monitoraggio delle pagine fanSALE seguite dai sottoscrittori, con log delle modifiche.
+
+    I sottoscrittori registrano le coppie (URL, data) che seguono; il monitor
+    le controlla con lo scheduler adattivo e, per ogni elenco cambiato,
+    aggiunge al log un evento con i soli biglietti nuovi, rimossi o con un
+    prezzo diverso (il primo evento di ogni elenco lo contiene per intero).
+    Gli eventi vengono inviati in streaming (SSE); l'offset dell'ultimo
+    evento ricevuto permette di riprendere dopo una disconnessione.
+    """
+
+    def __init__(self, path, scrape, scheduler: AdaptiveScheduler, concurrency, tick, heartbeat, retention):
+        self.db = Database(path)
+        self.scrape = scrape
+        self.scheduler = scheduler
+        self.concurrency = concurrency
+        self.tick = tick
+        self.heartbeat = heartbeat
+        self.retention = retention
+        self._changed = asyncio.Event()
+        self._task = None
+        self.checked = 0
+        self.failed = 0
+        self.events = 0
+        self.streams = 0
+
+    async def start(self):
+        await self.db.run(_setup)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.db.close()
+
+    def _notify(self):
+        # Risveglia tutti gli stream in attesa; i successivi attendono un nuovo evento
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def replace_watches(self, subscriber, watches, resync=False):
+        result = await self.db.run(_replace_watches, subscriber, watches, resync)
+        self._notify()
+        return result
+
+    async def _run(self):
+        while True:
+            try:
+                await self.check_due()
+                await self.db.run(_trim_events, self.retention)
+            except Exception as e:
+                logger.error(f"Errore nel ciclo di monitoraggio degli elenchi: {e}")
+            await asyncio.sleep(self.tick)
+
+    async def check_due(self):
+        watched = await self.db.run(_watched_listings)
+        # Stesso formato dei tracker del bot: una voce per data seguita
+        self.scheduler.sync({url: [(None, None, concert_date) for concert_date in dates] for url, dates in watched.items()})
+        due = self.scheduler.pop_due()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(url):
+            async with semaphore:
+                changed = False
+                try:
+                    changed = await self._check(url, watched[url])
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Errore durante il monitoraggio di {url}: {e}")
+                finally:
+                    self.scheduler.record_result(url, changed)
+
+        await asyncio.gather(*(check(url) for url in due))
+
+    async def _check(self, url, concert_dates):
+        result = await self.scrape(url)
+        if "error" in result:
+            self.failed += 1
+            logger.warning(f"Monitoraggio di {url} non riuscito: {result['error']}")
+            return False
+        self.checked += 1
+        index = TicketIndex(result.get("ticket_data", []))
+        appended = await self.db.run(
+            _record_listing, url, {concert_date: index.match(concert_date) for concert_date in concert_dates}
+        )
+        if appended:
+            self.events += appended
+            self._notify()
+        return appended > 0
+
+    async def stream(self, subscriber, offset):
+        """Eventi SSE con offset maggiore di `offset`, poi quelli nuovi man mano che arrivano."""
+        self.streams += 1
+        try:
+            oldest, latest = await self.db.run(_offset_range)
+            if offset > latest or (oldest is not None and offset < oldest - 1):
+                # Gli eventi successivi all'offset sono stati eliminati (o l'offset non esiste):
+                # il sottoscrittore deve chiedere un resync degli elenchi completi
+                # "offset" è il punto da cui lo stream riprende, da salvare dopo il resync
+                yield format_sse("reset", {"offset": latest, "requested": offset, "oldest": oldest, "latest": latest}, latest)
+                offset = latest
+            while True:
+                changed = self._changed
+                events = await self.db.run(_events_after, subscriber, offset, STREAM_BATCH)
+                for event in events:
+                    offset = event["offset"]
+                    yield format_sse(event["kind"], event, offset)
+                if len(events) == STREAM_BATCH:
+                    continue
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    # Commento SSE: mantiene viva la connessione attraverso proxy e timeout di lettura
+                    yield ": heartbeat\n\n"
+        finally:
+            self.streams -= 1
+
+    async def stats(self):
+        return {
+            "checked": self.checked,
+            "failed": self.failed,
+            "events_appended": self.events,
+            "open_streams": self.streams,
+            "scheduler": self.scheduler.stats(),
+            **await self.db.run(_stats),
+        }
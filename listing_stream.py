@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+async def parse_sse(lines):
+    """Eventi (tipo, id, dati) da uno stream text/event-stream, riga per riga."""
+    event_type, event_id, data = "message", None, []
+    async for line in lines:
+        if not line:
+            if data:
+                yield event_type, event_id, "\n".join(data)
+            event_type, event_id, data = "message", None, []
+            continue
+        if line.startswith(":"):
+            # Commento (heartbeat)
+            continue
+        field, _, value = line.partition(":")
+        if value.startswith(" "):
+            value = value[1:]
+        if field == "event":
+            event_type = value
+        elif field == "id":
+            event_id = value
+        elif field == "data":
+            data.append(value)
+
+
+class ListingStreamConsumer:
+    """Sottoscrizione del bot alle modifiche degli elenchi monitorati dal microservizio.
+
+    sync() registra le coppie (link, data) seguite dagli utenti; gli eventi
+    arrivano via SSE e vengono applicati uno alla volta, in ordine. handle_event
+    salva l'offset nella stessa transazione di snapshot e notifiche, così dopo
+    una riconnessione lo stream riprende dal primo evento non applicato. Un
+    evento "reset" (eventi non più disponibili sul microservizio) provoca il
+    reinvio degli elenchi completi; il nuovo offset viene salvato con
+    save_offset appena il resync è stato richiesto. Un evento che non può
+    essere applicato viene ritentato (con una nuova connessione) fino a
+    `max_event_attempts` volte, poi scartato salvando l'offset successivo.
+    """
+
+    def __init__(self, client, subscriber, load_offset, save_offset, handle_event, read_timeout,
+                 max_backoff=60, max_event_attempts=3):
+        self.client = client
+        self.subscriber = subscriber
+        self.load_offset = load_offset
+        self.save_offset = save_offset
+        self.handle_event = handle_event
+        self.read_timeout = read_timeout
+        self.max_backoff = max_backoff
+        self.max_event_attempts = max_event_attempts
+        self.watches = None
+        self._resync_pending = False
+        self._reset_offset = None
+        self._failed_offset = None
+        self._failed_attempts = 0
+        self.connected = False
+        self.applied = 0
+        self.skipped = 0
+        self.reconnects = 0
+        self.resyncs = 0
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sync(self, watches, resync=False):
+        """Aggiorna l'insieme delle coppie (link, data) seguite, se è cambiato."""
+        watches = sorted(set(watches))
+        resync = resync or self._resync_pending
+        if watches == self.watches and not resync:
+            return
+        result = await self.client.put(f"subscriptions/{self.subscriber}", {
+            "watches": [{"url": url, "date": concert_date} for url, concert_date in watches],
+            "resync": resync,
+        })
+        self.watches = watches
+        self._resync_pending = False
+        if resync and self._reset_offset is not None:
+            # Nessun evento applicato dopo il reset: lo stream riprenderà da qui
+            await self.save_offset(self._reset_offset)
+            self._reset_offset = None
+        logger.info(
+            f"Sottoscrizione aggiornata: {len(watches)} elenchi seguiti "
+            f"({result.get('added')} aggiunti, {result.get('removed')} rimossi)"
+        )
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                offset = await self.load_offset()
+                async with self.client.events(
+                    f"subscriptions/{self.subscriber}/stream", {"offset": offset}, self.read_timeout
+                ) as response:
+                    self.connected = True
+                    failures = 0
+                    logger.info(f"Stream delle modifiche collegato dall'offset {offset}")
+                    async for event_type, event_id, data in parse_sse(response.aiter_lines()):
+                        if event_type == "reset":
+                            logger.warning(f"Eventi successivi all'offset {offset} non disponibili, richiedo gli elenchi completi")
+                            self.resyncs += 1
+                            self._reset_offset = json.loads(data)["offset"]
+                            if self.watches is None:
+                                # Nessuna sincronizzazione ancora fatta: il resync avverrà con la prima
+                                self._resync_pending = True
+                            else:
+                                await self.sync(self.watches, resync=True)
+                        elif event_type in ("initial", "change"):
+                            await self._apply(event_id, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Stream delle modifiche interrotto ({e!r}), nuovo tentativo")
+            finally:
+                self.connected = False
+            self.reconnects += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_backoff, 2 ** failures)))
+
+    async def _apply(self, event_id, data):
+        try:
+            await self.handle_event(json.loads(data))
+        except Exception as e:
+            attempts = self._failed_attempts + 1 if event_id == self._failed_offset else 1
+            self._failed_offset, self._failed_attempts = event_id, attempts
+            if attempts < self.max_event_attempts:
+                logger.warning(f"Errore nell'applicare l'evento {event_id} (tentativo {attempts}): {e!r}")
+                raise
+            # Evento che non può essere applicato: non deve bloccare lo stream
+            logger.error(f"Evento {event_id} scartato dopo {attempts} tentativi ({e!r}): {data[:500]}")
+            if event_id is not None:
+                await self.save_offset(int(event_id))
+            self.skipped += 1
+        else:
+            self.applied += 1
+        self._failed_offset, self._failed_attempts = None, 0
+        self._reset_offset = None
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "watches": len(self.watches) if self.watches is not None else None,
+            "applied_events": self.applied,
+            "skipped_events": self.skipped,
+            "reconnects": self.reconnects,
+            "resyncs": self.resyncs,
+        }
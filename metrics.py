@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from prometheus_client import Counter, Histogram
+
+# Metriche in formato Prometheus, condivise da scraper_service e bot
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+
+# Microservizio di scraping
+SCRAPE_STAGE_SECONDS = Histogram(
+    "scraper_stage_seconds", "Durata delle fasi di scraping",
+    ["endpoint", "stage"], buckets=STAGE_BUCKETS,
+)
+BROWSER_LAUNCH_SECONDS = Histogram(
+    "scraper_browser_launch_seconds", "Durata dell'avvio di un browser del pool", buckets=STAGE_BUCKETS,
+)
+SCRAPE_RESULTS = Counter(
+    "scraper_results_total", "Esito degli scraping per endpoint e dominio",
+    ["endpoint", "domain", "outcome"],
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "scraper_admission_wait_seconds", "Attesa in coda prima dello scraping, per classe di priorità",
+    ["priority"], buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60),
+)
+ADMISSION_SHED = Counter(
+    "scraper_admission_shed_total", "Richieste rifiutate con 503 perché la coda era piena", ["priority"],
+)
+EXTRACTION_SOURCE = Counter(
+    "scraper_extraction_total", "Origine dei dati estratti: risposta XHR intercettata o DOM",
+    ["endpoint", "source"],
+)
+
+# Bot
+CHECK_CYCLE_SECONDS = Histogram(
+    "bot_check_cycle_seconds", "Durata di un ciclo di controllo dei biglietti",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800),
+)
+CHECK_TRACKERS_PROCESSED = Counter("bot_trackers_processed_total", "Tracker controllati")
+CHECK_LINKS_PROCESSED = Counter("bot_links_processed_total", "Link fanSALE controllati", ["outcome"])
+NOTIFICATIONS_SENT = Counter("bot_notifications_total", "Notifiche Telegram inviate", ["outcome"])
+TELEGRAM_SEND_SECONDS = Histogram(
+    "bot_telegram_send_seconds", "Latenza di send_message verso Telegram",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10),
+)
+
+
+def stage_timer(endpoint, stage):
+    return SCRAPE_STAGE_SECONDS.labels(endpoint, stage).time()
+
+
+def _is_timeout(exc, timeout_errors):
+    # Gli endpoint rilanciano HTTPException "from" l'errore originale
+    while exc is not None:
+        if isinstance(exc, timeout_errors):
+            return True
+        exc = exc.__cause__
+    return False
+
+
+@contextmanager
+def track_scrape(endpoint, url, timeout_errors=(asyncio.TimeoutError,)):
+    """Misura la durata totale di uno scraping e ne conta l'esito (success, failure, timeout, shed)."""
+    domain = urlparse(url).hostname or "unknown"
+    with stage_timer(endpoint, "total"):
+        try:
+            yield
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Le eccezioni possono indicare il proprio esito (es. admission.Overloaded)
+            outcome = getattr(e, "metrics_outcome", None)
+            if outcome is None:
+                outcome = "timeout" if _is_timeout(e, timeout_errors) else "failure"
+            SCRAPE_RESULTS.labels(endpoint, domain, outcome).inc()
+            raise
+    SCRAPE_RESULTS.labels(endpoint, domain, "success").inc()
+
+
+def record_scrape_timeout(endpoint, url):
+    SCRAPE_RESULTS.labels(endpoint, urlparse(url).hostname or "unknown", "timeout").inc()
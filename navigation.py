@@ -0,0 +1,176 @@
+import logging
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Domini di analytics/pubblicità che non servono per lo scraping
+TRACKER_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "criteo.com",
+    "criteo.net",
+    "adnxs.com",
+    "scorecardresearch.com",
+    "taboola.com",
+    "outbrain.com",
+    "bing.com",
+    "tiktok.com",
+    "cdn.cookielaw.org",
+)
+
+# Dimensione media stimata delle risorse bloccate, per il calcolo dei byte risparmiati
+ESTIMATED_RESOURCE_BYTES = {
+    "image": 40_000,
+    "media": 250_000,
+    "font": 35_000,
+    "stylesheet": 25_000,
+    "script": 60_000,
+}
+DEFAULT_RESOURCE_BYTES = 5_000
+
+
+@dataclass(frozen=True)
+class NavigationProfile:
+    name: str
+    blocked_resource_types: frozenset = frozenset()
+    blocked_domains: tuple = ()
+    wait_until: str = "load"
+
+    @property
+    def intercepts(self):
+        return bool(self.blocked_resource_types or self.blocked_domains)
+
+    def blocks(self, request):
+        if request.resource_type in self.blocked_resource_types:
+            return True
+        host = urlparse(request.url).hostname or ""
+        return any(host == domain or host.endswith("." + domain) for domain in self.blocked_domains)
+
+
+PROFILES = {
+    # Comportamento originale: nessun blocco, attende l'evento load
+    "full": NavigationProfile("full"),
+    # Blocca immagini, media, font e tracker; attende solo il DOM
+    "lean": NavigationProfile(
+        "lean",
+        blocked_resource_types=frozenset({"image", "media", "font"}),
+        blocked_domains=TRACKER_DOMAINS,
+        wait_until="domcontentloaded",
+    ),
+    # Come lean, ma blocca anche i fogli di stile (può cambiare il testo visibile di alcune pagine)
+    "strict": NavigationProfile(
+        "strict",
+        blocked_resource_types=frozenset({"image", "media", "font", "stylesheet"}),
+        blocked_domains=TRACKER_DOMAINS,
+        wait_until="domcontentloaded",
+    ),
+}
+
+
+def get_profile(name):
+    profile = PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Profilo di navigazione sconosciuto '{name}', uso 'lean'")
+        profile = PROFILES["lean"]
+    return profile
+
+
+class NavigationStats:
+    """Statistiche di navigazione per endpoint.
+
+    I byte risparmiati sono stimati dal tipo di risorsa bloccata; il tempo
+    risparmiato è calcolato rispetto alla media delle navigazioni con il
+    profilo "full", quando disponibile.
+    """
+
+    def __init__(self, history=50):
+        self.pages = 0
+        self.blocked_requests = 0
+        self.bytes_saved = 0
+        self.goto_seconds = 0.0
+        self.full_goto_seconds = 0.0
+        self.full_pages = 0
+        self.recent = deque(maxlen=history)
+
+    @property
+    def baseline(self):
+        return self.full_goto_seconds / self.full_pages if self.full_pages else None
+
+    def record(self, profile, blocked_requests, bytes_saved, goto_seconds):
+        if profile.name == "full":
+            self.full_pages += 1
+            self.full_goto_seconds += goto_seconds
+        self.pages += 1
+        self.blocked_requests += blocked_requests
+        self.bytes_saved += bytes_saved
+        self.goto_seconds += goto_seconds
+        baseline = self.baseline
+        self.recent.append({
+            "profile": profile.name,
+            "blocked_requests": blocked_requests,
+            "bytes_saved": bytes_saved,
+            "goto_ms": round(goto_seconds * 1000),
+            "time_saved_ms": round((baseline - goto_seconds) * 1000) if baseline is not None and profile.name != "full" else None,
+        })
+
+    def to_dict(self):
+        baseline = self.baseline
+        return {
+            "pages": self.pages,
+            "blocked_requests": self.blocked_requests,
+            "bytes_saved_estimated": self.bytes_saved,
+            "avg_goto_ms": round(self.goto_seconds / self.pages * 1000) if self.pages else None,
+            "full_profile_avg_goto_ms": round(baseline * 1000) if baseline is not None else None,
+            "recent": list(self.recent),
+        }
+
+
+class _PageRouting:
+    """Handler di route di una pagina: registrato una sola volta, usa il profilo dell'ultima navigazione."""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.blocked_requests = 0
+        self.bytes_saved = 0
+
+    async def handle(self, route):
+        request = route.request
+        if self.profile.blocks(request):
+            self.blocked_requests += 1
+            self.bytes_saved += ESTIMATED_RESOURCE_BYTES.get(request.resource_type, DEFAULT_RESOURCE_BYTES)
+            await route.abort()
+        else:
+            await route.continue_()
+
+
+_page_routing = weakref.WeakKeyDictionary()
+
+
+async def goto_with_profile(page, url, profile, stats):
+    """Naviga verso url applicando il profilo di blocco delle risorse."""
+    routing = _page_routing.get(page)
+    if routing is None and profile.intercepts:
+        routing = _page_routing[page] = _PageRouting(profile)
+        await page.route("**/*", routing.handle)
+    if routing is not None:
+        routing.profile = profile
+        routing.blocked_requests = routing.bytes_saved = 0
+
+    start = time.monotonic()
+    response = await page.goto(url, wait_until=profile.wait_until)
+    stats.record(
+        profile,
+        routing.blocked_requests if routing else 0,
+        routing.bytes_saved if routing else 0,
+        time.monotonic() - start,
+    )
+    return response
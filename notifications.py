@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import timedelta
+
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from database import get_due_notifications, delete_notifications, reschedule_notifications, count_pending_notifications
+from metrics import NOTIFICATIONS_SENT, TELEGRAM_SEND_SECONDS
+from rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Lunghezza massima di un messaggio Telegram
+MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+
+def merge_messages(rows):
+    """Unisce i messaggi in attesa per una chat finché stanno in un solo messaggio Telegram.
+
+    rows: lista di (id, testo) in ordine di arrivo. Restituisce (testo, id inclusi);
+    i messaggi esclusi restano in coda per l'invio successivo.
+    """
+    parts = []
+    ids = []
+    length = 0
+    for notification_id, text in rows:
+        text = text[:MAX_MESSAGE_LENGTH]
+        extra = len(text) + (len(MESSAGE_SEPARATOR) if parts else 0)
+        if parts and length + extra > MAX_MESSAGE_LENGTH:
+            break
+        parts.append(text)
+        ids.append(notification_id)
+        length += extra
+    return MESSAGE_SEPARATOR.join(parts), ids
+
+
+class NotificationDispatcher:
+    """Invio delle notifiche Telegram, separato dal ciclo di scraping.
+
+    Le notifiche vengono salvate nella tabella pending_notifications (quindi
+    sopravvivono ai riavvii) e consegnate da un task in background che:
+    rispetta un token bucket globale e uno per chat, unisce i messaggi in
+    attesa per la stessa chat, sospende gli invii per il tempo indicato da
+    RetryAfter e riprova gli errori temporanei con backoff esponenziale.
+    """
+
+    def __init__(self, global_rate, chat_rate, concurrency, max_attempts, retry_backoff, batch_size=500):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.batch_size = batch_size
+        self.bot = None
+        self._chat_buckets = {}
+        self._chat_last_used = {}
+        self._slots = asyncio.Semaphore(concurrency)
+        self._in_flight = set()
+        self._tasks = set()
+        self._wakeup = asyncio.Event()
+        self._paused_until = 0.0
+        self._runner = None
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.dropped = 0
+
+    async def start(self, bot):
+        self.bot = bot
+        pending = await count_pending_notifications()
+        if pending:
+            logger.info(f"{pending} notifiche in attesa dal riavvio precedente")
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Le notifiche non ancora consegnate restano nel database
+        if self._runner is not None:
+            self._runner.cancel()
+            self._runner = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def wake(self):
+        """Segnala che ci sono nuove notifiche da consegnare."""
+        self._wakeup.set()
+
+    def _chat_bucket(self, chat_id):
+        now = time.monotonic()
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 10000:
+                # Un bucket inutilizzato da più di 1/rate secondi è di nuovo pieno: equivale a uno nuovo
+                idle = [chat for chat, used in self._chat_last_used.items() if now - used > 1 / self.chat_rate]
+                for chat in idle:
+                    del self._chat_buckets[chat]
+                    del self._chat_last_used[chat]
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        self._chat_last_used[chat_id] = now
+        return bucket
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                rows = await get_due_notifications(time.time(), list(self._in_flight), self.batch_size)
+            except Exception as e:
+                logger.error(f"Errore durante la lettura delle notifiche in attesa: {e}")
+                rows = []
+
+            by_chat = {}
+            for notification_id, chat_id, text, attempts in rows:
+                by_chat.setdefault(chat_id, []).append((notification_id, text, attempts))
+            for chat_id, notifications in by_chat.items():
+                await self._slots.acquire()
+                self._in_flight.add(chat_id)
+                task = asyncio.create_task(self._deliver(chat_id, notifications))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            if len(rows) < self.batch_size:
+                # Nessun altro messaggio pronto: si attende un nuovo invio in coda o il prossimo retry
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _deliver(self, chat_id, notifications):
+        text, ids = merge_messages([(notification_id, text) for notification_id, text, _ in notifications])
+        attempts = max(attempts for notification_id, _, attempts in notifications if notification_id in ids)
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            # Prima il token della chat: un invio in attesa del proprio limite
+            # non deve trattenere un token globale utilizzabile da altre chat
+            await self._chat_bucket(chat_id).acquire()
+            await self.global_bucket.acquire()
+            with TELEGRAM_SEND_SECONDS.time():
+                await self.bot.send_message(chat_id=chat_id, text=text)
+        except RetryAfter as e:
+            # Limite di Telegram superato: tutti gli invii si fermano per il tempo richiesto
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            logger.warning(f"Limite di invio Telegram raggiunto, pausa di {retry_after} s")
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            await reschedule_notifications(ids, attempts, time.time() + retry_after)
+            self.retried += len(ids)
+            NOTIFICATIONS_SENT.labels("retry").inc(len(ids))
+        except (Forbidden, BadRequest) as e:
+            # Errori permanenti (bot bloccato dall'utente, chat inesistente): nessun nuovo tentativo
+            logger.error(f"Notifica per la chat {chat_id} scartata: {e}")
+            await delete_notifications(ids)
+            self.dropped += len(ids)
+            NOTIFICATIONS_SENT.labels("failure").inc(len(ids))
+        except Exception as e:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                logger.error(f"Notifica per la chat {chat_id} scartata dopo {attempts} tentativi: {e}")
+                await delete_notifications(ids)
+                self.dropped += len(ids)
+                NOTIFICATIONS_SENT.labels("failure").inc(len(ids))
+            else:
+                delay = self.retry_backoff * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+                logger.warning(f"Invio alla chat {chat_id} non riuscito ({e}), nuovo tentativo tra {delay:.0f} s")
+                await reschedule_notifications(ids, attempts, time.time() + delay)
+                self.retried += len(ids)
+                NOTIFICATIONS_SENT.labels("retry").inc(len(ids))
+        else:
+            await delete_notifications(ids)
+            self.sent += 1
+            self.merged += len(ids) - 1
+            NOTIFICATIONS_SENT.labels("success").inc(len(ids))
+        finally:
+            self._in_flight.discard(chat_id)
+            self._slots.release()
+            self._wakeup.set()
+
+    async def stats(self):
+        return {
+            "pending": await count_pending_notifications(),
+            "in_flight": len(self._in_flight),
+            "sent_messages": self.sent,
+            "merged_notifications": self.merged,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "paused_seconds": max(0.0, round(self._paused_until - time.monotonic(), 1)),
+        }
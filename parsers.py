@@ -0,0 +1,260 @@
+import logging
+import re
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Script eseguiti nella pagina con eval_on_selector_all: estraggono tutte le righe
+# in un'unica chiamata e restituiscono JSON; la normalizzazione avviene in Python.
+_TEXT_HELPER = """
+    const text = (...selectors) => {
+        for (const selector of selectors) {
+            const element = entry.querySelector(selector);
+            if (element) return element.innerText;
+        }
+        return null;
+    };
+"""
+
+SUGGESTION_ROWS_JS = """
+entries => entries.map(entry => {%s
+    return {
+        name: text('.Suggestion-Name'),
+        type: text('.Suggestion-Type'),
+        href: entry.getAttribute('href'),
+    };
+})
+""" % _TEXT_HELPER
+
+CONCERT_ROWS_JS = """
+entries => entries.map(entry => {%s
+    return {
+        date: text('.event-listing-date'),
+        month: text('.event-listing-month'),
+        city: text('.event-listing-city'),
+        venue: text('.event-listing-venue'),
+    };
+})
+""" % _TEXT_HELPER
+
+TICKET_ROWS_JS = """
+entries => entries.map(entry => {%s
+    return {
+        classes: entry.getAttribute('class') || '',
+        href: entry.getAttribute('href'),
+        day: text('.EvEntryRow-Day', '.EvEntryRow-SubscriptionDateElement'),
+        name: text('.EvEntryRow-smallSubtitle'),
+        location: text('.EvEntryRow-highlightedTitle'),
+        price: text('.EvEntryRow-moneyValueFormatSmall', '.EvEntryRow-moneyValueFormat'),
+    };
+})
+""" % _TEXT_HELPER
+
+
+def normalize_text(value):
+    """Spazi, a capo e spazi non separabili ridotti a un solo spazio.
+
+    Usata per i campi dei biglietti di entrambi gli engine, così il testo
+    (e quindi ticket_fingerprint) non dipende da come è stato estratto.
+    """
+    if value is None:
+        return None
+    return " ".join(value.split())
+
+
+def _require(row, *fields):
+    missing = [field for field in fields if row.get(field) is None]
+    if missing:
+        raise ValueError(f"elementi mancanti: {', '.join(missing)}")
+
+
+def parse_suggestion_rows(rows):
+    results_list = []
+    for row in rows:
+        _require(row, 'name', 'type')
+        if row['type'] == "Evento":
+            results_list.append((row['name'], row['type'], row['href']))
+    return results_list
+
+
+def parse_concert_rows(rows):
+    concert_list = []
+    for row in rows:
+        try:
+            _require(row, 'date', 'month', 'city', 'venue')
+            date = f"{row['date']} {row['month']}"
+            location = f"{row['city']}, {row['venue']}"
+            if "PACKAGE" in location:
+                continue
+
+            concert_list.append({
+                "date": date,
+                "location": location
+            })
+        except Exception as e:
+            logger.error(f"Errore durante l'estrazione dei dati: {e}")
+    return concert_list
+
+
+# Risposte JSON intercettate (vedi xhr_capture): la struttura non è documentata,
+# quindi si cerca la prima lista di oggetti con i campi attesi. Se non viene
+# trovata si solleva ValueError e lo scraping torna all'estrazione dal DOM.
+WEEKDAYS = ("lun", "mar", "mer", "gio", "ven", "sab", "dom")
+MONTH_NAMES = (
+    "gennaio", "febbraio", "marzo", "aprile", "maggio", "giugno",
+    "luglio", "agosto", "settembre", "ottobre", "novembre", "dicembre",
+)
+
+
+# Chiavi sotto cui una lista vuota indica "nessun risultato"; una lista vuota
+# altrove (es. "errors": []) non dice nulla sui risultati
+RESULT_LIST_KEYS = frozenset({
+    "items", "results", "result", "data", "events", "eventlist", "suggestions", "hits", "products", "records",
+})
+
+
+def _find_items(payload, keys):
+    """Prima lista (anche annidata) di oggetti che hanno almeno uno dei campi `keys`."""
+    empty_found = False
+    stack = [(None, payload)]
+    while stack:
+        parent_key, value = stack.pop(0)
+        if isinstance(value, dict):
+            stack.extend(value.items())
+        elif isinstance(value, list):
+            if not value:
+                if value is payload or str(parent_key).lower() in RESULT_LIST_KEYS:
+                    empty_found = True
+            elif all(isinstance(item, dict) for item in value) and any(key in value[0] for key in keys):
+                return value
+            else:
+                stack.extend((parent_key, item) for item in value)
+    if empty_found:
+        # Nessun risultato per la ricerca
+        return []
+    raise ValueError(f"nessuna lista con i campi {', '.join(keys)}")
+
+
+def _field(item, *keys):
+    for key in keys:
+        value = item.get(key)
+        if value is not None:
+            return value
+    return None
+
+
+def parse_suggestion_json(payload):
+    items = _find_items(payload, ("name", "title", "label"))
+    rows = [{
+        "name": _field(item, "name", "title", "label"),
+        "type": _field(item, "type", "typeName", "category", "kind"),
+        "href": _field(item, "url", "link", "href"),
+    } for item in items]
+    return parse_suggestion_rows(rows)
+
+
+def parse_result_links_json(payload):
+    items = _find_items(payload, ("link", "url", "href"))
+    return [link for link in (_field(item, "link", "url", "href") for item in items) if link]
+
+
+def _format_event_date(value):
+    # "2026-06-12T21:00:00+02:00" -> ("ven 12", "giugno 2026"), come nell'elenco di ticketone
+    try:
+        event_date = datetime.fromisoformat(str(value)[:10]).date()
+    except ValueError as e:
+        raise ValueError(f"data non riconosciuta: {value}") from e
+    return f"{WEEKDAYS[event_date.weekday()]} {event_date.day}", f"{MONTH_NAMES[event_date.month - 1]} {event_date.year}"
+
+
+def parse_concert_json(payload):
+    items = _find_items(payload, ("date", "eventDate", "startDate", "start"))
+    rows = []
+    for item in items:
+        venue = _field(item, "venue", "venueName", "location")
+        city = _field(item, "city", "cityName")
+        if isinstance(venue, dict):
+            city = city or _field(venue, "city", "cityName")
+            venue = _field(venue, "name", "title")
+        date, month = _format_event_date(_field(item, "date", "eventDate", "startDate", "start"))
+        rows.append({"date": date, "month": month, "city": city, "venue": venue})
+    return parse_concert_rows(rows)
+
+
+def normalize_ticket_day(raw_day):
+    raw_day = raw_day.replace('\xa0', ' ').strip()
+
+    match = re.match(r'(\d{1,2})\.? (\w+) ?(\d{4}|\d{2})?', raw_day)
+    if match:
+        day = match.group(1)
+        month = match.group(2)
+        year = match.group(3)
+        if year:
+            full_year = year if len(year) == 4 else f"20{year}"
+            formatted_date = f"{day} {month} {full_year}"
+        else:
+            formatted_date = f"{day} {month}"
+        logger.debug(f"Formatted day: {formatted_date}")
+    else:
+        formatted_date = raw_day
+    return formatted_date
+
+
+_PRICE_NUMBER = re.compile(r'\d[\d.,\s]*')
+# Quantità davanti al prezzo unitario ("2 x € 45,00")
+_PRICE_QUANTITY = re.compile(r'\d+\s*[x×]\s*(?=\D*\d)', re.IGNORECASE)
+
+
+def parse_price_cents(raw_price):
+    """Prezzo in centesimi ("€ 1.234,50" -> 123450), o None se non è riconoscibile.
+
+    Il separatore dei decimali è l'ultimo punto o virgola seguito da una o due
+    cifre; gli altri separano le migliaia. Per più biglietti ("2 x € 45,00")
+    restituisce il prezzo unitario.
+    """
+    if not raw_price:
+        return None
+    text = raw_price.replace('\xa0', ' ')
+    quantity = _PRICE_QUANTITY.search(text)
+    if quantity:
+        text = text[quantity.end():]
+    match = _PRICE_NUMBER.search(text)
+    if not match:
+        return None
+    number = re.sub(r'\s', '', match.group()).rstrip('.,')
+    position = max(number.rfind(','), number.rfind('.'))
+    decimals = number[position + 1:] if position >= 0 else ''
+    if position >= 0 and len(decimals) <= 2:
+        units = re.sub(r'[.,]', '', number[:position])
+        cents = int(decimals.ljust(2, '0'))
+    else:
+        units = re.sub(r'[.,]', '', number)
+        cents = 0
+    return int(units or 0) * 100 + cents
+
+def parse_ticket_rows(rows):
+    ticket_data = []
+    for row in rows:
+        if 'hidden' in row['classes'].split():
+            continue
+        try:
+            logger.debug(f"Found href: {row.get('href')}")
+            _require(row, 'day', 'name', 'location', 'price')
+
+            formatted_date = normalize_ticket_day(normalize_text(row['day']))
+            location = normalize_text(row['location'])
+            logger.debug(f"Extracted name: {normalize_text(row['name'])}, location: {location}")
+            price = normalize_text(row['price'])
+            logger.debug(f"Extracted price: {price}")
+
+            ticket_info = {
+                'day': formatted_date,
+                'location': location,
+                'price': price,
+            }
+            ticket_data.append(ticket_info)
+            logger.info(f"Extracted ticket info: {ticket_info}")
+
+        except Exception as e:
+            logger.error(f"Error durante data extraction: {e}")
+    return ticket_data
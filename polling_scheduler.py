@@ -0,0 +1,172 @@
+import heapq
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+
+from ticket_matching import normalize_date
+
+# Intervallo base di polling in funzione dei giorni mancanti al concerto
+BASE_INTERVALS = (
+    (2, 5 * 60),
+    (7, 10 * 60),
+    (30, 30 * 60),
+    (90, 60 * 60),
+)
+FAR_EVENT_INTERVAL = 3 * 60 * 60
+
+
+@dataclass
+class EventState:
+    link: str
+    days_until: int = None
+    subscribers: int = 0
+    interval: float = 0.0
+    next_due: float = 0.0
+    last_changed: float = None
+    in_flight: bool = False
+
+
+def days_until_concert(concert_dates, today=None):
+    """Giorni mancanti alla data seguita più vicina; None se nessuna data è riconoscibile."""
+    today = today or date.today()
+    days = []
+    for concert_date in concert_dates:
+        normalized = normalize_date(concert_date)
+        if normalized is None:
+            continue
+        day, month, year = normalized
+        try:
+            if year is None:
+                # Senza anno si assume la prossima occorrenza della data
+                candidate = date(today.year, month, day)
+                if candidate < today:
+                    candidate = date(today.year + 1, month, day)
+            else:
+                candidate = date(year, month, day)
+        except ValueError:
+            continue
+        days.append((candidate - today).days)
+    upcoming = [d for d in days if d >= 0]
+    if upcoming:
+        return min(upcoming)
+    return min(days) if days else None
+
+
+class AdaptiveScheduler:
+    """Coda di priorità degli eventi, ordinata per prossima scadenza.
+
+    L'intervallo di ogni evento dipende dai giorni mancanti al concerto,
+    da quanto di recente è cambiato l'elenco dei biglietti e dal numero di
+    iscritti; se la domanda complessiva supera il budget di scraping al
+    minuto, tutti gli intervalli vengono allungati in proporzione.
+    """
+
+    def __init__(self, budget_per_minute, min_interval, max_interval):
+        self.budget_per_minute = budget_per_minute
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._events = {}
+        self._heap = []
+        self._tokens = float(budget_per_minute)
+        self._refilled = time.monotonic()
+        self._dispatched = deque()
+        self._lags = deque(maxlen=500)
+        self._stretch = 1.0
+
+    def base_interval(self, state, now):
+        if state.days_until is None:
+            interval = FAR_EVENT_INTERVAL
+        elif state.days_until < 0:
+            # Concerto passato
+            interval = self.max_interval
+        else:
+            interval = next(
+                (seconds for days, seconds in BASE_INTERVALS if state.days_until <= days),
+                FAR_EVENT_INTERVAL
+            )
+
+        if state.last_changed is not None:
+            since_change = now - state.last_changed
+            if since_change < 3600:
+                interval /= 2
+            elif since_change > 7 * 86400:
+                interval *= 1.5
+        # Più iscritti, controlli più frequenti (con crescita logaritmica)
+        interval /= 1 + math.log10(max(state.subscribers, 1))
+        return interval
+
+    def _interval(self, state, now):
+        interval = self.base_interval(state, now) * self._stretch
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def sync(self, trackers_by_link, now=None):
+        """Allinea la coda con gli eventi seguiti: {link: [(user_id, artist_name, concert_date), ...]}."""
+        now = now if now is not None else time.monotonic()
+        for link in list(self._events):
+            if link not in trackers_by_link:
+                del self._events[link]
+
+        for link, trackers in trackers_by_link.items():
+            state = self._events.get(link)
+            if state is None:
+                state = self._events[link] = EventState(link, next_due=now)
+                heapq.heappush(self._heap, (state.next_due, link))
+            state.subscribers = len(trackers)
+            state.days_until = days_until_concert({concert_date for _, _, concert_date in trackers})
+
+        # Fattore di allungamento per restare nel budget di scraping
+        demand_per_minute = sum(60 / max(self.base_interval(s, now), 1) for s in self._events.values())
+        self._stretch = max(1.0, demand_per_minute / self.budget_per_minute) if self.budget_per_minute else 1.0
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._refilled)
+        self._refilled = now
+        self._tokens = min(float(self.budget_per_minute), self._tokens + elapsed * self.budget_per_minute / 60)
+
+    def pop_due(self, now=None):
+        """Restituisce i link scaduti, nei limiti del budget disponibile."""
+        now = now if now is not None else time.monotonic()
+        self._refill(now)
+        due = []
+        while self._heap and self._heap[0][0] <= now and self._tokens >= 1:
+            next_due, link = heapq.heappop(self._heap)
+            state = self._events.get(link)
+            # Voci obsolete (evento rimosso o riprogrammato) vengono scartate
+            if state is None or state.next_due != next_due or state.in_flight:
+                continue
+            state.in_flight = True
+            self._tokens -= 1
+            self._lags.append(now - next_due)
+            self._dispatched.append(now)
+            due.append(link)
+        return due
+
+    def record_result(self, link, changed, now=None):
+        now = now if now is not None else time.monotonic()
+        state = self._events.get(link)
+        if state is None:
+            return
+        state.in_flight = False
+        if changed:
+            state.last_changed = now
+        state.interval = self._interval(state, now)
+        state.next_due = now + state.interval
+        heapq.heappush(self._heap, (state.next_due, link))
+
+    def stats(self, now=None):
+        now = now if now is not None else time.monotonic()
+        while self._dispatched and self._dispatched[0] < now - 60:
+            self._dispatched.popleft()
+        lags = sorted(self._lags)
+        return {
+            "events": len(self._events),
+            "due": sum(1 for s in self._events.values() if s.next_due <= now and not s.in_flight),
+            "scrapes_last_minute": len(self._dispatched),
+            "budget_per_minute": self.budget_per_minute,
+            "budget_used": len(self._dispatched) / self.budget_per_minute if self.budget_per_minute else None,
+            "interval_stretch": round(self._stretch, 2),
+            "lag_p50_seconds": round(lags[len(lags) // 2], 1) if lags else None,
+            "lag_max_seconds": round(lags[-1], 1) if lags else None,
+        }
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+
+from admission import INTERACTIVE, BACKGROUND, PriorityTicket
+from cache import TTLCache, normalize_key
+
+logger = logging.getLogger(__name__)
+
+
+class ConcertListPrefetcher:
+    """Elenchi dei concerti tenuti in cache dal bot e caricati in anticipo.
+
+    Quando search_event mostra i risultati, gli elenchi dei primi risultati
+    vengono richiesti in background: se l'utente ne sceglie uno,
+    handle_selected_artist riceve il risultato già pronto o si unisce al
+    prefetch in corso. Un prefetch che attende ancora il proprio turno parte
+    subito come interactive; uno già inviato al microservizio non può più
+    cambiare priorità. Il warmer periodico tiene aggiornati gli elenchi
+    degli artisti più seguiti.
+
+    fetch(search_text, priority): le richieste anticipate vengono inviate con
+    priorità background, quelle dell'utente con priorità interactive.
+    """
+
+    def __init__(self, fetch, ttl, max_entries, concurrency):
+        self.fetch = fetch
+        self.cache = TTLCache(ttl=ttl, max_entries=max_entries)
+        # Limite alle richieste in background, per non saturare il microservizio
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self.prefetched = 0
+        self.warmed = 0
+
+    async def _fetch_in_background(self, search_text, ticket):
+        if not await self._acquire_unless_promoted(ticket):
+            ticket.started = True
+            return await self.fetch(search_text, INTERACTIVE)
+        try:
+            ticket.started = True
+            return await self.fetch(search_text, ticket.priority)
+        finally:
+            self._semaphore.release()
+
+    async def _acquire_unless_promoted(self, ticket):
+        """Attende il semaforo; False se nel frattempo il prefetch è stato promosso."""
+        if ticket.promoted.is_set():
+            return False
+        acquire = asyncio.ensure_future(self._semaphore.acquire())
+        promoted = asyncio.ensure_future(ticket.promoted.wait())
+        try:
+            await asyncio.wait((acquire, promoted), return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # cancel() restituisce False se il semaforo è già stato ottenuto
+            if not acquire.cancel():
+                self._semaphore.release()
+            raise
+        finally:
+            promoted.cancel()
+        return not acquire.cancel()
+
+    async def get(self, search_text):
+        return await self.cache.get_or_compute(
+            normalize_key(search_text), lambda: self.fetch(search_text, INTERACTIVE), INTERACTIVE
+        )
+
+    def is_ready(self, search_text):
+        return self.cache.get(normalize_key(search_text)) is not None
+
+    def prefetch(self, search_texts):
+        for search_text in search_texts:
+            ticket = PriorityTicket(BACKGROUND)
+            task = asyncio.create_task(self.cache.get_or_compute(
+                normalize_key(search_text),
+                lambda search_text=search_text, ticket=ticket: self._fetch_in_background(search_text, ticket),
+                ticket
+            ))
+            self._tasks.add(task)
+            task.add_done_callback(self._prefetch_done)
+            self.prefetched += 1
+
+    def _prefetch_done(self, task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Prefetch dell'elenco dei concerti non riuscito: {task.exception()}")
+
+    async def warm(self, search_texts):
+        """Ricarica gli elenchi indicati anche se già in cache, così non scadono."""
+        tickets = [PriorityTicket(BACKGROUND) for _ in search_texts]
+        results = await asyncio.gather(*(
+            self.cache.refresh(
+                normalize_key(search_text),
+                lambda search_text=search_text, ticket=ticket: self._fetch_in_background(search_text, ticket),
+                ticket
+            )
+            for search_text, ticket in zip(search_texts, tickets)
+        ), return_exceptions=True)
+        for search_text, result in zip(search_texts, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Aggiornamento dell'elenco dei concerti di {search_text} non riuscito: {result}")
+            else:
+                self.warmed += 1
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self):
+        return {"prefetched": self.prefetched, "warmed": self.warmed, **self.cache.stats()}
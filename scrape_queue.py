@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Tipi di job supportati dai worker
+SEARCH_TICKETS = "search_tickets"
+SEARCH_ARTIST = "search_artist"
+CONCERT_LIST = "concert_list"
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    payload: dict
+    status: str = QUEUED
+    attempts: int = 0
+    visible_at: float = 0.0
+    result: dict = None
+    error: str = None
+    created_at: float = field(default_factory=time.time)
+
+
+class QueueBackend:
+    """Interfaccia della coda di job di scraping.
+
+    Un job preso in carico (claim) resta invisibile agli altri worker per
+    `visibility_timeout` secondi: se il worker non lo completa in tempo, il
+    job torna disponibile. Dopo `max_attempts` tentativi finisce nella
+    dead-letter (stato "dead"). I job letti o abbandonati dal produttore
+    vengono rimossi con remove; purge elimina quelli rimasti oltre un'età
+    massima (es. produttore terminato mentre attendeva).
+    """
+
+    def __init__(self, visibility_timeout=120, max_attempts=3, retry_backoff=5):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+
+    def enqueue(self, kind, payload):
+        raise NotImplementedError
+
+    def claim(self):
+        raise NotImplementedError
+
+    def complete(self, job_id, result):
+        raise NotImplementedError
+
+    def fail(self, job_id, error):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        raise NotImplementedError
+
+    def get_many(self, job_ids):
+        """{id: Job} dei job indicati ancora presenti nella coda."""
+        raise NotImplementedError
+
+    def remove(self, job_ids):
+        """Rimuove i job indicati, in qualunque stato: un worker che li sta eseguendo non trova più il job."""
+        raise NotImplementedError
+
+    def purge(self, max_age):
+        """Rimuove i job creati da più di `max_age` secondi; restituisce quanti ne ha rimossi."""
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def _next_state_after_failure(self, attempts, now):
+        if attempts >= self.max_attempts:
+            return DEAD, now
+        return QUEUED, now + self.retry_backoff * attempts
+
+
+class InMemoryQueue(QueueBackend):
+    """Coda in memoria, per produttore e worker nello stesso processo."""
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, kind, payload):
+        job = Job(id=uuid.uuid4().hex, kind=kind, payload=payload)
+        with self._lock:
+            self._jobs[job.id] = job
+        return job.id
+
+    def claim(self):
+        now = time.time()
+        with self._lock:
+            for job in sorted(self._jobs.values(), key=lambda j: j.created_at):
+                if job.status not in (QUEUED, RUNNING) or job.visible_at > now:
+                    continue
+                if job.status == RUNNING and job.attempts >= self.max_attempts:
+                    # Lease scaduto all'ultimo tentativo
+                    job.status, job.error = DEAD, job.error or "visibility timeout"
+                    continue
+                job.status = RUNNING
+                job.attempts += 1
+                job.visible_at = now + self.visibility_timeout
+                return Job(**job.__dict__)
+        return None
+
+    def complete(self, job_id, result):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status == RUNNING:
+                job.status, job.result, job.error = DONE, result, None
+
+    def fail(self, job_id, error):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status == RUNNING:
+                job.status, job.visible_at = self._next_state_after_failure(job.attempts, time.time())
+                job.error = error
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return Job(**job.__dict__) if job is not None else None
+
+    def get_many(self, job_ids):
+        with self._lock:
+            return {
+                job_id: Job(**self._jobs[job_id].__dict__)
+                for job_id in job_ids if job_id in self._jobs
+            }
+
+    def remove(self, job_ids):
+        with self._lock:
+            for job_id in job_ids:
+                self._jobs.pop(job_id, None)
+
+    def purge(self, max_age):
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.created_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            return len(expired)
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, DEAD: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+
+class SQLiteQueue(QueueBackend):
+    """Coda su file SQLite condiviso tra il bot e più processi worker."""
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS scrape_jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    visible_at REAL NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_scrape_jobs_claim ON scrape_jobs(status, visible_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_scrape_jobs_created ON scrape_jobs(created_at)')
+
+    def _connection(self):
+        # Una connessione per thread; BEGIN IMMEDIATE serializza i claim tra processi
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return _Transaction(conn)
+
+    def enqueue(self, kind, payload):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute('''
+                INSERT INTO scrape_jobs (id, kind, payload, status, visible_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (job_id, kind, json.dumps(payload), QUEUED, now, now))
+        return job_id
+
+    def claim(self):
+        now = time.time()
+        with self._connection() as conn:
+            # Lease scaduti all'ultimo tentativo finiscono nella dead-letter
+            conn.execute('''
+                UPDATE scrape_jobs SET status = ?, error = COALESCE(error, 'visibility timeout')
+                WHERE status = ? AND visible_at <= ? AND attempts >= ?
+            ''', (DEAD, RUNNING, now, self.max_attempts))
+            row = conn.execute('''
+                SELECT id FROM scrape_jobs
+                WHERE status IN (?, ?) AND visible_at <= ?
+                ORDER BY created_at LIMIT 1
+            ''', (QUEUED, RUNNING, now)).fetchone()
+            if row is None:
+                return None
+            conn.execute('''
+                UPDATE scrape_jobs SET status = ?, attempts = attempts + 1, visible_at = ?
+                WHERE id = ?
+            ''', (RUNNING, now + self.visibility_timeout, row[0]))
+            return self._get(conn, row[0])
+
+    def complete(self, job_id, result):
+        with self._connection() as conn:
+            conn.execute('''
+                UPDATE scrape_jobs SET status = ?, result = ?, error = NULL
+                WHERE id = ? AND status = ?
+            ''', (DONE, json.dumps(result), job_id, RUNNING))
+
+    def fail(self, job_id, error):
+        with self._connection() as conn:
+            row = conn.execute(
+                'SELECT attempts FROM scrape_jobs WHERE id = ? AND status = ?', (job_id, RUNNING)
+            ).fetchone()
+            if row is None:
+                return
+            status, visible_at = self._next_state_after_failure(row[0], time.time())
+            conn.execute('''
+                UPDATE scrape_jobs SET status = ?, visible_at = ?, error = ? WHERE id = ?
+            ''', (status, visible_at, error, job_id))
+
+    _COLUMNS = 'id, kind, payload, status, attempts, visible_at, result, error, created_at'
+
+    def _get(self, conn, job_id):
+        row = conn.execute(f'SELECT {self._COLUMNS} FROM scrape_jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._job(row) if row is not None else None
+
+    @staticmethod
+    def _job(row):
+        return Job(
+            id=row[0], kind=row[1], payload=json.loads(row[2]), status=row[3], attempts=row[4],
+            visible_at=row[5], result=json.loads(row[6]) if row[6] else None, error=row[7], created_at=row[8],
+        )
+
+    def get(self, job_id):
+        with self._connection() as conn:
+            return self._get(conn, job_id)
+
+    def get_many(self, job_ids):
+        jobs = {}
+        with self._connection() as conn:
+            # A blocchi, entro il limite di parametri di SQLite
+            for i in range(0, len(job_ids), 500):
+                chunk = job_ids[i:i + 500]
+                rows = conn.execute(
+                    f'SELECT {self._COLUMNS} FROM scrape_jobs WHERE id IN ({", ".join("?" * len(chunk))})', chunk
+                )
+                jobs.update((row[0], self._job(row)) for row in rows)
+        return jobs
+
+    def remove(self, job_ids):
+        with self._connection() as conn:
+            conn.executemany('DELETE FROM scrape_jobs WHERE id = ?', [(job_id,) for job_id in job_ids])
+
+    def purge(self, max_age):
+        with self._connection() as conn:
+            return conn.execute('DELETE FROM scrape_jobs WHERE created_at < ?', (time.time() - max_age,)).rowcount
+
+    def stats(self):
+        with self._connection() as conn:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, DEAD: 0}
+            for status, count in conn.execute('SELECT status, COUNT(*) FROM scrape_jobs GROUP BY status'):
+                counts[status] = count
+            return counts
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+def create_queue(backend, path, **options):
+    if backend == "memory":
+        return InMemoryQueue(**options)
+    if backend == "sqlite":
+        return SQLiteQueue(path, **options)
+    raise ValueError(f"Backend della coda sconosciuto: {backend}")
+
+
+class JobFailed(Exception):
+    pass
+
+
+class JobWaiter:
+    """Accoda job e ne attende i risultati (lato produttore, es. il bot).
+
+    Un solo task legge lo stato di tutti i job in attesa con una query ogni
+    `poll_interval` secondi, invece di un polling per job. I risultati letti
+    e i job di chi ha smesso di attendere (timeout, cancellazione) vengono
+    rimossi dalla coda nella stessa passata.
+    """
+
+    def __init__(self, queue, poll_interval=0.2):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self._pending = {}
+        self._abandoned = set()
+        self._task = None
+
+    async def run(self, kind, payload, timeout):
+        job_id = await asyncio.to_thread(self.queue.enqueue, kind, payload)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[job_id] = future
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._poll())
+        try:
+            job = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"nessun risultato per il job {job_id} entro {timeout} s") from None
+        finally:
+            if self._pending.pop(job_id, None) is not None:
+                self._abandoned.add(job_id)
+        if job.status == DEAD:
+            raise JobFailed(f"job {job_id} fallito dopo {job.attempts} tentativi: {job.error}")
+        return job.result
+
+    async def _poll(self):
+        while self._pending or self._abandoned:
+            await asyncio.sleep(self.poll_interval)
+            abandoned, self._abandoned = self._abandoned, set()
+            job_ids = list(self._pending)
+            try:
+                jobs = await asyncio.to_thread(self.queue.get_many, job_ids) if job_ids else {}
+                finished = [job for job in jobs.values() if job.status in (DONE, DEAD)]
+                to_remove = [job.id for job in finished] + list(abandoned)
+                if to_remove:
+                    await asyncio.to_thread(self.queue.remove, to_remove)
+            except Exception as e:
+                logger.error(f"Errore durante la lettura dei risultati dalla coda: {e}")
+                self._abandoned |= abandoned
+                continue
+
+            for job in finished:
+                future = self._pending.pop(job.id, None)
+                if future is not None and not future.done():
+                    future.set_result(job)
+            for job_id in job_ids:
+                future = self._pending.get(job_id)
+                if job_id not in jobs and future is not None and not future.done():
+                    # Rimosso da purge o da un altro produttore
+                    del self._pending[job_id]
+                    future.set_exception(JobFailed(f"job {job_id} non più presente nella coda"))
+
+    def stats(self):
+        return {"pending": len(self._pending), "abandoned": len(self._abandoned)}
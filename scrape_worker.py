@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import os
+import socket
+
+from fastapi import HTTPException
+
+import scraper_service
+from admission import INTERACTIVE, PriorityTicket, parse_priority
+from config import (
+    SCRAPE_QUEUE_BACKEND, SCRAPE_QUEUE_PATH, SCRAPE_QUEUE_VISIBILITY_TIMEOUT, SCRAPE_QUEUE_MAX_ATTEMPTS,
+    SCRAPE_QUEUE_JOB_TTL, WORKER_CONCURRENCY, WORKER_POLL_INTERVAL
+)
+from scrape_queue import SEARCH_TICKETS, SEARCH_ARTIST, CONCERT_LIST, create_queue
+
+# python scrape_worker.py   (avviare più processi per aggiungere capacità di scraping)
+
+logger = logging.getLogger(__name__)
+
+
+async def execute_job(job):
+    if job.kind == SEARCH_TICKETS:
+        return await scraper_service.scrape_tickets(job.payload["url"])
+    # Priorità indicata dal bot (es. background per i prefetch), come l'header x-priority
+    priority = PriorityTicket(parse_priority(job.payload.get("priority"), INTERACTIVE))
+    if job.kind == SEARCH_ARTIST:
+        artist_name = job.payload["artist_name"]
+        return await scraper_service.artist_cache.get_or_compute(
+            scraper_service.normalize_key(artist_name), lambda: scraper_service.scrape_artist(artist_name, priority),
+            priority
+        )
+    if job.kind == CONCERT_LIST:
+        search_text = job.payload["search_text"]
+        return await scraper_service.concert_list_cache.get_or_compute(
+            scraper_service.normalize_key(search_text),
+            lambda: scraper_service.scrape_concert_list(search_text, priority),
+            priority
+        )
+    raise ValueError(f"Tipo di job sconosciuto: {job.kind}")
+
+
+async def worker_loop(queue, worker_name):
+    while True:
+        job = await asyncio.to_thread(queue.claim)
+        if job is None:
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        logger.info(f"{worker_name}: job {job.id} ({job.kind}), tentativo {job.attempts}")
+        try:
+            result = await asyncio.wait_for(execute_job(job), timeout=queue.visibility_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"{worker_name}: timeout del job {job.id}")
+            await asyncio.to_thread(queue.fail, job.id, "timeout")
+        except HTTPException as e:
+            await asyncio.to_thread(queue.fail, job.id, str(e.detail))
+        except Exception as e:
+            logger.error(f"{worker_name}: errore nel job {job.id}: {e}")
+            await asyncio.to_thread(queue.fail, job.id, str(e))
+        else:
+            await asyncio.to_thread(queue.complete, job.id, result)
+
+
+async def purge_loop(queue, max_age):
+    # Pulizia periodica dei job scaduti; con più worker la DELETE è idempotente
+    while True:
+        try:
+            purged = await asyncio.to_thread(queue.purge, max_age)
+            if purged:
+                logger.info(f"Rimossi {purged} job più vecchi di {max_age:.0f} s")
+        except Exception as e:
+            logger.error(f"Errore durante la pulizia della coda: {e}")
+        await asyncio.sleep(max(max_age / 10, 1))
+
+
+async def run_worker(queue, concurrency=WORKER_CONCURRENCY):
+    """Esegue i job della coda usando il browser pool e il client HTTP del microservizio."""
+    worker_name = f"{socket.gethostname()}-{os.getpid()}"
+    async with scraper_service.lifespan(scraper_service.app):
+        logger.info(f"Worker {worker_name} avviato con concorrenza {concurrency}")
+        await asyncio.gather(
+            purge_loop(queue, SCRAPE_QUEUE_JOB_TTL),
+            *(worker_loop(queue, f"{worker_name}/{i}") for i in range(concurrency)),
+        )
+
+
+def main():
+    queue = create_queue(
+        SCRAPE_QUEUE_BACKEND,
+        SCRAPE_QUEUE_PATH,
+        visibility_timeout=SCRAPE_QUEUE_VISIBILITY_TIMEOUT,
+        max_attempts=SCRAPE_QUEUE_MAX_ATTEMPTS,
+    )
+    asyncio.run(run_worker(queue))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Risposte che indicano un microservizio (o proxy) temporaneamente non raggiungibile.
+# Un 500 è un errore dello scraping della singola richiesta: non viene ritentato
+# e non conta per il circuit breaker
+RETRYABLE_STATUS_CODES = {502, 503, 504}
+# Errori di rete per cui la richiesta non è arrivata al microservizio (o la
+# connessione keep-alive era già chiusa). Un ReadTimeout non viene ritentato:
+# lo scraping potrebbe essere ancora in corso e l'utente attenderebbe più timeout
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+# Attesa massima rispettata per l'header Retry-After di un 503 (secondi)
+MAX_RETRY_AFTER = 10
+
+
+def _overloaded(response):
+    # 503 con Retry-After: il microservizio è attivo ma ha la coda piena (vedi admission.py)
+    return response.status_code == 503 and "retry-after" in response.headers
+
+
+def _retry_after(response):
+    try:
+        return min(MAX_RETRY_AFTER, float(response.headers["retry-after"]))
+    except (KeyError, ValueError):
+        return 0.0
+
+
+class CircuitOpen(Exception):
+    """Il microservizio di scraping è considerato non disponibile: la richiesta non viene inviata."""
+
+
+class CircuitBreaker:
+    """Dopo `failure_threshold` errori consecutivi blocca le richieste per `reset_timeout` secondi.
+
+    Trascorso il timeout lascia passare una sola richiesta di prova: se va a
+    buon fine il circuito si richiude, altrimenti resta aperto.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+
+    def before_call(self):
+        if self.state == self.CLOSED:
+            return
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return
+        self.rejected += 1
+        raise CircuitOpen("microservizio di scraping non disponibile")
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Microservizio di scraping di nuovo raggiungibile, circuito chiuso")
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def release_trial(self):
+        """Richiesta di prova interrotta senza esito (es. cancellata): la prossima richiesta può riprovare."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic() - self.reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuito aperto dopo {self.failures} errori del microservizio di scraping")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class ScraperClient:
+    """Client HTTP condiviso verso il microservizio di scraping.
+
+    Un solo httpx.AsyncClient per tutta la vita del bot (connessioni keep-alive
+    riutilizzate, HTTP/2 se richiesto e disponibile), timeout di lettura per
+    endpoint, retry con jitter per le chiamate idempotenti e circuit breaker.
+    """
+
+    def __init__(self, base_url, api_key, connect_timeout, read_timeouts, retries, retry_backoff,
+                 breaker, http2=False, max_connections=20):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeouts = read_timeouts
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker
+        self.http2 = http2
+        self.max_connections = max_connections
+        self._client = None
+        self.requests = 0
+        self.retried = 0
+
+    async def start(self):
+        http2 = self.http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("Pacchetto h2 non installato: uso HTTP/1.1 con keep-alive")
+                http2 = False
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={"x-api-key": self.api_key or ""},
+            http2=http2,
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+        )
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _timeout(self, endpoint):
+        return httpx.Timeout(self.connect_timeout, read=self.read_timeouts.get(endpoint, 30.0))
+
+    def _backoff(self, attempt):
+        # Full jitter: richieste ritentate da più handler non si ripresentano insieme
+        return random.uniform(0, self.retry_backoff * 2 ** attempt)
+
+    def _headers(self, priority):
+        return {"x-priority": priority} if priority else None
+
+    async def post(self, endpoint, payload, priority=None):
+        """POST idempotente con retry sugli errori di connessione e sulle risposte 502/503/504."""
+        return await self.request("POST", endpoint, payload, priority)
+
+    async def put(self, endpoint, payload):
+        return await self.request("PUT", endpoint, payload)
+
+    async def request(self, method, endpoint, payload, priority=None):
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            self.requests += 1
+            delay = self._backoff(attempt)
+            try:
+                response = await self._client.request(
+                    method, f"/{endpoint}", json=payload, headers=self._headers(priority), timeout=self._timeout(endpoint)
+                )
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt == self.retries or not isinstance(e, RETRYABLE_ERRORS):
+                    raise
+                logger.warning(f"Errore di connessione verso /{endpoint} ({e!r}), nuovo tentativo")
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    self.breaker.record_success()
+                    response.raise_for_status()
+                    return response.json()
+                if _overloaded(response):
+                    # Servizio raggiungibile ma saturo: non è un guasto per il circuit breaker
+                    self.breaker.record_success()
+                    delay = max(delay, _retry_after(response))
+                else:
+                    self.breaker.record_failure()
+                if attempt == self.retries:
+                    response.raise_for_status()
+                logger.warning(f"HTTP {response.status_code} da /{endpoint}, nuovo tentativo")
+            self.retried += 1
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, endpoint, payload, priority=None):
+        """POST con risposta in streaming (senza retry: le righe già ricevute sono state elaborate)."""
+        self.breaker.before_call()
+        self.requests += 1
+        try:
+            async with self._client.stream(
+                "POST", f"/{endpoint}", json=payload, headers=self._headers(priority), timeout=self._timeout(endpoint)
+            ) as response:
+                if response.status_code in RETRYABLE_STATUS_CODES and not _overloaded(response):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                response.raise_for_status()
+                yield response
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    @asynccontextmanager
+    async def events(self, endpoint, params, read_timeout):
+        """GET di uno stream di lunga durata (Server-Sent Events), senza retry.
+
+        read_timeout deve superare l'intervallo degli heartbeat del server.
+        """
+        self.breaker.before_call()
+        self.requests += 1
+        timeout = httpx.Timeout(self.connect_timeout, read=read_timeout)
+        try:
+            async with self._client.stream("GET", f"/{endpoint}", params=params, timeout=timeout) as response:
+                if response.status_code in RETRYABLE_STATUS_CODES and not _overloaded(response):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                response.raise_for_status()
+                yield response
+        except httpx.TransportError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.release_trial()
+            raise
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "retried": self.retried,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "rejected": self.breaker.rejected,
+        }
@@ -1,11 +1,44 @@
 import logging
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from pydantic import BaseModel
 from typing import List, Optional
 import asyncio
-from playwright.async_api import async_playwright
-import re
-from config import API_KEY
+import json
+import time
+from contextlib import asynccontextmanager, nullcontext
+from urllib.parse import urljoin
+from admission import PriorityAdmission, PriorityTicket, Overloaded, INTERACTIVE, BACKGROUND, parse_priority
+from browser_pool import BrowserPool
+from listing_monitor import ListingMonitor
+from listing_history import ListingHistory
+from polling_scheduler import AdaptiveScheduler
+from cache import TTLCache, normalize_key
+from parsers import (
+    SUGGESTION_ROWS_JS, CONCERT_ROWS_JS, TICKET_ROWS_JS,
+    parse_suggestion_rows, parse_concert_rows, parse_ticket_rows,
+    parse_suggestion_json, parse_result_links_json, parse_concert_json
+)
+from http_scraper import HttpScraper, FallbackRequired
+from rate_limit import HostRateLimiter
+from ticket_matching import match_tickets as match_tickets_by_date
+from navigation import NavigationStats, get_profile, goto_with_profile
+from metrics import stage_timer, track_scrape, record_scrape_timeout, EXTRACTION_SOURCE
+from xhr_capture import capture_json, response_matcher, wait_json_or_selector
+from config import (
+    API_KEY, BROWSER_POOL_SIZE, BROWSER_MAX_PAGES, BROWSER_MAX_USES,
+    ARTIST_CACHE_TTL, ARTIST_CACHE_SIZE, CONCERT_LIST_CACHE_TTL, CONCERT_LIST_CACHE_SIZE,
+    NAV_PROFILE_SEARCH_ARTIST, NAV_PROFILE_CONCERT_LIST, NAV_PROFILE_SEARCH_TICKETS, SCRAPE_ENGINE,
+    HOST_RATE_LIMIT, BATCH_CONCURRENCY, BATCH_URL_TIMEOUT, FANSALE_SEARCH_URL, TICKETONE_URL,
+    SCRAPE_EXTRACTION, XHR_CAPTURE_TIMEOUT, XHR_FANSALE_SUGGEST_PATTERN, XHR_TICKETONE_SUGGEST_PATTERN,
+    XHR_TICKETONE_LISTING_PATTERN, ADMISSION_CAPACITY, ADMISSION_RESERVED_INTERACTIVE,
+    ADMISSION_MAX_QUEUE_INTERACTIVE, ADMISSION_MAX_QUEUE_BACKGROUND, STREAM_ENABLED, STREAM_DB_PATH,
+    STREAM_HEARTBEAT, STREAM_RETENTION_EVENTS, SCHEDULER_TICK, SCRAPE_BUDGET_PER_MINUTE,
+    POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, HISTORY_ENABLED, HISTORY_DB_PATH, HISTORY_FLUSH_INTERVAL,
+    HISTORY_COMPACT_INTERVAL, HISTORY_BUCKET_SECONDS, HISTORY_DOWNSAMPLE_AFTER, HISTORY_RETENTION
+)
 
 # uvicorn scraper_service:app --host 0.0.0.0 --port 8000
 
@@ -13,7 +46,75 @@ from config import API_KEY
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Scraper Microservice")
+browser_pool = BrowserPool(
+    size=BROWSER_POOL_SIZE,
+    max_pages=BROWSER_MAX_PAGES,
+    max_uses=BROWSER_MAX_USES,
+)
+
+# Le ricerche degli utenti hanno la precedenza sui controlli periodici (header x-priority)
+admission = PriorityAdmission(
+    ADMISSION_CAPACITY,
+    ADMISSION_RESERVED_INTERACTIVE,
+    {INTERACTIVE: ADMISSION_MAX_QUEUE_INTERACTIVE, BACKGROUND: ADMISSION_MAX_QUEUE_BACKGROUND},
+)
+
+http_scraper = HttpScraper()
+host_rate_limiter = HostRateLimiter(HOST_RATE_LIMIT)
+
+# Cache dei risultati delle ricerche interattive, una per endpoint
+artist_cache = TTLCache(ttl=ARTIST_CACHE_TTL, max_entries=ARTIST_CACHE_SIZE)
+concert_list_cache = TTLCache(ttl=CONCERT_LIST_CACHE_TTL, max_entries=CONCERT_LIST_CACHE_SIZE)
+
+# Profilo di navigazione e relative statistiche, per endpoint
+navigation = {
+    "search_artist": (get_profile(NAV_PROFILE_SEARCH_ARTIST), NavigationStats()),
+    "write_to_searchbar_and_click_first_result": (get_profile(NAV_PROFILE_CONCERT_LIST), NavigationStats()),
+    "search_tickets": (get_profile(NAV_PROFILE_SEARCH_TICKETS), NavigationStats()),
+}
+
+# Storico di tutti gli elenchi letti da search_tickets, batch e monitoraggio
+listing_history = ListingHistory(
+    HISTORY_DB_PATH,
+    flush_interval=HISTORY_FLUSH_INTERVAL,
+    compact_interval=HISTORY_COMPACT_INTERVAL,
+    bucket=HISTORY_BUCKET_SECONDS,
+    downsample_after=HISTORY_DOWNSAMPLE_AFTER,
+    retention=HISTORY_RETENTION,
+) if HISTORY_ENABLED else None
+
+# Errori conteggiati come timeout nelle metriche di scraping
+SCRAPE_TIMEOUT_ERRORS = (PlaywrightTimeoutError, asyncio.TimeoutError)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Il pool di browser e il client HTTP vivono quanto l'applicazione
+    await browser_pool.start()
+    await http_scraper.start()
+    if listing_history is not None:
+        await listing_history.start()
+    if listing_monitor is not None:
+        await listing_monitor.start()
+    try:
+        yield
+    finally:
+        if listing_monitor is not None:
+            await listing_monitor.stop()
+        if listing_history is not None:
+            await listing_history.stop()
+        await http_scraper.stop()
+        await browser_pool.stop()
+
+app = FastAPI(title="Scraper Microservice", lifespan=lifespan)
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    logger.warning(f"Richiesta {exc.priority} rifiutata, coda piena (Retry-After {exc.retry_after} s)")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service overloaded"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # Definizione dei modelli di richiesta
 class SearchArtistRequest(BaseModel):
@@ -25,6 +126,18 @@ class WriteToSearchbarRequest(BaseModel):
 class SearchTicketsRequest(BaseModel):
     url: str
 
+class SearchTicketsBatchRequest(BaseModel):
+    urls: List[str]
+
+class ListingWatch(BaseModel):
+    url: str
+    date: str
+
+class SubscriptionRequest(BaseModel):
+    watches: List[ListingWatch]
+    # Reinvia l'elenco completo di tutte le coppie seguite (es. dopo un evento "reset")
+    resync: bool = False
+
 class MatchTicketsRequest(BaseModel):
     tickets: List[dict]
     user_ticket: str
@@ -35,183 +148,332 @@ async def verify_api_key(x_api_key: str = Header(...)):
         logger.warning(f"Tentativo di accesso non autorizzato con API Key: {x_api_key}")
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+def _parse_captured(parse, payload, description):
+    # None se la risposta non è arrivata o non ha la struttura attesa: si usa il DOM
+    if payload is None:
+        return None
+    try:
+        return parse(payload)
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"Risposta JSON {description} non riconosciuta ({e}), uso il DOM")
+        return None
+
+@asynccontextmanager
+async def browser_page(priority):
+    # Slot di ammissione per la classe di priorità, poi una pagina del pool
+    async with admission.slot(priority):
+        async with browser_pool.page() as page:
+            yield page
+
+async def scrape_artist(artist_name, priority=INTERACTIVE):
+    with track_scrape("search_artist", FANSALE_SEARCH_URL, SCRAPE_TIMEOUT_ERRORS):
+        async with browser_page(priority) as page:
+            try:
+                with stage_timer("search_artist", "goto"):
+                    await goto_with_profile(page, FANSALE_SEARCH_URL, *navigation["search_artist"])
+                with stage_timer("search_artist", "selector_wait"):
+                    await page.wait_for_selector("#headerSearchbarMainField", timeout=7000)
+                search_box = await page.query_selector("#headerSearchbarMainField")
+                await search_box.fill("")
+
+                if SCRAPE_EXTRACTION == "xhr":
+                    # I suggerimenti arrivano dalla risposta dell'autocomplete, senza attendere il dropdown
+                    with capture_json(page, response_matcher(XHR_FANSALE_SUGGEST_PATTERN, artist_name)) as capture:
+                        await search_box.type(artist_name)
+                        with stage_timer("search_artist", "xhr_wait"):
+                            payload = await capture.wait(XHR_CAPTURE_TIMEOUT)
+                    results_list = _parse_captured(parse_suggestion_json, payload, "dei suggerimenti di fanSALE")
+                    if results_list is not None:
+                        EXTRACTION_SOURCE.labels("search_artist", "xhr").inc()
+                        return {"results_list": results_list}
+                else:
+                    await search_box.type(artist_name)
+                    await asyncio.sleep(0.8)
+
+                with stage_timer("search_artist", "selector_wait"):
+                    await page.wait_for_selector(".Header-SuggestionList", timeout=7000)
+                suggestion_list = await page.query_selector(".Header-SuggestionList")
+
+                with stage_timer("search_artist", "extraction"):
+                    rows = await suggestion_list.eval_on_selector_all(
+                        "li.SuggestionList-Suggestion a.Suggestion-Link", SUGGESTION_ROWS_JS
+                    )
+                    results_list = parse_suggestion_rows(rows)
+                EXTRACTION_SOURCE.labels("search_artist", "dom").inc()
+
+                return {"results_list": results_list}
+            except Exception as e:
+                logger.error(f"Errore durante la ricerca: {e}")
+                raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
 @app.post("/search_artist", dependencies=[Depends(verify_api_key)])
-async def search_artist(request: SearchArtistRequest):
+async def search_artist(request: SearchArtistRequest, x_priority: Optional[str] = Header(None)):
     artist_name = request.artist_name
-    results_list = []
-    async with async_playwright() as p:
-        browser = await p.firefox.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        try:
-            await page.goto("https://www.fansale.it/event")
-            await page.wait_for_selector("#headerSearchbarMainField", timeout=7000)
-            search_box = await page.query_selector("#headerSearchbarMainField")
-            await search_box.fill("")
-            await search_box.type(artist_name)
-
-            await asyncio.sleep(0.8)
-            
-
-            await page.wait_for_selector(".Header-SuggestionList", timeout=7000)
-            suggestion_list = await page.query_selector(".Header-SuggestionList")
-
-            results = await suggestion_list.query_selector_all("li.SuggestionList-Suggestion a.Suggestion-Link")
-
-            for result in results:
-                result_name_element = await result.query_selector(".Suggestion-Name")
-                result_name = await result_name_element.inner_text()
-
-                result_type_element = await result.query_selector(".Suggestion-Type")
-                result_type = await result_type_element.inner_text()
-
-                result_link = await result.get_attribute("href")
-                
-                if result_type == "Evento":
-                    results_list.append((result_name, result_type, result_link))
-
-            return {"results_list": results_list}
-        except Exception as e:
-            logger.error(f"Errore durante la ricerca: {e}")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
-        finally:
-            await browser.close()
+    # Ticket condiviso con le richieste che si uniranno allo scraping (vedi TTLCache)
+    priority = PriorityTicket(parse_priority(x_priority, INTERACTIVE))
+    return await artist_cache.get_or_compute(
+        normalize_key(artist_name), lambda: scrape_artist(artist_name, priority), priority
+    )
+
+async def scrape_concert_list(search_text, priority=INTERACTIVE):
+    endpoint = "write_to_searchbar_and_click_first_result"
+    with track_scrape(endpoint, TICKETONE_URL, SCRAPE_TIMEOUT_ERRORS):
+        concert_list = []
+        use_xhr = SCRAPE_EXTRACTION == "xhr"
+        async with browser_page(priority) as page:
+            try:
+                with stage_timer(endpoint, "goto"):
+                    await goto_with_profile(page, TICKETONE_URL, *navigation[endpoint])
+
+                with stage_timer(endpoint, "selector_wait"):
+                    await page.wait_for_selector("#searchterm", timeout=15000)
+                search_input = await page.query_selector("#searchterm")
+                await search_input.fill("")
+
+                first_link = None
+                if use_xhr:
+                    with capture_json(page, response_matcher(XHR_TICKETONE_SUGGEST_PATTERN, search_text)) as capture:
+                        await search_input.type(search_text)
+                        with stage_timer(endpoint, "xhr_wait"):
+                            payload = await capture.wait(XHR_CAPTURE_TIMEOUT)
+                    links = _parse_captured(parse_result_links_json, payload, "dei suggerimenti di ticketone")
+                    if links == []:
+                        logger.warning("Nessun risultato trovato nella ricerca")
+                        return {"concert_list": concert_list}
+                    if links:
+                        first_link = urljoin(page.url, links[0])
+                else:
+                    await search_input.type(search_text)
+                    await asyncio.sleep(1)
+
+                first_result = None
+                if first_link is None:
+                    with stage_timer(endpoint, "selector_wait"):
+                        await page.wait_for_selector("#suggest-list", timeout=15000)
+                    suggestions = await page.query_selector("#suggest-list")
+
+                    first_result = await suggestions.query_selector('result-item a.as-result-link')
+                    if not first_result:
+                        logger.warning("Nessun risultato trovato nella ricerca")
+                        return {"concert_list": concert_list}
+
+                payload = None
+                listing_capture = (
+                    capture_json(page, response_matcher(XHR_TICKETONE_LISTING_PATTERN)) if use_xhr else nullcontext()
+                )
+                with listing_capture as capture:
+                    if first_link is not None:
+                        with stage_timer(endpoint, "goto"):
+                            await goto_with_profile(page, first_link, *navigation[endpoint])
+                    else:
+                        await first_result.click()
+
+                    with stage_timer(endpoint, "selector_wait"):
+                        if use_xhr:
+                            # L'elenco può arrivare via XHR o essere già nell'HTML: vale il primo dei due
+                            payload = await wait_json_or_selector(capture, page, 'article.listing-item', 10000)
+                        else:
+                            await page.wait_for_selector('article.listing-item', timeout=10000)
+
+                concert_list = _parse_captured(parse_concert_json, payload, "degli eventi di ticketone")
+                if concert_list is not None:
+                    EXTRACTION_SOURCE.labels(endpoint, "xhr").inc()
+                    return {"concert_list": concert_list}
+
+                with stage_timer(endpoint, "selector_wait"):
+                    await page.wait_for_selector('article.listing-item', timeout=10000)
+                with stage_timer(endpoint, "extraction"):
+                    rows = await page.eval_on_selector_all('article.listing-item', CONCERT_ROWS_JS)
+                    concert_list = parse_concert_rows(rows)
+                EXTRACTION_SOURCE.labels(endpoint, "dom").inc()
+                print(concert_list)
+                return {"concert_list": concert_list}
+            except Exception as e:
+                logger.error(f"Errore durante la ricerca del concerto: {e}")
+                raise HTTPException(status_code=500, detail="Internal Server Error") from e
 
 @app.post("/write_to_searchbar_and_click_first_result", dependencies=[Depends(verify_api_key)])
-async def write_to_searchbar_and_click_first_result(request: WriteToSearchbarRequest):
+async def write_to_searchbar_and_click_first_result(request: WriteToSearchbarRequest, x_priority: Optional[str] = Header(None)):
     search_text = request.search_text
-    concert_list = []
-    async with async_playwright() as p:
-        browser = await p.firefox.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-        try:
-            await page.goto("https://www.ticketone.it/")
-
-            await page.wait_for_selector("#searchterm", timeout=15000)
-            search_input = await page.query_selector("#searchterm")
-            await search_input.fill("")
-            await search_input.type(search_text)
-
-            await asyncio.sleep(1)
-
-            await page.wait_for_selector("#suggest-list", timeout=15000)
-            suggestions = await page.query_selector("#suggest-list")
-
-            first_result = await suggestions.query_selector('result-item a.as-result-link')
-            if not first_result:
-                logger.warning("Nessun risultato trovato nella ricerca")
-                return {"concert_list": concert_list}
+    priority = PriorityTicket(parse_priority(x_priority, INTERACTIVE))
+    return await concert_list_cache.get_or_compute(
+        normalize_key(search_text), lambda: scrape_concert_list(search_text, priority), priority
+    )
 
-            await first_result.click()
-
-            await page.wait_for_selector('article.listing-item', timeout=10000)
-            concert_entries = await page.query_selector_all('article.listing-item')
-
-            for entry in concert_entries:
-                try:
-                    date_element = await entry.query_selector('.event-listing-date')
-                    month_year_element = await entry.query_selector('.event-listing-month')
-                    date = f"{await date_element.inner_text()} {await month_year_element.inner_text()}"
-
-                    city_element = await entry.query_selector('.event-listing-city')
-                    city = await city_element.inner_text()
-
-                    venue_element = await entry.query_selector('.event-listing-venue')
-                    venue = await venue_element.inner_text()
-
-                    location = f"{city}, {venue}"
-                    if "PACKAGE" in location:
-                        continue
-                    
-                    concert_list.append({
-                        "date": date,
-                        "location": location
-                    })
-                except Exception as e:
-                    logger.error(f"Errore durante l'estrazione dei dati: {e}")
-            print(concert_list)
-            return {"concert_list": concert_list}
-        except Exception as e:
-            logger.error(f"Errore durante la ricerca del concerto: {e}")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
-        finally:
-            await browser.close()
-
-@app.post("/search_tickets", dependencies=[Depends(verify_api_key)])
-async def search_tickets(request: SearchTicketsRequest):
-    url = request.url
-    ticket_data = []
-    async with async_playwright() as p:
-        browser = await p.firefox.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
+async def scrape_tickets_browser(url, priority=BACKGROUND):
+    async with browser_page(priority) as page:
         try:
             logger.info(f"Navigating to {url}")
-            await page.goto(url)
-
-            await page.wait_for_selector('.js-EventEntry', timeout=10000)
-            event_entries = await page.query_selector_all('.js-EventEntry')
-
-            logger.info(f"Found {len(event_entries)} event entries")
-
-            for entry in event_entries:
-                entry_class = await entry.get_attribute('class')
-                if 'hidden' not in entry_class.split():
-                    try:
-                        href = await entry.get_attribute('href')
-                        logger.debug(f"Found href: {href}")
-
-                        day_element = await entry.query_selector('.EvEntryRow-Day') or await entry.query_selector('.EvEntryRow-SubscriptionDateElement')
-                        raw_day = await day_element.inner_text()
-                        raw_day = raw_day.replace('\xa0', ' ').strip()
-
-                        match = re.match(r'(\d{1,2})\.? (\w+) ?(\d{2})?', raw_day)
-                        if match:
-                            day = match.group(1)
-                            month = match.group(2)
-                            year = match.group(3)
-                            if year:
-                                full_year = f"20{year}"
-                                formatted_date = f"{day} {month} {full_year}"
-                            else:
-                                formatted_date = f"{day} {month}"
-                            logger.debug(f"Formatted day: {formatted_date}")
-                        else:
-                            formatted_date = raw_day
-
-                        name_element = await entry.query_selector('.EvEntryRow-smallSubtitle')
-                        name = await name_element.inner_text()
-
-                        location_element = await entry.query_selector('.EvEntryRow-highlightedTitle')
-                        location = await location_element.inner_text()
-                        logger.debug(f"Extracted name: {name}, location: {location}")
-
-                        price_element = await entry.query_selector('.EvEntryRow-moneyValueFormatSmall') or await entry.query_selector('.EvEntryRow-moneyValueFormat')
-                        price = await price_element.inner_text()
-                        logger.debug(f"Extracted price: {price}")
-
-                        ticket_info = {
-                            'day': formatted_date,
-                            'location': location,
-                            'price': price,
-                        }
-                        ticket_data.append(ticket_info)
-                        logger.info(f"Extracted ticket info: {ticket_info}")
-
-                    except Exception as e:
-                        logger.error(f"Error durante data extraction: {e}")
-            return {"ticket_data": ticket_data}
+            with stage_timer("search_tickets", "goto"):
+                await goto_with_profile(page, url, *navigation["search_tickets"])
+
+            with stage_timer("search_tickets", "selector_wait"):
+                await page.wait_for_selector('.js-EventEntry', timeout=10000)
+            with stage_timer("search_tickets", "extraction"):
+                rows = await page.eval_on_selector_all('.js-EventEntry', TICKET_ROWS_JS)
+                logger.info(f"Found {len(rows)} event entries")
+                return parse_ticket_rows(rows)
         except Exception as e:
             logger.error(f"Errore durante lo scraping dei biglietti: {e}")
-            raise HTTPException(status_code=500, detail="Internal Server Error")
+            raise HTTPException(status_code=500, detail="Internal Server Error") from e
+
+async def scrape_tickets(url, priority=BACKGROUND, timeout=None):
+    # Limite per host su ogni percorso (endpoint, batch, monitoraggio, worker della coda);
+    # l'attesa del limite non conta nel timeout dello scraping
+    await host_rate_limiter.acquire(url)
+    return await asyncio.wait_for(_scrape_tickets(url, priority), timeout)
+
+async def _scrape_tickets(url, priority):
+    with track_scrape("search_tickets", url, SCRAPE_TIMEOUT_ERRORS):
+        # Prova prima la pagina server-side via HTTP, poi il browser se serve
+        start = time.monotonic()
+        engine = "browser"
+        ticket_data = None
+        if SCRAPE_ENGINE in ("auto", "http"):
+            try:
+                ticket_data = await http_scraper.scrape_tickets(url)
+                engine = "http"
+            except FallbackRequired as e:
+                if SCRAPE_ENGINE == "http":
+                    logger.error(f"Scraping HTTP non riuscito per {url}: {e}")
+                    raise HTTPException(status_code=502, detail="HTTP scraping failed") from e
+                logger.info(f"Fallback al browser per {url}: {e}")
+        if ticket_data is None:
+            ticket_data = await scrape_tickets_browser(url, priority)
+        elapsed_ms = round((time.monotonic() - start) * 1000)
+        logger.info(f"Scraping di {url} completato con engine {engine} in {elapsed_ms} ms")
+        if listing_history is not None:
+            listing_history.record(url, ticket_data)
+        return {"ticket_data": ticket_data, "engine": engine, "elapsed_ms": elapsed_ms}
+
+@app.post("/search_tickets", dependencies=[Depends(verify_api_key)])
+async def search_tickets(request: SearchTicketsRequest, x_priority: Optional[str] = Header(None)):
+    return await scrape_tickets(request.url, parse_priority(x_priority, BACKGROUND))
+
+async def scrape_tickets_result(url, priority):
+    # Per batch e monitoraggio: gli errori diventano un campo "error" del risultato
+    try:
+        result = await scrape_tickets(url, priority, timeout=BATCH_URL_TIMEOUT)
+        return {"url": url, **result}
+    except Overloaded as e:
+        return {"url": url, "error": "overloaded", "retry_after": e.retry_after}
+    except asyncio.TimeoutError:
+        logger.error(f"Timeout durante lo scraping di {url}")
+        record_scrape_timeout("search_tickets", url)
+        return {"url": url, "error": "timeout"}
+    except HTTPException as e:
+        return {"url": url, "error": e.detail}
+    except Exception as e:
+        logger.error(f"Errore durante lo scraping di {url}: {e}")
+        return {"url": url, "error": "Internal Server Error"}
+
+async def scrape_tickets_for_batch(semaphore, url, priority):
+    async with semaphore:
+        return await scrape_tickets_result(url, priority)
+
+# Monitoraggio delle coppie (URL, data) registrate dai sottoscrittori, con stream delle modifiche
+listing_monitor = ListingMonitor(
+    STREAM_DB_PATH,
+    scrape=lambda url: scrape_tickets_result(url, BACKGROUND),
+    scheduler=AdaptiveScheduler(SCRAPE_BUDGET_PER_MINUTE, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL),
+    concurrency=BATCH_CONCURRENCY,
+    tick=SCHEDULER_TICK,
+    heartbeat=STREAM_HEARTBEAT,
+    retention=STREAM_RETENTION_EVENTS,
+) if STREAM_ENABLED else None
+
+def require_listing_monitor():
+    if listing_monitor is None:
+        raise HTTPException(status_code=404, detail="Listing stream disabled")
+    return listing_monitor
+
+@app.post("/search_tickets_batch", dependencies=[Depends(verify_api_key)])
+async def search_tickets_batch(request: SearchTicketsBatchRequest, x_priority: Optional[str] = Header(None)):
+    # Una riga NDJSON per URL, inviata appena lo scraping di quell'URL termina
+    urls = list(dict.fromkeys(request.urls))
+    priority = parse_priority(x_priority, BACKGROUND)
+    # Con la coda già piena il batch viene rifiutato subito, prima di iniziare lo streaming
+    admission.check(priority)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def results():
+        tasks = [asyncio.create_task(scrape_tickets_for_batch(semaphore, url, priority)) for url in urls]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield json.dumps(await task) + "\n"
         finally:
-            await browser.close()
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.put("/subscriptions/{subscriber}", dependencies=[Depends(verify_api_key)])
+async def put_subscription(subscriber: str, request: SubscriptionRequest):
+    # Sostituisce l'insieme delle coppie (URL, data) seguite dal sottoscrittore
+    monitor = require_listing_monitor()
+    return await monitor.replace_watches(
+        subscriber, [(watch.url, watch.date) for watch in request.watches], request.resync
+    )
+
+@app.get("/subscriptions/{subscriber}/stream", dependencies=[Depends(verify_api_key)])
+async def subscription_stream(subscriber: str, offset: int = 0, last_event_id: Optional[str] = Header(None)):
+    # Server-Sent Events dall'offset indicato; Last-Event-ID (riconnessione SSE standard) ha la precedenza
+    monitor = require_listing_monitor()
+    if last_event_id and last_event_id.isdigit():
+        offset = int(last_event_id)
+    return StreamingResponse(
+        monitor.stream(subscriber, offset),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/stream_stats", dependencies=[Depends(verify_api_key)])
+async def stream_stats():
+    return await require_listing_monitor().stats()
+
+def require_listing_history():
+    if listing_history is None:
+        raise HTTPException(status_code=404, detail="Listing history disabled")
+    return listing_history
+
+@app.get("/history", dependencies=[Depends(verify_api_key)])
+async def history(url: str, date: Optional[str] = None, since: int = 0, until: Optional[int] = None):
+    # Elenco a `since` e variazioni fino a `until` (secondi epoch) di una pagina, per una data o per tutte
+    return await require_listing_history().query(url, date, since, until)
+
+@app.get("/history_stats", dependencies=[Depends(verify_api_key)])
+async def history_stats():
+    return await require_listing_history().stats()
+
+@app.get("/pool_stats", dependencies=[Depends(verify_api_key)])
+async def pool_stats():
+    return browser_pool.stats()
+
+@app.get("/admission_stats", dependencies=[Depends(verify_api_key)])
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/cache_stats", dependencies=[Depends(verify_api_key)])
+async def cache_stats():
+    return {
+        "search_artist": artist_cache.stats(),
+        "write_to_searchbar_and_click_first_result": concert_list_cache.stats(),
+    }
+
+@app.get("/navigation_stats", dependencies=[Depends(verify_api_key)])
+async def navigation_stats():
+    return {
+        endpoint: {"profile": profile.name, **stats.to_dict()}
+        for endpoint, (profile, stats) in navigation.items()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.post("/match_tickets", dependencies=[Depends(verify_api_key)])
 async def match_tickets(request: MatchTicketsRequest):
     tickets = request.tickets
     user_ticket = request.user_ticket
-    matched_tickets = [ticket for ticket in tickets if ticket['day'] == user_ticket]
+    matched_tickets = match_tickets_by_date(tickets, user_ticket)
     return {"matched_tickets": matched_tickets}
@@ -0,0 +1,133 @@
+import json
+import logging
+
+import telegram
+from telegram import Update
+from telegram.ext import Application, BasePersistence, ConversationHandler, PersistenceInput
+
+from database import (
+    get_user_state, save_user_state, get_conversation_state, save_conversation_state
+)
+
+logger = logging.getLogger(__name__)
+
+# Stato condiviso tra più istanze del bot in modalità webhook: un update può
+# arrivare a qualsiasi istanza, quindi user_data e stato delle conversazioni
+# stanno nel database del bot e non solo in memoria.
+
+# ConversationHandler non ha un'API pubblica per ricaricare lo stato di una
+# conversazione dopo l'avvio: _load_conversations usa attributi interni,
+# verificati con questa versione (requirements.txt, tests/test_shared_state.py)
+TESTED_PTB_VERSION = "22.8"
+if telegram.__version__ != TESTED_PTB_VERSION:
+    logger.warning(
+        f"python-telegram-bot {telegram.__version__} installato, lo stato condiviso delle conversazioni "
+        f"è verificato con la {TESTED_PTB_VERSION}"
+    )
+
+
+class SQLitePersistence(BasePersistence):
+    """Persistenza di user_data e dello stato delle conversazioni nel database del bot.
+
+    All'avvio non viene caricato nulla: i dati di un utente vengono riletti a
+    ogni update (refresh_user_data, load_conversation) e scritti appena
+    l'update è stato gestito (vedi SharedStateApplication). I valori sono
+    salvati in JSON.
+    """
+
+    def __init__(self):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False)
+        )
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def load_conversation(self, name, key):
+        state = await get_conversation_state(name, json.dumps(key))
+        return json.loads(state) if state is not None else None
+
+    async def update_conversation(self, name, key, new_state):
+        await save_conversation_state(name, json.dumps(key), json.dumps(new_state) if new_state is not None else None)
+
+    async def update_user_data(self, user_id, data):
+        await save_user_state(user_id, json.dumps(data) if data else None)
+
+    async def refresh_user_data(self, user_id, user_data):
+        stored = await get_user_state(user_id)
+        user_data.clear()
+        if stored is not None:
+            user_data.update(json.loads(stored))
+
+    async def drop_user_data(self, user_id):
+        await save_user_state(user_id, None)
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        pass
+
+
+class SharedStateApplication(Application):
+    """Application che legge e scrive lo stato condiviso a ogni update.
+
+    Prima di gestire un update rilegge dal database lo stato delle
+    conversazioni persistenti per la chiave dell'update (ConversationHandler
+    lo carica solo all'avvio); dopo salva subito user_data e stato, invece di
+    attendere update_interval, così l'update successivo dello stesso utente
+    può essere gestito da un'altra istanza.
+    """
+
+    async def process_update(self, update):
+        if self.persistence and isinstance(update, Update):
+            await self._load_conversations(update)
+        await super().process_update(update)
+        if self.persistence:
+            await self.update_persistence()
+
+    async def _load_conversations(self, update):
+        for handlers in self.handlers.values():
+            for handler in handlers:
+                if not (isinstance(handler, ConversationHandler) and handler.persistent):
+                    continue
+                try:
+                    key = handler._get_key(update)
+                except RuntimeError:
+                    # Update senza chat o utente: non appartiene a nessuna conversazione
+                    continue
+                state = await self.persistence.load_conversation(handler.name, key)
+                # Dizionario di tracciamento creato dalla persistenza: le letture non
+                # vanno segnate come modifiche da salvare
+                conversations = handler._conversations
+                if state is None:
+                    conversations.data.pop(key, None)
+                else:
+                    conversations.update_no_track({key: state})
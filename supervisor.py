@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+import psutil
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from config import (
+    API_KEY, SUPERVISOR_MIN_WORKERS, SUPERVISOR_MAX_WORKERS, SUPERVISOR_WORKER_BASE_PORT,
+    SUPERVISOR_CHECK_INTERVAL, SUPERVISOR_MAX_RSS_MB, SUPERVISOR_MAX_CRASHES_PER_CHECK,
+    SUPERVISOR_SCALE_UP_QUEUE_DEPTH, SUPERVISOR_SCALE_DOWN_LOAD
+)
+
+# uvicorn supervisor:app --host 0.0.0.0 --port 8000
+# Avvia più processi scraper_service (ognuno con il proprio browser pool) e inoltra le richieste
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STARTING, READY, DRAINING = "starting", "ready", "draining"
+
+# Header da non inoltrare tra client, supervisor e worker
+HOP_BY_HOP_HEADERS = {"host", "connection", "content-length", "transfer-encoding", "keep-alive"}
+
+
+class WorkerProcess:
+    def __init__(self, port):
+        self.port = port
+        self.process = None
+        self.state = STARTING
+        self.in_flight = 0
+        self.requests = 0
+        self.restarts = 0
+        self.started_at = None
+        self.rss_mb = 0.0
+        self.crashes = 0
+        self.crashes_delta = 0
+        self.queue_depth = 0
+        self.admission_queue_depth = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def spawn(self):
+        self.process = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "scraper_service:app",
+            "--host", "127.0.0.1", "--port", str(self.port),
+        ])
+        self.state = STARTING
+        self.started_at = time.time()
+        self.crashes = 0
+        self.crashes_delta = 0
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def terminate(self):
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def measure_rss(self):
+        # RSS del worker più i processi figli (Firefox)
+        try:
+            parent = psutil.Process(self.process.pid)
+            processes = [parent] + parent.children(recursive=True)
+            self.rss_mb = sum(p.memory_info().rss for p in processes if p.is_running()) / (1024 * 1024)
+        except psutil.Error:
+            self.rss_mb = 0.0
+        return self.rss_mb
+
+    def to_dict(self):
+        return {
+            "port": self.port,
+            "pid": self.process.pid if self.process else None,
+            "state": self.state,
+            "alive": self.alive(),
+            "in_flight": self.in_flight,
+            "pool_queue_depth": self.queue_depth,
+            "admission_queue_depth": self.admission_queue_depth,
+            "requests": self.requests,
+            "rss_mb": round(self.rss_mb, 1),
+            "page_crashes": self.crashes,
+            "restarts": self.restarts,
+            "uptime_seconds": round(time.time() - self.started_at) if self.started_at else None,
+        }
+
+
+class Supervisor:
+    def __init__(self):
+        self.workers = []
+        self.client = None
+        self._monitor_task = None
+        self._restart_tasks = set()
+        self._idle_checks = 0
+
+    async def start(self):
+        self.client = httpx.AsyncClient(timeout=httpx.Timeout(15.0, read=None))
+        for _ in range(SUPERVISOR_MIN_WORKERS):
+            self._add_worker()
+        self._monitor_task = asyncio.create_task(self._monitor())
+
+    async def stop(self):
+        if self._monitor_task:
+            self._monitor_task.cancel()
+        for task in list(self._restart_tasks):
+            task.cancel()
+        await asyncio.gather(*self._restart_tasks, return_exceptions=True)
+        for worker in self.workers:
+            await asyncio.to_thread(worker.terminate)
+        await self.client.aclose()
+
+    def _add_worker(self):
+        used_ports = {w.port for w in self.workers}
+        port = next(p for p in range(SUPERVISOR_WORKER_BASE_PORT, SUPERVISOR_WORKER_BASE_PORT + 1000) if p not in used_ports)
+        worker = WorkerProcess(port)
+        worker.spawn()
+        self.workers.append(worker)
+        logger.info(f"Avviato worker sulla porta {port} (pid {worker.process.pid})")
+        return worker
+
+    def _schedule_restart(self, worker, reason):
+        # Il drain può durare fino a un minuto: il riavvio gira in un task separato
+        # e il monitor continua a controllare gli altri worker
+        logger.warning(f"Riavvio del worker sulla porta {worker.port}: {reason}")
+        worker.state = DRAINING
+        task = asyncio.create_task(self._restart(worker))
+        self._restart_tasks.add(task)
+        task.add_done_callback(self._restart_tasks.discard)
+
+    async def _restart(self, worker):
+        await self._drain(worker)
+        await asyncio.to_thread(worker.terminate)
+        worker.restarts += 1
+        worker.spawn()
+
+    async def _drain(self, worker, timeout=60):
+        deadline = time.monotonic() + timeout
+        while worker.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+
+    async def _retire(self, worker):
+        worker.state = DRAINING
+        await self._drain(worker)
+        await asyncio.to_thread(worker.terminate)
+        self.workers.remove(worker)
+        logger.info(f"Worker sulla porta {worker.port} rimosso")
+
+    def pick_worker(self):
+        # Instradamento al worker pronto con meno richieste in corso
+        ready = [w for w in self.workers if w.state == READY]
+        if not ready:
+            return None
+        return min(ready, key=lambda w: w.in_flight)
+
+    async def _check_worker(self, worker):
+        if not worker.alive():
+            if worker.state != DRAINING:
+                self._schedule_restart(worker, "processo terminato")
+            return
+
+        headers = {"x-api-key": API_KEY or ""}
+        try:
+            response = await self.client.get(f"{worker.url}/pool_stats", headers=headers, timeout=5)
+            response.raise_for_status()
+            pool_stats = response.json()
+            worker.queue_depth = pool_stats.get("queue_depth", 0)
+            response = await self.client.get(f"{worker.url}/admission_stats", headers=headers, timeout=5)
+            response.raise_for_status()
+            admission_stats = response.json()
+            worker.admission_queue_depth = sum(
+                value.get("queued", 0) for value in admission_stats.values() if isinstance(value, dict)
+            )
+            crashes = pool_stats.get("crashes", 0)
+            worker.crashes_delta = crashes - worker.crashes
+            worker.crashes = crashes
+            if worker.state == STARTING:
+                worker.state = READY
+                logger.info(f"Worker sulla porta {worker.port} pronto")
+        except httpx.HTTPError:
+            # Ancora in avvio, oppure non risponde
+            if worker.state == READY:
+                logger.warning(f"Il worker sulla porta {worker.port} non risponde")
+            return
+
+        if worker.state != READY:
+            return
+        if await asyncio.to_thread(worker.measure_rss) > SUPERVISOR_MAX_RSS_MB:
+            self._schedule_restart(worker, f"RSS {worker.rss_mb:.0f} MB oltre il limite")
+        elif worker.crashes_delta > SUPERVISOR_MAX_CRASHES_PER_CHECK:
+            self._schedule_restart(worker, f"{worker.crashes_delta} crash di pagina nell'ultimo intervallo")
+
+    def _autoscale(self):
+        ready = [w for w in self.workers if w.state == READY]
+        if not ready:
+            return
+        # Si scala sulle richieste in attesa di una pagina, non su quelle già in esecuzione
+        queue_depth = sum(w.queue_depth + w.admission_queue_depth for w in ready) / len(ready)
+        load = sum(w.in_flight for w in ready) / len(ready)
+        starting = any(w.state == STARTING for w in self.workers)
+        if queue_depth > SUPERVISOR_SCALE_UP_QUEUE_DEPTH and len(self.workers) < SUPERVISOR_MAX_WORKERS and not starting:
+            logger.info(f"Coda media di {queue_depth:.1f} richieste per worker: aggiungo un worker")
+            self._add_worker()
+            self._idle_checks = 0
+        elif queue_depth == 0 and load < SUPERVISOR_SCALE_DOWN_LOAD and len(self.workers) > SUPERVISOR_MIN_WORKERS:
+            # Riduzione solo dopo alcuni controlli consecutivi con poco carico
+            self._idle_checks += 1
+            if self._idle_checks >= 3:
+                self._idle_checks = 0
+                asyncio.create_task(self._retire(min(ready, key=lambda w: w.in_flight)))
+        else:
+            self._idle_checks = 0
+
+    async def _monitor(self):
+        while True:
+            try:
+                await asyncio.gather(*(self._check_worker(w) for w in list(self.workers)))
+                self._autoscale()
+            except Exception as e:
+                logger.error(f"Errore nel monitoraggio dei worker: {e}")
+            await asyncio.sleep(SUPERVISOR_CHECK_INTERVAL)
+
+    def stats(self):
+        return {
+            "workers": [w.to_dict() for w in self.workers],
+            "in_flight": sum(w.in_flight for w in self.workers),
+            "min_workers": SUPERVISOR_MIN_WORKERS,
+            "max_workers": SUPERVISOR_MAX_WORKERS,
+        }
+
+
+supervisor = Supervisor()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await supervisor.start()
+    try:
+        yield
+    finally:
+        await supervisor.stop()
+
+app = FastAPI(title="Scraper Supervisor", lifespan=lifespan)
+
+
+async def verify_api_key(x_api_key: str = Header(...)):
+    if x_api_key != API_KEY:
+        logger.warning(f"Tentativo di accesso non autorizzato con API Key: {x_api_key}")
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.get("/admin/workers", dependencies=[Depends(verify_api_key)])
+async def admin_workers():
+    return supervisor.stats()
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
+async def proxy(path: str, request: Request):
+    worker = supervisor.pick_worker()
+    if worker is None:
+        raise HTTPException(status_code=503, detail="No scraper worker available")
+
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    upstream_request = supervisor.client.build_request(
+        request.method, f"{worker.url}/{path}",
+        params=request.query_params, headers=headers, content=await request.body(),
+    )
+    worker.in_flight += 1
+    worker.requests += 1
+    try:
+        upstream = await supervisor.client.send(upstream_request, stream=True)
+    except httpx.HTTPError as e:
+        worker.in_flight -= 1
+        logger.error(f"Errore di inoltro al worker sulla porta {worker.port}: {e}")
+        raise HTTPException(status_code=502, detail="Scraper worker error")
+
+    async def release():
+        await upstream.aclose()
+        worker.in_flight -= 1
+
+    # Risposta inoltrata in streaming (necessario per /search_tickets_batch)
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers={k: v for k, v in upstream.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS},
+        background=BackgroundTask(release),
+    )
@@ -0,0 +1,40 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def fixture_html():
+    def load(name):
+        return (FIXTURES / name).read_text(encoding="utf-8")
+    return load
+
+
+@pytest.fixture
+def run_in_page():
+    """Esegue `scenario(page)` su una pagina Firefox con il markup indicato.
+
+    Il test viene saltato se Playwright o il browser non sono installati.
+    """
+    def run(markup, scenario):
+        async def main():
+            try:
+                from playwright.async_api import async_playwright
+            except ImportError:
+                pytest.skip("playwright non installato")
+            async with async_playwright() as playwright:
+                try:
+                    browser = await playwright.firefox.launch(headless=True)
+                except Exception as e:
+                    pytest.skip(f"Firefox non disponibile: {str(e).splitlines()[0]}")
+                try:
+                    page = await browser.new_page()
+                    await page.set_content(markup)
+                    return await scenario(page)
+                finally:
+                    await browser.close()
+        return asyncio.run(main())
+    return run
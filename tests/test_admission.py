@@ -0,0 +1,202 @@
+import asyncio
+
+import pytest
+
+from admission import BACKGROUND, INTERACTIVE, Overloaded, PriorityAdmission, PriorityTicket, parse_priority
+from cache import TTLCache
+
+
+def make_admission(capacity=3, reserved=1, max_queue=2):
+    return PriorityAdmission(capacity, reserved, {INTERACTIVE: max_queue, BACKGROUND: max_queue})
+
+
+async def hold(admission, priority, started, release):
+    async with admission.slot(priority):
+        started.append(priority)
+        await release.wait()
+
+
+def test_background_cannot_use_reserved_slots():
+    async def scenario():
+        admission = make_admission(capacity=3, reserved=1)
+        started, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, BACKGROUND, started, release)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert started == [BACKGROUND, BACKGROUND]
+        # Lo slot riservato resta disponibile per una ricerca dell'utente
+        tasks.append(asyncio.create_task(hold(admission, INTERACTIVE, started, release)))
+        await asyncio.sleep(0)
+        assert started == [BACKGROUND, BACKGROUND, INTERACTIVE]
+        assert admission.stats()[BACKGROUND]["queued"] == 1
+        release.set()
+        await asyncio.gather(*tasks)
+        assert started.count(BACKGROUND) == 3
+
+    asyncio.run(scenario())
+
+
+def test_interactive_queue_is_served_first():
+    async def scenario():
+        admission = make_admission(capacity=1, reserved=0, max_queue=5)
+        started, release = [], asyncio.Event()
+        first = asyncio.create_task(hold(admission, BACKGROUND, started, release))
+        await asyncio.sleep(0)
+        order = []
+
+        async def record(priority):
+            async with admission.slot(priority):
+                order.append(priority)
+
+        waiting = [asyncio.create_task(record(p)) for p in (BACKGROUND, INTERACTIVE, BACKGROUND, INTERACTIVE)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(first, *waiting)
+        assert order == [INTERACTIVE, INTERACTIVE, BACKGROUND, BACKGROUND]
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        admission = make_admission(capacity=1, reserved=0, max_queue=1)
+        started, release = [], asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, BACKGROUND, started, release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as excinfo:
+            async with admission.slot(BACKGROUND):
+                pass
+        assert excinfo.value.retry_after >= 1
+        assert admission.stats()[BACKGROUND]["shed"] == 1
+        release.set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        admission = make_admission(capacity=1, reserved=0)
+        started, release = [], asyncio.Event()
+        running = asyncio.create_task(hold(admission, INTERACTIVE, started, release))
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(hold(admission, INTERACTIVE, started, release))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await running
+        stats = admission.stats()[INTERACTIVE]
+        assert (stats["queued"], stats["running"]) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_promoted_ticket_moves_to_the_interactive_queue():
+    async def scenario():
+        admission = make_admission(capacity=1, reserved=0, max_queue=5)
+        started, release = [], asyncio.Event()
+        running = asyncio.create_task(hold(admission, BACKGROUND, started, release))
+        await asyncio.sleep(0)
+        order = []
+
+        async def record(name, priority):
+            async with admission.slot(priority):
+                order.append(name)
+
+        ticket = PriorityTicket(BACKGROUND)
+        waiting = [asyncio.create_task(record("check", BACKGROUND)), asyncio.create_task(record("prefetch", ticket))]
+        await asyncio.sleep(0)
+        assert admission.stats()[BACKGROUND]["queued"] == 2
+        ticket.promote()
+        assert (admission.stats()[BACKGROUND]["queued"], admission.stats()[INTERACTIVE]["queued"]) == (1, 1)
+        assert not ticket.started
+        release.set()
+        await asyncio.gather(running, *waiting)
+        assert order == ["prefetch", "check"]
+        assert ticket.started
+        assert admission.stats()[INTERACTIVE]["admitted"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_promoted_waiter_leaves_the_queue():
+    async def scenario():
+        admission = make_admission(capacity=1, reserved=0)
+        started, release = [], asyncio.Event()
+        running = asyncio.create_task(hold(admission, INTERACTIVE, started, release))
+        await asyncio.sleep(0)
+        ticket = PriorityTicket(BACKGROUND)
+        waiting = asyncio.create_task(hold(admission, ticket, started, release))
+        await asyncio.sleep(0)
+        ticket.promote()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        release.set()
+        await running
+        for priority in (INTERACTIVE, BACKGROUND):
+            stats = admission.stats()[priority]
+            assert (stats["queued"], stats["running"]) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_parse_priority():
+    assert parse_priority("background", INTERACTIVE) == BACKGROUND
+    assert parse_priority("urgent", INTERACTIVE) == INTERACTIVE
+    assert parse_priority(None, BACKGROUND) == BACKGROUND
+
+
+def test_interactive_request_joins_and_promotes_background_computation():
+    async def scenario():
+        admission = make_admission(capacity=1, reserved=0, max_queue=5)
+        cache = TTLCache(ttl=60, max_entries=10)
+        started, release = [], asyncio.Event()
+        check = asyncio.create_task(hold(admission, BACKGROUND, started, release))
+        await asyncio.sleep(0)
+        calls = []
+
+        async def scrape(ticket):
+            async with admission.slot(ticket):
+                calls.append(ticket.priority)
+                return "value"
+
+        ticket = PriorityTicket(BACKGROUND)
+        prefetch = asyncio.create_task(cache.get_or_compute("k", lambda: scrape(ticket), ticket))
+        queued_check = asyncio.create_task(hold(admission, BACKGROUND, started, release))
+        await asyncio.sleep(0)
+        user = asyncio.create_task(cache.get_or_compute("k", lambda: scrape(PriorityTicket(INTERACTIVE)), INTERACTIVE))
+        await asyncio.sleep(0)
+        assert ticket.priority == INTERACTIVE
+        assert (cache.stats()["coalesced"], cache.stats()["promoted"]) == (1, 1)
+
+        # Lo slot liberato dal controllo va al prefetch promosso, prima dell'altro controllo in coda
+        release.set()
+        assert await asyncio.wait_for(asyncio.gather(prefetch, user), timeout=1) == ["value", "value"]
+        assert calls == [INTERACTIVE]
+        await asyncio.gather(check, queued_check)
+        assert started == [BACKGROUND, BACKGROUND]
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_interactive_computation_is_shared():
+    async def scenario():
+        cache = TTLCache(ttl=60, max_entries=10)
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return "value"
+
+        first = asyncio.create_task(cache.get_or_compute("k", compute, INTERACTIVE))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(cache.get_or_compute("k", compute, p)) for p in (INTERACTIVE, BACKGROUND)]
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.gather(first, *others) == ["value"] * 3
+        assert calls == [1]
+
+    asyncio.run(scenario())
@@ -0,0 +1,11 @@
+import pytest
+
+import bot
+
+
+def test_webhook_mode_requires_webhook_url(monkeypatch):
+    monkeypatch.setattr(bot, "BOT_MODE", "webhook")
+    monkeypatch.setattr(bot, "WEBHOOK_URL", "")
+    monkeypatch.setattr(bot, "setup_database", lambda: pytest.fail("avvio non interrotto"))
+    with pytest.raises(ValueError, match="WEBHOOK_URL"):
+        bot.main()
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+from browser_pool import BrowserPool
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+
+    def on(self, event, callback):
+        pass
+
+    def is_connected(self):
+        return self.connected
+
+    async def close(self):
+        self.connected = False
+
+
+class FakeFirefox:
+    """Avvio dei browser controllato dal test: ogni launch attende `release`."""
+
+    def __init__(self):
+        self.launches = 0
+        self.release = None
+
+    async def launch(self, headless):
+        self.launches += 1
+        if self.release is not None:
+            await self.release.wait()
+        return FakeBrowser()
+
+
+def make_pool(size, max_uses=100):
+    pool = BrowserPool(size=size, max_pages=4, max_uses=max_uses)
+    firefox = FakeFirefox()
+    pool._playwright = SimpleNamespace(firefox=firefox)
+    return pool, firefox
+
+
+async def start(pool):
+    for index in range(pool.size):
+        pool._browsers.append(await pool._launch(index))
+
+
+def test_replacement_does_not_block_other_slots():
+    async def scenario():
+        pool, firefox = make_pool(size=2)
+        await start(pool)
+        pool._browsers[0].browser.connected = False
+        firefox.release = asyncio.Event()
+
+        # Lo slot 0 è in riavvio: chi lo sceglie attende, lo slot 1 resta disponibile
+        waiting = asyncio.create_task(pool._acquire_browser())
+        await asyncio.sleep(0)
+        other = await asyncio.wait_for(pool._acquire_browser(), timeout=1)
+        assert other.index == 1
+        assert not waiting.done()
+        assert pool.stats()["browsers"][0] == {"index": 0, "launching": True}
+
+        firefox.release.set()
+        replacement = await asyncio.wait_for(waiting, timeout=1)
+        assert replacement.index == 0 and replacement.healthy
+        assert pool._browsers[0] is replacement
+        assert pool.stats()["crashes"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_waiters_on_launching_slot_share_one_launch():
+    async def scenario():
+        pool, firefox = make_pool(size=1)
+        await start(pool)
+        pool._browsers[0].browser.connected = False
+        firefox.release = asyncio.Event()
+        tasks = [asyncio.create_task(pool._acquire_browser()) for _ in range(3)]
+        await asyncio.sleep(0)
+        firefox.release.set()
+        results = await asyncio.gather(*tasks)
+        assert firefox.launches == 2
+        assert len({id(pooled) for pooled in results}) == 1
+        assert results[0].active_pages == 3
+
+    asyncio.run(scenario())
+
+
+def test_failed_launch_restores_slot_and_retries():
+    async def scenario():
+        pool, firefox = make_pool(size=1)
+        await start(pool)
+        pool._browsers[0].browser.connected = False
+
+        async def broken(headless):
+            raise RuntimeError("launch failed")
+
+        firefox.launch = broken
+        try:
+            await pool._acquire_browser()
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("l'errore di avvio deve arrivare al chiamante")
+        assert not pool._browsers[0].healthy
+
+        firefox.launch = FakeFirefox().launch
+        pooled = await pool._acquire_browser()
+        assert pooled.healthy and pool._browsers[0] is pooled
+
+    asyncio.run(scenario())
@@ -0,0 +1,194 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import cache as cache_module
+from cache import TTLCache, normalize_key
+from prefetch import ConcertListPrefetcher
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(cache_module, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_concurrent_requests_share_one_computation():
+    async def scenario():
+        cache = TTLCache(ttl=60, max_entries=10)
+        calls = []
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return {"concert_list": [1]}
+
+        waiters = [asyncio.create_task(cache.get_or_compute("vasco", compute)) for _ in range(5)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*waiters)
+        assert calls == [1]
+        assert results == [{"concert_list": [1]}] * 5
+        assert (cache.misses, cache.coalesced) == (1, 4)
+        assert await cache.get_or_compute("vasco", compute) == {"concert_list": [1]}
+        assert cache.hits == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_cancel_the_computation():
+    async def scenario():
+        cache = TTLCache(ttl=60, max_entries=10)
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.create_task(cache.get_or_compute("k", compute))
+        second = asyncio.create_task(cache.get_or_compute("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        assert await second == "ok"
+        assert cache.get("k") == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_errors_are_not_cached():
+    async def scenario():
+        cache = TTLCache(ttl=60, max_entries=10)
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def working():
+            return "ok"
+
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("k", broken)
+        assert await cache.get_or_compute("k", working) == "ok"
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(ttl=60, max_entries=10)
+    cache.set("k", "v")
+    clock.now += 59
+    assert cache.get("k") == "v"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(ttl=60, max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+
+def test_refresh_replaces_cached_value():
+    async def scenario():
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set("k", "old")
+
+        async def compute():
+            return "new"
+
+        assert await cache.refresh("k", compute) == "new"
+        assert cache.get("k") == "new"
+
+    asyncio.run(scenario())
+
+
+def test_normalize_key():
+    assert normalize_key("  Vasco   ROSSI ") == "vasco rossi"
+
+
+def test_prefetched_list_is_served_from_cache():
+    async def scenario():
+        calls = []
+
+        async def fetch(search_text, priority):
+            calls.append((search_text, priority))
+            return {"concert_list": [search_text]}
+
+        prefetcher = ConcertListPrefetcher(fetch, ttl=60, max_entries=10, concurrency=2)
+        prefetcher.prefetch(["Vasco Rossi", "Ligabue"])
+        await asyncio.gather(*prefetcher._tasks)
+        assert prefetcher.is_ready("vasco rossi")
+        assert await prefetcher.get("VASCO ROSSI") == {"concert_list": ["Vasco Rossi"]}
+        assert [priority for _, priority in calls] == ["background", "background"]
+        assert prefetcher.stats()["hits"] == 1
+
+    asyncio.run(scenario())
+
+
+async def until(condition):
+    for _ in range(20):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condizione non raggiunta")
+
+
+def test_user_request_joins_a_running_prefetch():
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch(search_text, priority):
+            calls.append((search_text, priority))
+            await release.wait()
+            return {"concert_list": [search_text]}
+
+        prefetcher = ConcertListPrefetcher(fetch, ttl=60, max_entries=10, concurrency=2)
+        prefetcher.prefetch(["Vasco Rossi"])
+        await until(lambda: calls)
+        # Richiesta già inviata con priorità background: l'utente attende quella
+        user = asyncio.create_task(prefetcher.get("Vasco Rossi"))
+        await asyncio.sleep(0)
+        release.set()
+        assert await asyncio.wait_for(user, timeout=1) == {"concert_list": ["Vasco Rossi"]}
+        assert calls == [("Vasco Rossi", "background")]
+        assert (prefetcher.stats()["coalesced"], prefetcher.stats()["promoted"]) == (1, 1)
+        await prefetcher.stop()
+
+    asyncio.run(scenario())
+
+
+def test_waiting_prefetch_starts_as_interactive_when_requested():
+    async def scenario():
+        release = asyncio.Event()
+        calls = []
+
+        async def fetch(search_text, priority):
+            calls.append((search_text, priority))
+            await release.wait()
+            return {"concert_list": [search_text]}
+
+        prefetcher = ConcertListPrefetcher(fetch, ttl=60, max_entries=10, concurrency=1)
+        prefetcher.prefetch(["Vasco Rossi", "Ligabue"])
+        await until(lambda: calls)
+        await asyncio.sleep(0)
+        assert calls == [("Vasco Rossi", "background")]
+        # Ligabue attende il semaforo: la richiesta dell'utente la fa partire subito
+        user = asyncio.create_task(prefetcher.get("Ligabue"))
+        await until(lambda: len(calls) == 2)
+        assert calls == [("Vasco Rossi", "background"), ("Ligabue", "interactive")]
+        release.set()
+        assert await asyncio.wait_for(user, timeout=1) == {"concert_list": ["Ligabue"]}
+        await prefetcher.stop()
+        assert len(calls) == 2
+        assert prefetcher._semaphore._value == 1
+
+    asyncio.run(scenario())
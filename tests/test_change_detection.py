@@ -0,0 +1,57 @@
+from change_detection import ListingDiff, apply_diff, diff_listings, ticket_fingerprint
+
+
+def ticket(day="ven 12 giu 2026", location="Settore A Fila 3", price="€ 45,00", **extra):
+    return {"day": day, "location": location, "price": price, **extra}
+
+
+def test_fingerprint_ignores_whitespace_and_other_fields():
+    base = ticket()
+    assert ticket_fingerprint(base) == ticket_fingerprint(
+        ticket(day=" ven  12 giu\n2026 ", location="Settore A\tFila 3", link="https://example.com/1")
+    )
+    assert ticket_fingerprint(base) != ticket_fingerprint(ticket(price="€ 46,00"))
+    assert ticket_fingerprint(base) != ticket_fingerprint(ticket(location="Settore B Fila 3"))
+
+
+def test_fingerprint_of_missing_fields_is_stable():
+    assert ticket_fingerprint({}) == ticket_fingerprint({"day": "", "location": "", "price": ""})
+
+
+def test_unchanged_listing_has_no_updates():
+    tickets = [ticket(), ticket(location="Parterre")]
+    diff = diff_listings(tickets, list(reversed(tickets)))
+    assert diff == ListingDiff()
+    assert not diff.has_updates
+
+
+def test_new_removed_and_repriced_tickets():
+    previous = [ticket(), ticket(location="Parterre"), ticket(location="Tribuna")]
+    current = [ticket(price="€ 39,00"), ticket(location="Tribuna"), ticket(location="Curva")]
+    diff = diff_listings(previous, current)
+    assert diff.new == [ticket(location="Curva")]
+    assert diff.removed == [ticket(location="Parterre")]
+    assert diff.price_changed == [(ticket(), ticket(price="€ 39,00"))]
+    assert diff.has_updates
+
+
+def test_duplicate_tickets_are_counted():
+    previous = [ticket()]
+    current = [ticket(), ticket()]
+    diff = diff_listings(previous, current)
+    assert diff.new == [ticket()]
+    assert diff_listings(current, previous).removed == [ticket()]
+
+
+def test_removal_alone_is_not_an_update():
+    diff = diff_listings([ticket(), ticket(location="Parterre")], [ticket()])
+    assert diff.removed == [ticket(location="Parterre")]
+    assert not diff.has_updates
+
+
+def test_apply_diff_rebuilds_current_listing():
+    previous = [ticket(), ticket(), ticket(location="Parterre"), ticket(location="Tribuna")]
+    current = [ticket(), ticket(price="€ 50,00"), ticket(location="Tribuna"), ticket(location="Curva")]
+    rebuilt = apply_diff(previous, diff_listings(previous, current))
+    key = lambda t: ticket_fingerprint(t)
+    assert sorted(rebuilt, key=key) == sorted(current, key=key)
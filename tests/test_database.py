@@ -0,0 +1,84 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+import database
+
+VASCO = "https://www.fansale.it/tickets/all/vasco-rossi/520"
+LIGABUE = "https://www.fansale.it/tickets/all/ligabue/610"
+
+# Schema e righe di un database creato dalla prima versione del bot, prima delle migrazioni
+BASELINE_ROWS = [
+    (1, VASCO, "12 giu 2026", "Vasco Rossi"),
+    (1, LIGABUE, "20 set 2026", "Ligabue"),
+    (2, VASCO, "12 giu 2026", "Vasco Rossi"),
+    (2, VASCO, "13 giu 2026", "Vasco Rossi"),
+]
+
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "user_data.db")
+    conn = sqlite3.connect(path)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER,
+            link_fansale TEXT,
+            concert_date TEXT,
+            artist_name TEXT,
+            PRIMARY KEY(user_id, link_fansale, concert_date)
+        )
+    ''')
+    conn.executemany(
+        'INSERT INTO users (user_id, link_fansale, concert_date, artist_name) VALUES (?, ?, ?, ?)', BASELINE_ROWS
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(database, "db", database.Database(path))
+    yield path
+    database.close_database()
+
+
+def query(sql):
+    return database.db.run_sync(lambda conn: conn.execute(sql).fetchall())
+
+
+def test_baseline_database_is_migrated_to_the_latest_version(baseline_db):
+    database.setup_database()
+
+    assert query('PRAGMA user_version') == [(database.MIGRATIONS[-1][0],)]
+    assert sorted(query('SELECT link_fansale, artist_name FROM events')) == [
+        (LIGABUE, "Ligabue"), (VASCO, "Vasco Rossi"),
+    ]
+    assert sorted(query('''
+        SELECT s.user_id, e.link_fansale, s.concert_date FROM subscriptions s JOIN events e ON e.id = s.event_id
+    ''')) == sorted((user_id, link, date) for user_id, link, date, _ in BASELINE_ROWS)
+    # Vista di compatibilità con la vecchia tabella
+    assert sorted(query('SELECT user_id, link_fansale, concert_date, artist_name FROM users')) == sorted(BASELINE_ROWS)
+    for table in ("listing_snapshots", "pending_notifications", "stream_offsets", "user_state", "leases"):
+        assert query(f'SELECT COUNT(*) FROM {table}') == [(0,)]
+
+
+def test_migrated_trackers_are_usable(baseline_db):
+    database.setup_database()
+
+    async def scenario():
+        trackers = await database.get_tracked_events()
+        assert sorted(trackers[VASCO]) == [
+            (1, "Vasco Rossi", "12 giu 2026"), (2, "Vasco Rossi", "12 giu 2026"), (2, "Vasco Rossi", "13 giu 2026"),
+        ]
+        await database.remove_tracker(2, VASCO, "13 giu 2026")
+        await database.update_user_data(3, "Ligabue", LIGABUE, "20 set 2026")
+        return await database.get_user_trackers(2), await database.get_user_trackers(3)
+
+    assert asyncio.run(scenario()) == ([("Vasco Rossi", VASCO, "12 giu 2026")], [("Ligabue", LIGABUE, "20 set 2026")])
+    assert query('SELECT COUNT(*) FROM events') == [(2,)]
+
+
+def test_setup_is_idempotent(baseline_db):
+    database.setup_database()
+    database.setup_database()
+
+    assert query('PRAGMA user_version') == [(database.MIGRATIONS[-1][0],)]
+    assert len(query('SELECT * FROM users')) == len(BASELINE_ROWS)
@@ -0,0 +1,35 @@
+from lxml import html
+
+from change_detection import ticket_fingerprint
+from http_scraper import extract_ticket_rows
+from parsers import TICKET_ROWS_JS, parse_ticket_rows
+
+EXPECTED = [
+    {"day": "12 giu 2026", "location": "Stadio Olimpico Roma", "price": "€ 85,00"},
+    {"day": "12 giu 2026", "location": "Stadio Olimpico, Roma", "price": "€ 1.062,50"},
+]
+
+
+def http_tickets(markup):
+    return parse_ticket_rows(extract_ticket_rows(html.fromstring(markup)))
+
+
+def test_http_engine_reads_visible_text(fixture_html):
+    assert http_tickets(fixture_html("fansale_event_engines.html")) == EXPECTED
+
+
+def test_fields_are_normalized_for_both_engines():
+    row = {"classes": "js-EventEntry", "href": None, "name": "Prato",
+           "day": "12.\xa0giu\xa026\n", "location": "Stadio\nOlimpico", "price": "€\xa045,00 "}
+    assert parse_ticket_rows([row]) == [{"day": "12 giu 2026", "location": "Stadio Olimpico", "price": "€ 45,00"}]
+
+
+def test_browser_and_http_engines_agree(run_in_page, fixture_html):
+    markup = fixture_html("fansale_event_engines.html")
+
+    async def scenario(page):
+        return parse_ticket_rows(await page.eval_on_selector_all(".js-EventEntry", TICKET_ROWS_JS))
+
+    browser_tickets = run_in_page(markup, scenario)
+    assert browser_tickets == http_tickets(markup) == EXPECTED
+    assert [ticket_fingerprint(t) for t in browser_tickets] == [ticket_fingerprint(t) for t in EXPECTED]
@@ -0,0 +1,196 @@
+import asyncio
+import re
+
+from lxml import html
+
+from http_scraper import _has_class, _text, _visible_text, extract_ticket_rows
+from parsers import (
+    CONCERT_ROWS_JS, SUGGESTION_ROWS_JS, TICKET_ROWS_JS,
+    normalize_text, parse_concert_rows, parse_suggestion_rows, parse_ticket_rows,
+)
+
+# Estrazione precedente, un round-trip per elemento: riferimento per verificare
+# che l'unica chiamata a eval_on_selector_all produca lo stesso risultato. I
+# campi dei biglietti sono normalizzati come fa oggi parse_ticket_rows (spazi
+# con normalize_text, anno a quattro cifre mantenuto).
+
+EXPECTED_SUGGESTIONS = [
+    ("Vasco Rossi", "Evento", "/fansale/tickets/pop-rock/vasco-rossi/520"),
+    ("Vasco Tribute Band", "Evento", "/fansale/tickets/pop-rock/vasco-rossi-tribute/521"),
+]
+EXPECTED_CONCERTS = [
+    {"date": "ven 12 giugno 2026", "location": "Roma, Stadio Olimpico"},
+    {"date": "mar 16 giugno 2026", "location": "Milano, Ippodromo SNAI San Siro"},
+]
+# Riga nascosta e riga senza prezzo escluse
+EXPECTED_TICKETS = [
+    {"day": "12 giu 2026", "location": "Stadio Olimpico, Roma", "price": "€ 85,00"},
+    {"day": "13 giu 2026", "location": "Stadio Olimpico, Roma", "price": "€ 62,50"},
+    {"day": "Abbonamento", "location": "Arena di Verona", "price": "€ 1.250,00"},
+]
+
+
+async def legacy_suggestions(page):
+    results_list = []
+    for result in await page.query_selector_all("li.SuggestionList-Suggestion a.Suggestion-Link"):
+        result_name = await (await result.query_selector(".Suggestion-Name")).inner_text()
+        result_type = await (await result.query_selector(".Suggestion-Type")).inner_text()
+        result_link = await result.get_attribute("href")
+        if result_type == "Evento":
+            results_list.append((result_name, result_type, result_link))
+    return results_list
+
+
+async def legacy_concerts(page):
+    concert_list = []
+    for entry in await page.query_selector_all('article.listing-item'):
+        date = (
+            f"{await (await entry.query_selector('.event-listing-date')).inner_text()} "
+            f"{await (await entry.query_selector('.event-listing-month')).inner_text()}"
+        )
+        city = await (await entry.query_selector('.event-listing-city')).inner_text()
+        venue = await (await entry.query_selector('.event-listing-venue')).inner_text()
+        location = f"{city}, {venue}"
+        if "PACKAGE" in location:
+            continue
+        concert_list.append({"date": date, "location": location})
+    return concert_list
+
+
+async def legacy_tickets(page):
+    ticket_data = []
+    for entry in await page.query_selector_all('.js-EventEntry'):
+        if 'hidden' in (await entry.get_attribute('class')).split():
+            continue
+        try:
+            day_element = await entry.query_selector('.EvEntryRow-Day') or await entry.query_selector('.EvEntryRow-SubscriptionDateElement')
+            raw_day = normalize_text(await day_element.inner_text())
+            match = re.match(r'(\d{1,2})\.? (\w+) ?(\d{4}|\d{2})?', raw_day)
+            if match:
+                day, month, year = match.groups()
+                if year:
+                    formatted_date = f"{day} {month} {year if len(year) == 4 else '20' + year}"
+                else:
+                    formatted_date = f"{day} {month}"
+            else:
+                formatted_date = raw_day
+            await (await entry.query_selector('.EvEntryRow-smallSubtitle')).inner_text()
+            location = normalize_text(await (await entry.query_selector('.EvEntryRow-highlightedTitle')).inner_text())
+            price_element = await entry.query_selector('.EvEntryRow-moneyValueFormatSmall') or await entry.query_selector('.EvEntryRow-moneyValueFormat')
+            price = normalize_text(await price_element.inner_text())
+            ticket_data.append({'day': formatted_date, 'location': location, 'price': price})
+        except Exception:
+            pass
+    return ticket_data
+
+
+def compare(run_in_page, markup, selector, script, parse, legacy):
+    async def scenario(page):
+        rows = await page.eval_on_selector_all(selector, script)
+        return parse(rows), await legacy(page)
+    return run_in_page(markup, scenario)
+
+
+# Le stesse righe lette con lxml, come fa l'engine HTTP: parser e riferimento
+# vengono verificati anche dove il browser non è installato
+
+def _xpath(selector):
+    # Solo i selettori usati qui: "tag.classe" separati da spazi (discendenti)
+    steps = []
+    for part in selector.split():
+        tag, _, class_name = part.partition(".")
+        steps.append(f"{tag or '*'}[{_has_class(class_name)}]" if class_name else tag)
+    return ".//" + "//".join(steps)
+
+
+class LxmlElement:
+    """ElementHandle di Playwright su un elemento lxml, con inner_text come _visible_text."""
+
+    def __init__(self, element):
+        self.element = element
+
+    async def query_selector_all(self, selector):
+        return [LxmlElement(element) for element in self.element.xpath(_xpath(selector))]
+
+    async def query_selector(self, selector):
+        elements = await self.query_selector_all(selector)
+        return elements[0] if elements else None
+
+    async def get_attribute(self, name):
+        return self.element.get(name)
+
+    async def inner_text(self):
+        # innerText non inizia né finisce con gli a capo degli elementi di blocco
+        return _visible_text(self.element).strip("\n")
+
+
+def legacy_without_browser(legacy, markup):
+    return asyncio.run(legacy(LxmlElement(html.fromstring(markup))))
+
+
+def lxml_suggestion_rows(markup):
+    entries = html.fromstring(markup).xpath(
+        f"//li[{_has_class('SuggestionList-Suggestion')}]//a[{_has_class('Suggestion-Link')}]"
+    )
+    return [{
+        "name": _text(entry, "Suggestion-Name"),
+        "type": _text(entry, "Suggestion-Type"),
+        "href": entry.get("href"),
+    } for entry in entries]
+
+
+def lxml_concert_rows(markup):
+    entries = html.fromstring(markup).xpath(f"//article[{_has_class('listing-item')}]")
+    return [{
+        "date": _text(entry, "event-listing-date"),
+        "month": _text(entry, "event-listing-month"),
+        "city": _text(entry, "event-listing-city"),
+        "venue": _text(entry, "event-listing-venue"),
+    } for entry in entries]
+
+
+def test_suggestion_rows_from_fixture(fixture_html):
+    rows = [{**row, "name": normalize_text(row["name"]), "type": normalize_text(row["type"])}
+            for row in lxml_suggestion_rows(fixture_html("fansale_suggestions.html"))]
+    assert parse_suggestion_rows(rows) == EXPECTED_SUGGESTIONS
+
+
+def test_concert_rows_from_fixture(fixture_html):
+    rows = [{key: normalize_text(value) for key, value in row.items()}
+            for row in lxml_concert_rows(fixture_html("ticketone_listing.html"))]
+    assert parse_concert_rows(rows) == EXPECTED_CONCERTS
+
+
+def test_ticket_rows_from_fixture(fixture_html):
+    rows = extract_ticket_rows(html.fromstring(fixture_html("fansale_event.html")))
+    assert parse_ticket_rows(rows) == EXPECTED_TICKETS
+
+
+def test_legacy_reference_without_browser(fixture_html):
+    assert legacy_without_browser(legacy_suggestions, fixture_html("fansale_suggestions.html")) == EXPECTED_SUGGESTIONS
+    assert legacy_without_browser(legacy_concerts, fixture_html("ticketone_listing.html")) == EXPECTED_CONCERTS
+    assert legacy_without_browser(legacy_tickets, fixture_html("fansale_event.html")) == EXPECTED_TICKETS
+
+
+def test_suggestions_match_legacy_extraction(run_in_page, fixture_html):
+    current, legacy = compare(
+        run_in_page, fixture_html("fansale_suggestions.html"),
+        "li.SuggestionList-Suggestion a.Suggestion-Link", SUGGESTION_ROWS_JS, parse_suggestion_rows, legacy_suggestions,
+    )
+    assert current == legacy == EXPECTED_SUGGESTIONS
+
+
+def test_concerts_match_legacy_extraction(run_in_page, fixture_html):
+    current, legacy = compare(
+        run_in_page, fixture_html("ticketone_listing.html"),
+        "article.listing-item", CONCERT_ROWS_JS, parse_concert_rows, legacy_concerts,
+    )
+    assert current == legacy == EXPECTED_CONCERTS
+
+
+def test_tickets_match_legacy_extraction(run_in_page, fixture_html):
+    current, legacy = compare(
+        run_in_page, fixture_html("fansale_event.html"),
+        ".js-EventEntry", TICKET_ROWS_JS, parse_ticket_rows, legacy_tickets,
+    )
+    assert current == legacy == EXPECTED_TICKETS
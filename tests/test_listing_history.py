@@ -0,0 +1,168 @@
+import pytest
+
+from database import Database
+from listing_history import _compact, _query, _record_snapshots, _setup
+from parsers import parse_price_cents
+
+HOUR = 3600
+DAY = 86400
+NOW = 1_800_000_000 - 1_800_000_000 % HOUR
+RETENTION = 30 * DAY
+DOWNSAMPLE_AFTER = 7 * DAY
+
+PAGE = "https://www.fansale.it/tickets/all/vasco/1"
+OLD_PAGE = "https://www.fansale.it/tickets/all/ligabue/2"
+
+
+def ticket(location="Prato", price="€ 45,00", day="12.06.2026"):
+    return {"day": day, "location": location, "price": price}
+
+
+@pytest.fixture
+def history(tmp_path):
+    db = Database(str(tmp_path / "history.db"))
+    db.run_sync(_setup)
+
+    def record(*snapshots):
+        db.run_sync(_record_snapshots, list(snapshots))
+
+    def compact():
+        return db.run_sync(_compact, NOW, HOUR, DOWNSAMPLE_AFTER, RETENTION)
+
+    def query(url, since=0, until=NOW + 1):
+        return db.run_sync(_query, url, None, since, until)
+
+    def count(table):
+        return db.run_sync(lambda conn: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0])
+
+    yield record, compact, query, count
+    db.close()
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("€ 1.234,50", 123450),
+    ("45,00 €", 4500),
+    ("€ 45", 4500),
+    ("2 x € 45,00", 4500),
+    ("2x45,00 €", 4500),
+    ("3 × 12,5 €", 1250),
+    ("€ 90,00 (2 x € 45,00)", 4500),
+    ("gratis", None),
+    (None, None),
+])
+def test_parse_price_cents(raw, expected):
+    assert parse_price_cents(raw) == expected
+
+
+def test_records_only_changes(history):
+    record, compact, query, count = history
+    record(
+        (PAGE, NOW - 100, [ticket(), ticket()]),
+        (PAGE, NOW - 50, [ticket(), ticket()]),
+        (PAGE, NOW - 10, [ticket(), ticket(price="2 x € 50,00")]),
+    )
+
+    listing, = query(PAGE)["listings"]
+    assert listing["date_key"] == 20260612
+    assert [(c["observed_at"], c["price_cents"], c["delta"]) for c in listing["changes"]] == [
+        (NOW - 100, 4500, 2), (NOW - 10, 4500, -1), (NOW - 10, 5000, 1),
+    ]
+    assert count("history_changes") == 3
+
+
+def test_compact_downsamples_old_changes(history):
+    record, compact, query, count = history
+    old = NOW - 10 * DAY
+    record(
+        (PAGE, old + 10, [ticket()]),
+        (PAGE, old + 20, [ticket(), ticket(), ticket()]),
+        # Comparso e scomparso nello stesso intervallo
+        (PAGE, old + 30, [ticket(), ticket(), ticket(), ticket(location="Tribuna")]),
+        (PAGE, old + 40, [ticket(), ticket(), ticket()]),
+        (PAGE, NOW - 60, [ticket(), ticket(), ticket()]),
+    )
+
+    compact()
+
+    result = query(PAGE)
+    listing, = result["listings"]
+    assert [(c["observed_at"], c["location"], c["delta"]) for c in listing["changes"]] == [(old, "Prato", 3)]
+    assert [(p["observed_at"], p["checks"], p["changes"], p["tickets"]) for p in result["polls"]] == [
+        (old, 4, 4, 4), (NOW - 60, 1, 0, 3),
+    ]
+    # Il luogo non compare più in nessuna variazione né nell'elenco attuale
+    assert count("history_locations") == 1
+
+
+def test_compact_keeps_listing_at_retention_boundary(history):
+    record, compact, query, count = history
+    record(
+        (PAGE, NOW - 40 * DAY, [ticket(), ticket(), ticket(location="Tribuna")]),
+        (PAGE, NOW - 35 * DAY, [ticket(), ticket(location="Tribuna")]),
+        (PAGE, NOW - DAY, [ticket()]),
+    )
+
+    compact()
+
+    boundary = NOW - RETENTION
+    listing, = query(PAGE)["listings"]
+    assert sorted((c["observed_at"], c["location"], c["delta"]) for c in listing["changes"]) == [
+        (boundary, "Prato", 1), (boundary, "Tribuna", 1), (NOW - DAY, "Tribuna", -1),
+    ]
+    assert query(PAGE, since=NOW - DAY)["listings"][0]["initial"] == [
+        {"location": "Prato", "price_cents": 4500, "count": 1},
+        {"location": "Tribuna", "price_cents": 4500, "count": 1},
+    ]
+    assert [p["observed_at"] for p in query(PAGE)["polls"]] == [NOW - DAY]
+
+
+def test_compact_purges_pages_not_scraped_within_retention(history):
+    record, compact, query, count = history
+    record(
+        (OLD_PAGE, NOW - 40 * DAY, [ticket(location="Tribuna"), ticket(location="Tribuna", day="13.06.2026")]),
+        (PAGE, NOW - DAY, [ticket()]),
+    )
+
+    purged = compact()
+
+    assert purged == {"urls": 1, "listings": 2, "locations": 1}
+    assert query(OLD_PAGE) == {"url": OLD_PAGE, "since": 0, "until": NOW + 1, "listings": [], "polls": []}
+    assert (count("history_urls"), count("history_listings"), count("history_locations")) == (1, 1, 1)
+    assert (count("history_changes"), count("history_current")) == (1, 1)
+    assert compact() == {"urls": 0, "listings": 0, "locations": 0}
+
+    # La pagina torna a essere letta: riceve nuovi id
+    record((OLD_PAGE, NOW, [ticket(location="Tribuna")]))
+    listing, = query(OLD_PAGE)["listings"]
+    assert listing["changes"] == [{"observed_at": NOW, "location": "Tribuna", "price_cents": 4500, "delta": 1}]
+
+
+def test_purge_by_another_process_is_seen_by_the_next_flush(history, tmp_path):
+    record, compact, query, count = history
+    other_process = Database(str(tmp_path / "history.db"))
+    record((OLD_PAGE, NOW - 40 * DAY, [ticket(location="Tribuna")]), (PAGE, NOW - DAY, [ticket()]))
+    try:
+        other_process.run_sync(_compact, NOW, HOUR, DOWNSAMPLE_AFTER, RETENTION)
+    finally:
+        other_process.close()
+
+    record((OLD_PAGE, NOW, [ticket(location="Tribuna")]))
+    listing, = query(OLD_PAGE)["listings"]
+    assert listing["changes"] == [{"observed_at": NOW, "location": "Tribuna", "price_cents": 4500, "delta": 1}]
+    # Nessuna variazione scritta per date o luoghi eliminati
+    assert count("history_changes") == 2
+    assert count("history_changes WHERE listing_id NOT IN (SELECT id FROM history_listings)") == 0
+    assert count("history_changes WHERE location_id NOT IN (SELECT id FROM history_locations)") == 0
+
+
+def test_compact_purges_dates_no_longer_listed(history):
+    record, compact, query, count = history
+    record(
+        (PAGE, NOW - 40 * DAY, [ticket(day="12.06.2026"), ticket(day="13.06.2026")]),
+        (PAGE, NOW - 39 * DAY, [ticket(day="13.06.2026")]),
+        (PAGE, NOW - DAY, [ticket(day="13.06.2026")]),
+    )
+
+    assert compact() == {"urls": 0, "listings": 1, "locations": 0}
+
+    assert [listing["date_key"] for listing in query(PAGE)["listings"]] == [20260613]
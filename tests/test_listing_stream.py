@@ -0,0 +1,166 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import listing_stream
+from listing_monitor import format_sse
+from listing_stream import ListingStreamConsumer, parse_sse
+
+
+class FakeStreamClient:
+    """Microservizio finto: `lines_for(offset)` dà le righe SSE di ogni connessione."""
+
+    def __init__(self, lines_for):
+        self.lines_for = lines_for
+        self.connections = []
+        self.subscriptions = []
+
+    async def put(self, endpoint, payload):
+        self.subscriptions.append(payload)
+        return {"added": len(payload["watches"]), "removed": 0}
+
+    @asynccontextmanager
+    async def events(self, endpoint, params, read_timeout):
+        self.connections.append(params["offset"])
+        lines = self.lines_for(params["offset"])
+
+        async def aiter_lines():
+            for line in lines:
+                yield line
+            # Connessione aperta in attesa di nuovi eventi
+            await asyncio.Event().wait()
+
+        yield SimpleNamespace(aiter_lines=aiter_lines)
+
+
+def sse_lines(*events):
+    return "".join(format_sse(*event) for event in events).split("\n")
+
+
+def change(offset):
+    return ("change", {"offset": offset, "url": "u", "concert_date": "12 giu"}, offset)
+
+
+class Store:
+    def __init__(self, offset=0):
+        self.offset = offset
+        self.saved = []
+
+    async def load(self):
+        return self.offset
+
+    async def save(self, offset):
+        self.offset = offset
+        self.saved.append(offset)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(listing_stream, "random", SimpleNamespace(uniform=lambda a, b: 0))
+
+
+async def run_until(consumer, condition):
+    await consumer.start()
+    try:
+        for _ in range(200):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError("condizione non raggiunta")
+    finally:
+        await consumer.stop()
+
+
+def make_consumer(client, store, handle_event):
+    return ListingStreamConsumer(
+        client, "bot", load_offset=store.load, save_offset=store.save,
+        handle_event=handle_event, read_timeout=30, max_event_attempts=3,
+    )
+
+
+def test_parse_sse_skips_heartbeats():
+    async def scenario():
+        async def lines():
+            for line in [": heartbeat", "", *sse_lines(change(7))]:
+                yield line
+        return [event async for event in parse_sse(lines())]
+
+    events = asyncio.run(scenario())
+    assert [(kind, event_id, json.loads(data)["offset"]) for kind, event_id, data in events] == [("change", "7", 7)]
+
+
+def test_reset_offset_is_saved_after_resync():
+    async def scenario():
+        store = Store(offset=50)
+        client = FakeStreamClient(lambda offset: sse_lines(
+            ("reset", {"offset": 10, "requested": offset, "oldest": 5, "latest": 10}, 10)
+        ) if offset > 10 else [])
+        consumer = make_consumer(client, store, handle_event=None)
+        await consumer.sync([("u", "12 giu")])
+        await run_until(consumer, lambda: store.saved)
+        assert store.saved == [10]
+        assert client.subscriptions[-1]["resync"] is True
+
+    asyncio.run(scenario())
+
+
+def test_reset_before_first_sync_is_saved_with_it():
+    async def scenario():
+        store = Store(offset=50)
+        client = FakeStreamClient(lambda offset: sse_lines(
+            ("reset", {"offset": 10, "requested": offset, "oldest": 5, "latest": 10}, 10)
+        ))
+        consumer = make_consumer(client, store, handle_event=None)
+        await run_until(consumer, lambda: consumer.resyncs)
+        assert store.saved == []
+        await consumer.sync([("u", "12 giu")])
+        assert client.subscriptions[-1]["resync"] is True
+        assert store.saved == [10]
+
+    asyncio.run(scenario())
+
+
+def test_poison_event_is_skipped_after_max_attempts():
+    async def scenario():
+        store = Store(offset=4)
+        applied = []
+
+        async def handle_event(event):
+            if event["offset"] == 5:
+                raise KeyError("new")
+            applied.append(event["offset"])
+            store.offset = event["offset"]
+
+        client = FakeStreamClient(lambda offset: sse_lines(*(change(o) for o in (5, 6) if o > offset)))
+        consumer = make_consumer(client, store, handle_event)
+        await run_until(consumer, lambda: applied)
+        assert client.connections == [4, 4, 4]
+        assert store.saved == [5]
+        assert applied == [6]
+        assert consumer.stats()["skipped_events"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_transient_failure_is_retried():
+    async def scenario():
+        store = Store(offset=4)
+        failures = [RuntimeError("database is locked")]
+        applied = []
+
+        async def handle_event(event):
+            if failures:
+                raise failures.pop()
+            applied.append(event["offset"])
+
+        client = FakeStreamClient(lambda offset: sse_lines(change(5)))
+        consumer = make_consumer(client, store, handle_event)
+        await run_until(consumer, lambda: applied)
+        assert applied == [5]
+        assert store.saved == []
+        assert consumer.stats()["skipped_events"] == 0
+
+    asyncio.run(scenario())
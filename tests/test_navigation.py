@@ -0,0 +1,71 @@
+import asyncio
+from types import SimpleNamespace
+
+from navigation import PROFILES, NavigationStats, goto_with_profile
+
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type)
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = "abort"
+
+    async def continue_(self):
+        self.outcome = "continue"
+
+
+class FakePage:
+    """Pagina che, a ogni goto, fa passare dagli handler registrati le richieste indicate."""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.handlers = []
+
+    async def route(self, pattern, handler):
+        self.handlers.append(handler)
+
+    async def goto(self, url, wait_until):
+        routes = [FakeRoute(*request) for request in self.requests]
+        for route in routes:
+            for handler in self.handlers:
+                await handler(route)
+        return routes
+
+
+REQUESTS = [
+    ("https://www.fansale.it/event", "document"),
+    ("https://www.fansale.it/logo.png", "image"),
+    ("https://www.google-analytics.com/collect", "xhr"),
+    ("https://www.fansale.it/app.css", "stylesheet"),
+]
+
+
+def test_route_is_registered_once_per_page():
+    async def scenario():
+        page = FakePage(REQUESTS)
+        stats = NavigationStats()
+        await goto_with_profile(page, "https://www.fansale.it/event", PROFILES["lean"], stats)
+        routes = await goto_with_profile(page, "https://www.fansale.it/event", PROFILES["strict"], stats)
+        assert len(page.handlers) == 1
+        # Vale il profilo dell'ultima navigazione
+        assert [route.outcome for route in routes] == ["continue", "abort", "abort", "abort"]
+        assert [entry["blocked_requests"] for entry in stats.recent] == [2, 3]
+        assert stats.blocked_requests == 5
+
+    asyncio.run(scenario())
+
+
+def test_full_profile_does_not_intercept():
+    async def scenario():
+        page = FakePage(REQUESTS)
+        stats = NavigationStats()
+        await goto_with_profile(page, "https://www.fansale.it/event", PROFILES["full"], stats)
+        assert page.handlers == []
+        routes = await goto_with_profile(page, "https://www.fansale.it/event", PROFILES["lean"], stats)
+        assert len(page.handlers) == 1
+        assert sum(route.outcome == "abort" for route in routes) == 2
+        assert stats.to_dict()["pages"] == 2
+
+    asyncio.run(scenario())
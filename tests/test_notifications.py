@@ -0,0 +1,45 @@
+import asyncio
+
+import notifications
+from notifications import MAX_MESSAGE_LENGTH, NotificationDispatcher, merge_messages
+
+
+def test_merge_messages_stops_at_telegram_limit():
+    rows = [(1, "a" * 3000), (2, "b" * 1000), (3, "c" * 200)]
+    text, ids = merge_messages(rows)
+    assert ids == [1, 2]
+    assert len(text) <= MAX_MESSAGE_LENGTH
+    assert merge_messages([(1, "x" * 5000)]) == ("x" * MAX_MESSAGE_LENGTH, [1])
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+
+def test_chat_waiting_for_its_limit_does_not_hold_a_global_token(monkeypatch):
+    async def noop(*args):
+        pass
+
+    monkeypatch.setattr(notifications, "delete_notifications", noop)
+
+    async def scenario():
+        dispatcher = NotificationDispatcher(
+            global_rate=1, chat_rate=0.2, concurrency=4, max_attempts=3, retry_backoff=1
+        )
+        dispatcher.bot = FakeBot()
+        # La chat 1 ha appena ricevuto un messaggio: il prossimo invio attende 5 s
+        await dispatcher._chat_bucket(1).acquire()
+        for chat_id in (1, 2):
+            await dispatcher._slots.acquire()
+        waiting = asyncio.create_task(dispatcher._deliver(1, [(10, "uno", 0)]))
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(dispatcher._deliver(2, [(20, "due", 0)]), timeout=0.5)
+        assert dispatcher.bot.sent == [2]
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from parsers import parse_concert_json, parse_concert_rows, parse_result_links_json, parse_suggestion_json
+
+
+def test_concert_json_matches_dom_format(fixture_html):
+    payload = json.loads(fixture_html("ticketone_listing.json"))
+    # Stesse date e luoghi dell'elenco HTML di ticketone ("ven 12" + "giugno 2026")
+    assert parse_concert_json(payload) == [
+        {"date": "ven 12 giugno 2026", "location": "Roma, Stadio Olimpico"},
+        {"date": "mar 16 giugno 2026", "location": "Milano, Ippodromo SNAI San Siro"},
+    ]
+
+
+def test_concert_json_and_dom_rows_agree(fixture_html):
+    dom = parse_concert_rows([
+        {"date": "ven 12", "month": "giugno 2026", "city": "Roma", "venue": "Stadio Olimpico"},
+        {"date": "sab 13", "month": "giugno 2026", "city": "Roma", "venue": "PACKAGE VIP - Stadio Olimpico"},
+        {"date": "mar 16", "month": "giugno 2026", "city": "Milano", "venue": "Ippodromo SNAI San Siro"},
+    ])
+    assert parse_concert_json(json.loads(fixture_html("ticketone_listing.json"))) == dom
+
+
+def test_unparseable_event_date_raises():
+    with pytest.raises(ValueError):
+        parse_concert_json({"events": [{"date": "domani", "venue": "Arena", "city": "Verona"}]})
+
+
+@pytest.mark.parametrize("payload", [
+    {"results": []},
+    {"data": {"items": []}},
+    {"errors": [], "data": {"suggestions": []}},
+    [],
+])
+def test_empty_result_list_means_no_results(payload):
+    assert parse_suggestion_json(payload) == []
+    assert parse_result_links_json(payload) == []
+
+
+@pytest.mark.parametrize("payload", [
+    {"errors": []},
+    {"meta": {"warnings": []}, "status": "ok"},
+    {"results": "n/a"},
+    {},
+])
+def test_unknown_structure_falls_back_to_dom(payload):
+    with pytest.raises(ValueError):
+        parse_suggestion_json(payload)
+
+
+def test_items_are_found_next_to_unrelated_empty_lists():
+    payload = {"errors": [], "data": {"suggestions": [
+        {"name": "Vasco Rossi", "type": "Evento", "url": "/vasco/520"},
+        {"name": "Vasco Rossi", "type": "Artista", "url": "/artist/vasco"},
+    ]}}
+    assert parse_suggestion_json(payload) == [("Vasco Rossi", "Evento", "/vasco/520")]
+    assert parse_result_links_json(payload) == ["/vasco/520", "/artist/vasco"]
@@ -0,0 +1,93 @@
+from datetime import date, timedelta
+
+import pytest
+
+from polling_scheduler import AdaptiveScheduler, days_until_concert
+
+
+def concert_on(days):
+    day = date.today() + timedelta(days=days)
+    return f"{day.day:02d}.{day.month:02d}.{day.year}"
+
+
+def trackers(days, subscribers=1):
+    return [(user_id, "Artista", concert_on(days)) for user_id in range(subscribers)]
+
+
+def make_scheduler(budget=60):
+    return AdaptiveScheduler(budget_per_minute=budget, min_interval=60, max_interval=6 * 3600)
+
+
+def test_days_until_concert_prefers_nearest_upcoming_date():
+    today = date(2026, 6, 1)
+    assert days_until_concert(["12.06.2026", "05.06.2026", "10.05.2026"], today) == 4
+    assert days_until_concert(["10.05.2026", "20.05.2026"], today) < 0
+    assert days_until_concert(["15 mag"], today) == 348
+    assert days_until_concert(["Abbonamento"], today) is None
+
+
+def test_events_are_dispatched_in_due_order():
+    scheduler = make_scheduler()
+    scheduler.sync({"a": trackers(60), "b": trackers(1), "c": trackers(10)}, now=0)
+    assert sorted(scheduler.pop_due(now=0)) == ["a", "b", "c"]
+    for link in ("a", "b", "c"):
+        scheduler.record_result(link, changed=False, now=0)
+
+    # Il concerto più vicino torna per primo
+    order = []
+    for now in range(60, 4 * 3600, 60):
+        for link in scheduler.pop_due(now=now):
+            order.append(link)
+            scheduler.record_result(link, changed=False, now=now)
+    assert order[:3] == ["b", "b", "b"]
+    assert order.index("c") < order.index("a")
+
+
+def test_in_flight_event_is_not_dispatched_twice():
+    scheduler = make_scheduler()
+    scheduler.sync({"a": trackers(1)}, now=0)
+    assert scheduler.pop_due(now=0) == ["a"]
+    assert scheduler.pop_due(now=10_000) == []
+    scheduler.record_result("a", changed=False, now=10_000)
+    assert scheduler.pop_due(now=10_000 + 5 * 60) == ["a"]
+
+
+def test_recent_changes_and_subscribers_shorten_the_interval():
+    scheduler = make_scheduler()
+    scheduler.sync({"quiet": trackers(20), "changed": trackers(20), "popular": trackers(20, subscribers=10)}, now=0)
+    scheduler.pop_due(now=0)
+    scheduler.record_result("quiet", changed=False, now=0)
+    scheduler.record_result("changed", changed=True, now=0)
+    scheduler.record_result("popular", changed=False, now=0)
+    intervals = {link: state.interval for link, state in scheduler._events.items()}
+    assert intervals["quiet"] == 30 * 60
+    assert intervals["changed"] == 15 * 60
+    assert intervals["popular"] == 15 * 60
+
+
+def test_budget_limits_dispatches_per_minute():
+    scheduler = make_scheduler(budget=5)
+    scheduler.sync({f"event-{i}": trackers(1) for i in range(20)}, now=0)
+    assert len(scheduler.pop_due(now=0)) == 5
+    assert scheduler.pop_due(now=0) == []
+    # Un token ogni 12 secondi
+    assert len(scheduler.pop_due(now=12)) == 1
+
+
+def test_demand_above_budget_stretches_intervals():
+    scheduler = make_scheduler(budget=2)
+    scheduler.sync({f"event-{i}": trackers(1) for i in range(20)}, now=0)
+    # 20 eventi ogni 5 minuti = 4 scraping al minuto, il doppio del budget
+    assert scheduler.stats(now=0)["interval_stretch"] == 2.0
+    scheduler.pop_due(now=0)
+    scheduler.record_result("event-0", changed=False, now=0)
+    assert scheduler._events["event-0"].interval == pytest.approx(10 * 60)
+
+
+def test_removed_events_are_dropped():
+    scheduler = make_scheduler()
+    scheduler.sync({"a": trackers(1), "b": trackers(1)}, now=0)
+    scheduler.sync({"b": trackers(1)}, now=0)
+    assert scheduler.pop_due(now=0) == ["b"]
+    scheduler.record_result("a", changed=False, now=0)
+    assert scheduler.stats(now=0)["events"] == 1
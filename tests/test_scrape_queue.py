@@ -0,0 +1,153 @@
+import asyncio
+import time
+
+import pytest
+
+from scrape_queue import DEAD, DONE, QUEUED, RUNNING, InMemoryQueue, JobFailed, JobWaiter, SQLiteQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    def make(**options):
+        options.setdefault("retry_backoff", 0)
+        if request.param == "memory":
+            return InMemoryQueue(**options)
+        return SQLiteQueue(str(tmp_path / "queue.db"), **options)
+    return make
+
+
+def expire_lease(queue, job_id):
+    # Sposta indietro visible_at come se fosse trascorso il visibility timeout
+    if isinstance(queue, InMemoryQueue):
+        queue._jobs[job_id].visible_at = 0
+    else:
+        with queue._connection() as conn:
+            conn.execute('UPDATE scrape_jobs SET visible_at = 0 WHERE id = ?', (job_id,))
+
+
+def test_claimed_job_is_invisible_until_lease_expires(make_queue):
+    queue = make_queue(visibility_timeout=60)
+    job_id = queue.enqueue("search_tickets", {"url": "https://example.com"})
+    job = queue.claim()
+    assert (job.id, job.status, job.attempts) == (job_id, RUNNING, 1)
+    assert queue.claim() is None
+
+    expire_lease(queue, job_id)
+    job = queue.claim()
+    assert (job.id, job.attempts) == (job_id, 2)
+
+
+def test_jobs_are_claimed_in_creation_order(make_queue):
+    queue = make_queue()
+    first = queue.enqueue("search_tickets", {"url": "a"})
+    second = queue.enqueue("search_tickets", {"url": "b"})
+    assert [queue.claim().id, queue.claim().id] == [first, second]
+
+
+def test_failed_job_is_retried_then_dead_lettered(make_queue):
+    queue = make_queue(max_attempts=2)
+    job_id = queue.enqueue("search_tickets", {"url": "a"})
+    queue.fail(queue.claim().id, "boom")
+    assert queue.get(job_id).status == QUEUED
+    queue.fail(queue.claim().id, "boom again")
+    job = queue.get(job_id)
+    assert (job.status, job.attempts, job.error) == (DEAD, 2, "boom again")
+    assert queue.claim() is None
+
+
+def test_expired_lease_on_last_attempt_is_dead_lettered(make_queue):
+    queue = make_queue(max_attempts=1)
+    job_id = queue.enqueue("search_tickets", {"url": "a"})
+    queue.claim()
+    expire_lease(queue, job_id)
+    assert queue.claim() is None
+    job = queue.get(job_id)
+    assert (job.status, job.error) == (DEAD, "visibility timeout")
+
+
+def test_retry_waits_for_backoff(make_queue):
+    queue = make_queue(retry_backoff=60)
+    queue.enqueue("search_tickets", {"url": "a"})
+    queue.fail(queue.claim().id, "boom")
+    assert queue.claim() is None
+
+
+def test_complete_after_remove_is_ignored(make_queue):
+    queue = make_queue()
+    job_id = queue.enqueue("search_tickets", {"url": "a"})
+    queue.claim()
+    queue.remove([job_id])
+    queue.complete(job_id, {"ticket_data": []})
+    assert queue.get(job_id) is None
+    assert queue.stats() == {QUEUED: 0, RUNNING: 0, DONE: 0, DEAD: 0}
+
+
+def test_get_many_and_purge(make_queue):
+    queue = make_queue()
+    ids = [queue.enqueue("search_tickets", {"url": str(i)}) for i in range(3)]
+    queue.complete(queue.claim().id, {"ticket_data": [1]})
+    jobs = queue.get_many(ids + ["missing"])
+    assert set(jobs) == set(ids)
+    assert jobs[ids[0]].status == DONE and jobs[ids[0]].result == {"ticket_data": [1]}
+
+    assert queue.purge(max_age=3600) == 0
+    time.sleep(0.01)
+    assert queue.purge(max_age=0) == 3
+    assert queue.get_many(ids) == {}
+
+
+async def serve(queue, results):
+    # Worker minimo: completa i job secondo `results` (url -> risultato o eccezione)
+    while True:
+        job = queue.claim()
+        if job is None:
+            await asyncio.sleep(0.01)
+            continue
+        outcome = results[job.payload["url"]]
+        if isinstance(outcome, Exception):
+            queue.fail(job.id, str(outcome))
+        elif outcome is not None:
+            queue.complete(job.id, outcome)
+
+
+def test_waiter_reads_results_in_batches(make_queue):
+    queue = make_queue(max_attempts=1)
+    calls = []
+    get_many = queue.get_many
+    queue.get_many = lambda job_ids: calls.append(len(job_ids)) or get_many(job_ids)
+
+    async def scenario():
+        waiter = JobWaiter(queue, poll_interval=0.05)
+        results = {str(i): {"ticket_data": [i]} for i in range(10)}
+        results["bad"] = RuntimeError("boom")
+        worker = asyncio.create_task(serve(queue, results))
+        try:
+            outcomes = await asyncio.gather(
+                *(waiter.run("search_tickets", {"url": url}, timeout=5) for url in results),
+                return_exceptions=True,
+            )
+        finally:
+            worker.cancel()
+        assert outcomes[:10] == [{"ticket_data": [i]} for i in range(10)]
+        assert isinstance(outcomes[10], JobFailed)
+        # Una lettura per passata, non una per job
+        assert max(calls) > 1
+        # I risultati letti sono stati rimossi
+        assert sum(queue.stats().values()) == 0
+
+    asyncio.run(scenario())
+
+
+def test_abandoned_job_is_removed(make_queue):
+    queue = make_queue()
+
+    async def scenario():
+        waiter = JobWaiter(queue, poll_interval=0.01)
+        with pytest.raises(asyncio.TimeoutError):
+            await waiter.run("search_tickets", {"url": "slow"}, timeout=0.05)
+        assert queue.stats()[QUEUED] == 1
+        await waiter._task
+        assert sum(queue.stats().values()) == 0
+        assert waiter.stats() == {"pending": 0, "abandoned": 0}
+
+    asyncio.run(scenario())
@@ -0,0 +1,128 @@
+import asyncio
+
+import httpx
+import pytest
+
+from scraper_client import CircuitBreaker, CircuitOpen, ScraperClient
+
+
+def make_client(handler, retries=2, threshold=3, reset_timeout=60):
+    client = ScraperClient(
+        "http://scraper", "key", connect_timeout=1, read_timeouts={}, retries=retries, retry_backoff=0,
+        breaker=CircuitBreaker(threshold, reset_timeout),
+    )
+    client._client = httpx.AsyncClient(base_url="http://scraper", transport=httpx.MockTransport(handler))
+    return client
+
+
+def responder(*responses):
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+    return handler, calls
+
+
+def test_server_error_is_final_and_does_not_trip_the_breaker():
+    async def scenario():
+        handler, calls = responder(httpx.Response(500, json={"detail": "Internal Server Error"}))
+        client = make_client(handler, threshold=1)
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.post("search_tickets", {"url": "u"})
+        assert len(calls) == 1
+        assert client.stats()["circuit"] == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_gateway_errors_are_retried():
+    async def scenario():
+        handler, calls = responder(httpx.Response(502), httpx.Response(504), httpx.Response(200, json={"ok": True}))
+        client = make_client(handler)
+        assert await client.post("search_tickets", {"url": "u"}) == {"ok": True}
+        assert len(calls) == 3
+        assert client.stats()["retried"] == 2
+        assert client.breaker.failures == 0
+
+    asyncio.run(scenario())
+
+
+def test_transport_errors_open_the_circuit():
+    async def scenario():
+        handler, calls = responder(httpx.ConnectError("refused"))
+        client = make_client(handler, retries=5, threshold=3)
+        with pytest.raises(CircuitOpen):
+            await client.post("search_tickets", {"url": "u"})
+        assert len(calls) == 3
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(scenario())
+
+
+def test_connection_errors_are_retried():
+    async def scenario():
+        handler, calls = responder(
+            httpx.ConnectTimeout("timeout"), httpx.RemoteProtocolError("closed"), httpx.Response(200, json={"ok": True})
+        )
+        client = make_client(handler)
+        assert await client.post("search_tickets", {"url": "u"}) == {"ok": True}
+        assert len(calls) == 3
+
+    asyncio.run(scenario())
+
+
+def test_read_timeout_fails_fast_and_counts_for_the_breaker():
+    async def scenario():
+        handler, calls = responder(httpx.ReadTimeout("timeout"), httpx.Response(200, json={"ok": True}))
+        client = make_client(handler, retries=2, threshold=1)
+        with pytest.raises(httpx.ReadTimeout):
+            await client.post("search_tickets", {"url": "u"})
+        # Lo scraping non viene inviato di nuovo
+        assert len(calls) == 1
+        assert client.stats()["retried"] == 0
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+    asyncio.run(scenario())
+
+
+def test_overloaded_service_is_retried_without_tripping_the_breaker():
+    async def scenario():
+        handler, calls = responder(httpx.Response(503, headers={"retry-after": "0"}), httpx.Response(200, json=[]))
+        client = make_client(handler, threshold=1)
+        assert await client.post("search_tickets", {"url": "u"}) == []
+        assert client.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_trial_request_releases_the_breaker():
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hanging(request):
+            started.set()
+            await asyncio.Event().wait()
+
+        client = make_client(hanging, threshold=1, reset_timeout=0)
+        client.breaker.record_failure()
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+        trial = asyncio.create_task(client.post("search_tickets", {"url": "u"}))
+        await started.wait()
+        assert client.breaker.state == CircuitBreaker.HALF_OPEN
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+        assert client.breaker.state == CircuitBreaker.OPEN
+
+        # Una nuova richiesta di prova può partire subito
+        client._client = httpx.AsyncClient(
+            base_url="http://scraper", transport=httpx.MockTransport(lambda request: httpx.Response(200, json={}))
+        )
+        assert await client.post("search_tickets", {"url": "u"}) == {}
+        assert client.breaker.state == CircuitBreaker.CLOSED
+
+    asyncio.run(scenario())
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import scrape_worker
+import scraper_service
+from scrape_queue import SEARCH_TICKETS
+
+URL = "https://www.fansale.it/tickets/all/vasco-rossi/520"
+
+
+@pytest.fixture
+def fansale(monkeypatch):
+    """Limite per host e pagina HTTP finti: registra gli accessi a fanSALE."""
+    events = []
+
+    class Limiter:
+        async def acquire(self, url):
+            events.append(("acquire", url))
+
+    class Scraper:
+        async def scrape_tickets(self, url):
+            events.append(("scrape", url))
+            return [{"day": "12 giu 2026", "location": "Prato", "price": "€ 45,00"}]
+
+    monkeypatch.setattr(scraper_service, "host_rate_limiter", Limiter())
+    monkeypatch.setattr(scraper_service, "http_scraper", Scraper())
+    monkeypatch.setattr(scraper_service, "SCRAPE_ENGINE", "http")
+    monkeypatch.setattr(scraper_service, "listing_history", None)
+    return events
+
+
+def test_search_tickets_endpoint_is_rate_limited(fansale):
+    request = scraper_service.SearchTicketsRequest(url=URL)
+    result = asyncio.run(scraper_service.search_tickets(request, None))
+    assert result["engine"] == "http"
+    assert fansale == [("acquire", URL), ("scrape", URL)]
+
+
+def test_queue_worker_job_is_rate_limited(fansale):
+    job = SimpleNamespace(kind=SEARCH_TICKETS, payload={"url": URL})
+    result = asyncio.run(scrape_worker.execute_job(job))
+    assert len(result["ticket_data"]) == 1
+    assert fansale == [("acquire", URL), ("scrape", URL)]
+
+
+def test_batch_result_is_rate_limited_once(fansale):
+    result = asyncio.run(scraper_service.scrape_tickets_result(URL, scraper_service.BACKGROUND))
+    assert result["url"] == URL
+    assert fansale == [("acquire", URL), ("scrape", URL)]
+
+
+def test_rate_limit_wait_is_not_part_of_the_timeout(fansale, monkeypatch):
+    class SlowLimiter:
+        async def acquire(self, url):
+            await asyncio.sleep(0.05)
+
+    monkeypatch.setattr(scraper_service, "host_rate_limiter", SlowLimiter())
+    result = asyncio.run(scraper_service.scrape_tickets(URL, timeout=0.02))
+    assert result["engine"] == "http"
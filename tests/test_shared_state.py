@@ -0,0 +1,127 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+
+import pytest
+import telegram
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler, ConversationHandler, MessageHandler, filters
+from telegram.request import BaseRequest
+
+import database
+import shared_state
+from shared_state import SQLitePersistence, SharedStateApplication
+
+ASKING, CONFIRMING = range(2)
+
+
+class OfflineRequest(BaseRequest):
+    """Bot API finta: risponde solo a getMe, chiamato da Application.initialize."""
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        assert url.endswith("/getMe"), url
+        me = {"id": 1, "is_bot": True, "first_name": "Bot", "username": "test_bot"}
+        return 200, json.dumps({"ok": True, "result": me}).encode()
+
+
+@pytest.fixture
+def shared_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "db", database.Database(str(tmp_path / "bot.db")))
+    database.setup_database()
+    yield
+    database.close_database()
+
+
+def make_instance(name, seen):
+    async def start(update, context):
+        context.user_data["started_on"] = name
+        seen.append((name, "start"))
+        return ASKING
+
+    async def answer(update, context):
+        seen.append((name, update.message.text, context.user_data.get("started_on")))
+        return CONFIRMING
+
+    async def confirm(update, context):
+        seen.append((name, "confirm"))
+        return ConversationHandler.END
+
+    application = (
+        ApplicationBuilder().token("1:test").request(OfflineRequest()).get_updates_request(OfflineRequest())
+        .application_class(SharedStateApplication).persistence(SQLitePersistence()).updater(None).build()
+    )
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={
+            ASKING: [MessageHandler(filters.TEXT & ~filters.COMMAND, answer)],
+            CONFIRMING: [MessageHandler(filters.TEXT & ~filters.COMMAND, confirm)],
+        },
+        fallbacks=[],
+        name="main_conversation",
+        persistent=True,
+    ))
+    return application
+
+
+def message_update(application, update_id, text, user_id=42):
+    """Update come lo riceve il server webhook, con il bot dell'istanza associato."""
+    message = {
+        "message_id": update_id,
+        "date": int(datetime.now(timezone.utc).timestamp()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Utente"},
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return Update.de_json({"update_id": update_id, "message": message}, application.bot)
+
+
+def test_pinned_telegram_version_is_installed():
+    # shared_state usa API interne di ConversationHandler: un aggiornamento va verificato
+    assert telegram.__version__ == shared_state.TESTED_PTB_VERSION
+
+
+def test_conversation_continues_on_another_instance(shared_db):
+    async def scenario():
+        seen = []
+        first, second = make_instance("A", seen), make_instance("B", seen)
+        for application in (first, second):
+            await application.initialize()
+        try:
+            await first.process_update(message_update(first, 1, "/start"))
+            await second.process_update(message_update(second, 2, "Vasco Rossi"))
+            await first.process_update(message_update(first, 3, "sì"))
+            # Conversazione terminata su A: B non deve più trovarla nello stato CONFIRMING
+            await second.process_update(message_update(second, 4, "ancora"))
+        finally:
+            for application in (first, second):
+                await application.shutdown()
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert seen == [("A", "start"), ("B", "Vasco Rossi", "A"), ("A", "confirm")]
+
+
+def test_updates_without_user_are_ignored(shared_db):
+    async def scenario():
+        application = make_instance("A", [])
+        await application.initialize()
+        try:
+            # Nessuna chiave di conversazione: l'update passa senza errori
+            await application.process_update(Update(1))
+        finally:
+            await application.shutdown()
+
+    asyncio.run(scenario())
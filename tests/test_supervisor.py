@@ -0,0 +1,96 @@
+import asyncio
+
+import supervisor as supervisor_module
+from supervisor import DRAINING, READY, STARTING, Supervisor, WorkerProcess
+
+
+def make_supervisor(workers, monkeypatch):
+    sup = Supervisor()
+    sup.workers = workers
+    added = []
+
+    def add_worker():
+        worker = WorkerProcess(9000 + len(sup.workers))
+        worker.state = STARTING
+        sup.workers.append(worker)
+        added.append(worker)
+        return worker
+
+    monkeypatch.setattr(sup, "_add_worker", add_worker)
+    monkeypatch.setattr(supervisor_module, "SUPERVISOR_MIN_WORKERS", 1)
+    monkeypatch.setattr(supervisor_module, "SUPERVISOR_MAX_WORKERS", 3)
+    monkeypatch.setattr(supervisor_module, "SUPERVISOR_SCALE_UP_QUEUE_DEPTH", 2)
+    return sup, added
+
+
+def ready_worker(port, in_flight=0, queue_depth=0, admission_queue_depth=0):
+    worker = WorkerProcess(port)
+    worker.state = READY
+    worker.in_flight = in_flight
+    worker.queue_depth = queue_depth
+    worker.admission_queue_depth = admission_queue_depth
+    return worker
+
+
+def test_busy_workers_without_queue_do_not_scale_up(monkeypatch):
+    sup, added = make_supervisor([ready_worker(1, in_flight=10), ready_worker(2, in_flight=10)], monkeypatch)
+    sup._autoscale()
+    assert added == []
+
+
+def test_queued_requests_scale_up_one_worker_at_a_time(monkeypatch):
+    sup, added = make_supervisor([ready_worker(1, in_flight=4, admission_queue_depth=5)], monkeypatch)
+    sup._autoscale()
+    assert len(added) == 1
+    # Nessun altro worker finché quello nuovo è in avvio
+    sup._autoscale()
+    assert len(added) == 1
+
+
+def test_idle_workers_are_retired_after_consecutive_checks(monkeypatch):
+    async def scenario():
+        sup, _ = make_supervisor([ready_worker(1), ready_worker(2, queue_depth=0)], monkeypatch)
+        retired = []
+
+        async def retire(worker):
+            retired.append(worker)
+
+        monkeypatch.setattr(sup, "_retire", retire)
+        for _ in range(3):
+            sup._autoscale()
+        await asyncio.sleep(0)
+        assert len(retired) == 1
+
+    asyncio.run(scenario())
+
+
+def test_restart_does_not_block_the_monitor(monkeypatch):
+    async def scenario():
+        sup, _ = make_supervisor([], monkeypatch)
+        worker = ready_worker(1, in_flight=1)
+        released = asyncio.Event()
+
+        async def slow_drain(worker, timeout=60):
+            await released.wait()
+
+        monkeypatch.setattr(sup, "_drain", slow_drain)
+        monkeypatch.setattr(worker, "alive", lambda: False)
+        monkeypatch.setattr(worker, "terminate", lambda: None)
+        monkeypatch.setattr(worker, "spawn", lambda: setattr(worker, "state", STARTING))
+
+        await asyncio.wait_for(sup._check_worker(worker), timeout=1)
+        assert worker.state == DRAINING
+        # Un secondo controllo non avvia un altro riavvio
+        await sup._check_worker(worker)
+        assert len(sup._restart_tasks) == 1
+
+        released.set()
+        await asyncio.gather(*sup._restart_tasks)
+        assert (worker.state, worker.restarts) == (STARTING, 1)
+
+    asyncio.run(scenario())
+
+
+def test_proxy_accepts_every_method():
+    route = next(r for r in supervisor_module.app.routes if getattr(r, "path", None) == "/{path:path}")
+    assert {"GET", "POST", "PUT", "PATCH", "DELETE"} <= route.methods
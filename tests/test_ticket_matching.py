@@ -0,0 +1,58 @@
+import pytest
+
+from ticket_matching import TicketIndex, match_tickets, normalize_date
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("12 giu 2026", (12, 6, 2026)),
+    ("12. Giu", (12, 6, None)),
+    ("12.06.26", (12, 6, 2026)),
+    ("3/7", (3, 7, None)),
+    ("ven 12 giugno 2026", (12, 6, 2026)),
+    ("mar 16\xa0giugno\xa02026", (16, 6, 2026)),
+    ("12 June 2026", (12, 6, 2026)),
+    ("12 dic 123", (12, 12, None)),
+    ("Abbonamento", None),
+    ("32 giu 2026", None),
+    ("", None),
+    (None, None),
+])
+def test_normalize_date(text, expected):
+    assert normalize_date(text) == expected
+
+
+TICKETS = [
+    {"day": "12 giu 2026", "location": "Tribuna", "price": "€ 85,00"},
+    {"day": "12 giu", "location": "Curva", "price": "€ 60,00"},
+    {"day": "12 giu 2027", "location": "Prato", "price": "€ 50,00"},
+    {"day": "13 giu 2026", "location": "Parterre", "price": "€ 70,00"},
+    {"day": "Abbonamento", "location": "Poltronissima", "price": "€ 1.250,00"},
+]
+
+
+def locations(tickets):
+    return [ticket["location"] for ticket in tickets]
+
+
+def test_match_uses_year_when_both_sides_have_it():
+    assert locations(match_tickets(TICKETS, "ven 12 giugno 2026")) == ["Tribuna", "Curva"]
+
+
+def test_match_without_user_year_ignores_year():
+    assert locations(match_tickets(TICKETS, "12/06")) == ["Tribuna", "Curva", "Prato"]
+
+
+def test_unrecognized_dates_match_verbatim():
+    assert locations(match_tickets(TICKETS, "Abbonamento")) == ["Poltronissima"]
+    assert match_tickets(TICKETS, "abbonamento") == []
+
+
+def test_no_match():
+    assert match_tickets(TICKETS, "14 giu 2026") == []
+    assert match_tickets([], "12 giu 2026") == []
+
+
+def test_index_answers_many_dates():
+    index = TicketIndex(TICKETS)
+    assert locations(index.match("13.06.2026")) == ["Parterre"]
+    assert locations(index.match("12 giu 2027")) == ["Curva", "Prato"]
@@ -0,0 +1,95 @@
+import re
+
+# Prefissi dei mesi (italiano e inglese) -> numero del mese
+MONTHS = {
+    "gen": 1, "jan": 1,
+    "feb": 2,
+    "mar": 3,
+    "apr": 4,
+    "mag": 5, "may": 5,
+    "giu": 6, "jun": 6,
+    "lug": 7, "jul": 7,
+    "ago": 8, "aug": 8,
+    "set": 9, "sep": 9,
+    "ott": 10, "oct": 10,
+    "nov": 11,
+    "dic": 12, "dec": 12,
+}
+
+_NUMERIC_DATE = re.compile(r'\b(\d{1,2})[./-](\d{1,2})(?:[./-](\d{4}|\d{2}))?\b')
+_TOKEN = re.compile(r'\d+|[^\W\d_]+')
+
+
+def _full_year(year):
+    year = int(year)
+    return year + 2000 if year < 100 else year
+
+
+def normalize_date(text):
+    """Converte una data in (giorno, mese, anno o None).
+
+    Gestisce i formati di fanSALE ("12 Giu 2025", "12. giu", "12.06.25") e
+    quelli di ticketone salvati alla creazione del tracker ("gio 12 giugno 2025").
+    Restituisce None se la data non è riconoscibile.
+    """
+    if not text:
+        return None
+    text = text.replace('\xa0', ' ').lower()
+
+    match = _NUMERIC_DATE.search(text)
+    if match:
+        day, month, year = int(match.group(1)), int(match.group(2)), match.group(3)
+        if 1 <= day <= 31 and 1 <= month <= 12:
+            return day, month, _full_year(year) if year else None
+
+    # Giorno (eventualmente preceduto dal giorno della settimana), mese, anno subito dopo il mese
+    tokens = _TOKEN.findall(text)
+    day = month = year = None
+    for index, token in enumerate(tokens):
+        if day is None:
+            if token.isdigit() and len(token) <= 2:
+                day = int(token)
+            continue
+        if token[:3] in MONTHS:
+            month = MONTHS[token[:3]]
+            following = tokens[index + 1] if index + 1 < len(tokens) else ""
+            if following.isdigit() and len(following) in (2, 4):
+                year = _full_year(following)
+        break
+    if day is None or month is None or not 1 <= day <= 31:
+        return None
+    return day, month, year
+
+
+class TicketIndex:
+    """Indice dei biglietti di una pagina per data normalizzata.
+
+    Si costruisce una volta per pagina e risponde in O(1) per ogni data
+    seguita dagli utenti. Se manca l'anno da una delle due parti, il match
+    avviene su giorno e mese.
+    """
+
+    def __init__(self, tickets):
+        self._by_day = {}
+        self._by_raw = {}
+        for ticket in tickets:
+            normalized = normalize_date(ticket.get('day'))
+            if normalized is None:
+                self._by_raw.setdefault(ticket.get('day'), []).append(ticket)
+            else:
+                day, month, year = normalized
+                self._by_day.setdefault((day, month), []).append((year, ticket))
+
+    def match(self, user_date):
+        normalized = normalize_date(user_date)
+        if normalized is None:
+            return list(self._by_raw.get(user_date, []))
+        day, month, year = normalized
+        return [
+            ticket for ticket_year, ticket in self._by_day.get((day, month), [])
+            if year is None or ticket_year is None or ticket_year == year
+        ]
+
+
+def match_tickets(tickets, user_date):
+    return TicketIndex(tickets).match(user_date)
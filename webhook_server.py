@@ -0,0 +1,54 @@
+import hmac
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Header, Request, Response
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Server webhook del bot: Telegram (o il load balancer davanti a più istanze)
+# invia gli update in POST; ogni istanza li accoda all'Application come farebbe
+# run_polling, senza dipendere dal server tornado di python-telegram-bot.
+
+
+def create_webhook_app(application, url_path, secret_token, stats):
+    """App FastAPI che riceve gli update su /<url_path> e li passa ad `application`.
+
+    Il ciclo di vita dell'Application (post_init, start, stop, post_shutdown)
+    segue quello del server, come in run_polling. `stats` fornisce lo stato
+    dell'istanza per /healthz.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            yield
+        finally:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    app = FastAPI(title="Telegram Bot Webhook", lifespan=lifespan)
+
+    @app.post(f"/{url_path}")
+    async def telegram_webhook(request: Request, x_telegram_bot_api_secret_token: str = Header(None)):
+        if secret_token and not hmac.compare_digest(x_telegram_bot_api_secret_token or "", secret_token):
+            raise HTTPException(status_code=403, detail="Secret token non valido")
+        update = Update.de_json(await request.json(), application.bot)
+        # La risposta non attende la gestione dell'update: Telegram non lo reinvia
+        await application.update_queue.put(update)
+        return Response(status_code=200)
+
+    @app.get("/healthz")
+    async def healthz():
+        return {"status": "ok", **stats()}
+
+    return app
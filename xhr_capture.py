@@ -0,0 +1,94 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from urllib.parse import unquote_plus
+
+logger = logging.getLogger(__name__)
+
+# Intercettazione delle risposte JSON che le pagine di fanSALE e ticketone
+# scaricano via XHR (autocomplete, elenco eventi): i dati arrivano appena la
+# risposta è disponibile, senza attendere il rendering del DOM.
+
+
+def response_matcher(pattern, query=None):
+    """Riconosce le risposte il cui URL contiene `pattern` e, se indicato, il testo cercato.
+
+    Il testo completo serve a scartare le risposte dell'autocomplete relative
+    alle lettere digitate fino a quel momento.
+    """
+    pattern = pattern.lower()
+    query = query.strip().lower() if query else None
+
+    def match(response):
+        url = unquote_plus(response.url).lower()
+        if pattern not in url:
+            return False
+        if query is None or query in url:
+            return True
+        try:
+            post_data = response.request.post_data or ""
+        except Exception:
+            return False
+        return query in unquote_plus(post_data).lower()
+
+    return match
+
+
+class JsonResponseCapture:
+    """Prima risposta JSON della pagina che soddisfa `match`."""
+
+    def __init__(self, match):
+        self.match = match
+        self._result = asyncio.get_running_loop().create_future()
+
+    async def on_response(self, response):
+        if self._result.done() or not self.match(response):
+            return
+        if "json" not in (response.headers.get("content-type") or ""):
+            return
+        try:
+            payload = await response.json()
+        except Exception as e:
+            logger.debug(f"Risposta {response.url} non leggibile come JSON: {e}")
+            return
+        if not self._result.done():
+            self._result.set_result(payload)
+
+    async def wait(self, timeout):
+        """Restituisce il payload JSON, o None se entro `timeout` secondi non arriva."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._result), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+@contextmanager
+def capture_json(page, match):
+    # Il listener va rimosso: le pagine del pool vengono riutilizzate
+    capture = JsonResponseCapture(match)
+    page.on("response", capture.on_response)
+    try:
+        yield capture
+    finally:
+        page.remove_listener("response", capture.on_response)
+
+
+async def wait_json_or_selector(capture, page, selector, timeout):
+    """Attende la risposta JSON o la comparsa di `selector`, quella che arriva prima.
+
+    Restituisce il payload JSON, oppure None se la pagina mostra prima gli
+    elementi (ad esempio perché sono già nell'HTML). timeout in millisecondi,
+    come in Playwright.
+    """
+    json_task = asyncio.ensure_future(capture.wait(timeout / 1000))
+    dom_task = asyncio.ensure_future(page.wait_for_selector(selector, timeout=timeout))
+    try:
+        done, _ = await asyncio.wait({json_task, dom_task}, return_when=asyncio.FIRST_COMPLETED)
+        if json_task in done and json_task.result() is not None:
+            return json_task.result()
+        await dom_task
+        return None
+    finally:
+        for task in (json_task, dom_task):
+            task.cancel()
+        await asyncio.gather(json_task, dom_task, return_exceptions=True)